@@ -1,7 +1,9 @@
 from flask import Flask, send_from_directory, request, jsonify, make_response
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
+from helper.jwt_cache import CachingJWTManager
 from flask_mail import Mail
+from helper.email_outbox import email_outbox
+from helper.password_hasher import password_hasher
 from datetime import timedelta
 import os
 import logging
@@ -13,6 +15,7 @@ from routes.register import register
 from routes.settings import settings
 from routes.patients import patients_bp
 from routes.onboarding import onboarding_bp
+from routes.metrics import metrics_bp
 from google_auth import google_auth
 from functools import wraps
 # Configurar logging
@@ -37,18 +40,19 @@ cors_config = {
     "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "X-CSRF-TOKEN"],
     "supports_credentials": True,  # Importante para permitir cookies y autenticación
-    "expose_headers": ["Content-Type", "X-CSRFToken"],
+    "expose_headers": ["Content-Type", "X-CSRFToken", "Retry-After", "RateLimit-Limit",
+                       "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy"],
     "vary_header": True
 }
 # Aplicar CORS a toda la aplicación
 CORS(app, resources={r"/*": cors_config})
 
 # Importar y configurar nuestro propio rate limiter
-from helper.Middleware.rate_limiter import setup_global_rate_limit
+from helper.Middleware.rate_limit_policy import setup_rate_limit_policies, rate_limit_engine
 from helper.Middleware.csrf_protection import setup_csrf_protection
 
-# Configurar el rate limiter
-setup_global_rate_limit(app)
+# Configurar el rate limiter (políticas de config.RATE_LIMIT y de @rate_limit)
+setup_rate_limit_policies(app)
 
 # FIX: Configurar protección CSRF
 setup_csrf_protection(app)
@@ -114,21 +118,20 @@ app.config['JWT_HEADER_NAME'] = "Authorization"  # Nombre estándar para header
 # Usar 'sub' como claim de identidad para ser compatible con OAuth 2.0
 app.config['JWT_IDENTITY_CLAIM'] = 'sub'
 
-jwt = JWTManager(app)
+jwt = CachingJWTManager(app)
 
 # Callback para verificar tokens contra la denylist
-from helper.token_manager import token_manager
+from helper.Middleware.jwt_manager import resolve_session
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
     """
     Verifica si un token ha sido revocado (está en la denylist)
+
+    El resultado se memoriza en la solicitud y lo reutilizan user_lookup_callback
+    y jwt_required_custom, sin volver a consultar al token_manager.
     """
-    # Obtener session_id del payload
-    session_id = jwt_payload.get("session_id")
-    
-    # Verificar si el session_id está en la denylist
-    return token_manager.is_denied(session_id)
+    return resolve_session(jwt_payload).denied
 
 @jwt.user_identity_loader
 def user_identity_lookup(identity):
@@ -151,8 +154,6 @@ def user_lookup_callback(_jwt_header, jwt_payload):
     user_id = jwt_payload.get("sub")
     session_id = jwt_payload.get("session_id")
     
-    print(f"Validando usuario: {user_id} con sesión: {session_id}")
-    
     # Validaciones básicas
     if not user_id:
         print(f"Error: Token sin user_id (sub)")
@@ -162,40 +163,32 @@ def user_lookup_callback(_jwt_header, jwt_payload):
         print(f"Error: Token sin session_id para usuario {user_id}")
         return None
     
-    try:
-        # Asegurar que ambos valores sean strings
-        user_id_str = str(user_id)
-        session_id_str = str(session_id)
-        
-        # Verificar sesión aquí
-        if not token_manager.validate_session(user_id_str, session_id_str):
-            # Si la sesión no es válida, devolver None para causar error de autenticación
-            print(f"Error: Sesión {session_id} inválida para usuario {user_id}")
-            return None
-        
-        print(f"Sesión {session_id} validada para usuario {user_id}")
-        
-        # Recuperar más datos del usuario si es necesario
-        # En este caso devolvemos un objeto con ID y session_id mínimo
-        return {
-            "id": user_id_str, 
-            "session_id": session_id_str,
-            # Puedes agregar más datos del usuario aquí si los necesitas
-        }
-    except Exception as e:
-        print(f"Error al validar usuario: {str(e)}")
+    # Sesión ya resuelta en esta solicitud (o se resuelve ahora, una sola vez)
+    status = resolve_session(jwt_payload)
+    if not status.valid:
+        # Si la sesión no es válida, devolver None para causar error de autenticación
+        print(f"Error: Sesión {session_id} inválida para usuario {user_id}")
         return None
+    
+    # Objeto mínimo con ID y session_id
+    return status.user
 
 # Configuración de Flask-Mail
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', '587'))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
 app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_USERNAME')
 
 mail = Mail(app)
 
+# Envío de correos en segundo plano con conexión SMTP persistente
+email_outbox.init_app(app)
+
+# Calibrar el coste del hash de contraseñas antes de atender solicitudes
+password_hasher.init_app(app)
+
 # Configurar directorio de archivos estáticos
 client_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'dist', 'public')
 client_public_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'client', 'public')
@@ -225,6 +218,7 @@ app.register_blueprint(register, url_prefix='/api/register')
 app.register_blueprint(settings, url_prefix='/api')
 app.register_blueprint(patients_bp, url_prefix='/api')
 app.register_blueprint(onboarding_bp, url_prefix='/api')
+app.register_blueprint(metrics_bp, url_prefix='/api')
 app.register_blueprint(google_auth)
 
 @app.route('/', defaults={'path': ''})
@@ -290,6 +284,9 @@ def test_api():
         "message": "API Flask funcionando correctamente"
     })
 
+# Compilar las políticas de rate limiting con todas las rutas ya registradas
+rate_limit_engine.compile(app)
+
 if __name__ == '__main__':
     print(f"Iniciando servidor Flask en http://0.0.0.0:5000")
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
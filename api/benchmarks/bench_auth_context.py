@@ -0,0 +1,153 @@
+# Benchmark del coste de autenticación por solicitud
+#
+# Uso: python benchmarks/bench_auth_context.py [solicitudes] (desde el directorio api)
+#
+# Monta dos apps Flask mínimas con un endpoint equivalente a /api/auth/validate:
+# una con los loaders y el decorador anteriores (cada uno consulta al
+# token_manager y has_jwt vuelve a decodificar el token) y otra con el contexto
+# de autenticación memorizado por solicitud. Mide µs por solicitud y cuántas
+# consultas a la denylist y a la tabla de sesiones hace cada una.
+import contextlib
+import io
+import os
+import sys
+import time
+import logging
+from functools import wraps
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt, verify_jwt_in_request
+
+from helper.token_manager import token_manager
+from helper.Middleware.jwt_manager import get_auth_context, jwt_required_custom, resolve_session
+
+logging.getLogger("token_manager").setLevel(logging.WARNING)
+
+calls = {"denylist": 0, "sessions": 0}
+
+
+def count_store_calls():
+    store = token_manager.store
+    is_denied = store.is_denied
+    get_session_expiry = store.get_session_expiry
+
+    def counted_is_denied(*args):
+        calls["denylist"] += 1
+        return is_denied(*args)
+
+    def counted_get_session_expiry(*args):
+        calls["sessions"] += 1
+        return get_session_expiry(*args)
+
+    store.is_denied = counted_is_denied
+    store.get_session_expiry = counted_get_session_expiry
+
+
+def base_app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'benchmark-secret-key-with-enough-length!'
+    app.config['JWT_TOKEN_LOCATION'] = ['cookies', 'headers']
+    return app, JWTManager(app)
+
+
+def legacy_app():
+    """Ruta de autenticación anterior: cada capa consulta al token_manager"""
+    app, jwt = base_app()
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return token_manager.is_denied(jwt_payload.get("session_id"))
+
+    @jwt.user_lookup_loader
+    def user_lookup_callback(_jwt_header, jwt_payload):
+        user_id = str(jwt_payload.get("sub"))
+        session_id = str(jwt_payload.get("session_id"))
+        if not token_manager.validate_session(user_id, session_id):
+            return None
+        return {"id": user_id, "session_id": session_id}
+
+    def legacy_required(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            verify_jwt_in_request(optional=True, locations=['headers', 'cookies'])
+            jwt_data = get_jwt()
+            session_id = jwt_data.get('session_id', '')
+            if session_id and token_manager.is_denied(session_id):
+                return jsonify({"msg": "La sesión ha sido revocada"}), 401
+            if not token_manager.validate_session(str(jwt_data.get('sub')), session_id):
+                return jsonify({"msg": "Sesión inválida o expirada"}), 401
+            return fn(*args, **kwargs)
+        return decorator
+
+    def has_jwt():
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt() is not None
+        except Exception:
+            return False
+
+    @app.route('/validate')
+    @legacy_required
+    def validate():
+        jwt_data = get_jwt() if has_jwt() else None
+        valid = token_manager.validate_session(str(jwt_data.get('sub')), jwt_data.get('session_id'))
+        return jsonify({"valid": valid})
+
+    return app
+
+
+def context_app():
+    """Ruta actual: un contexto de autenticación por solicitud"""
+    app, jwt = base_app()
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return resolve_session(jwt_payload).denied
+
+    @jwt.user_lookup_loader
+    def user_lookup_callback(_jwt_header, jwt_payload):
+        return resolve_session(jwt_payload).user
+
+    @app.route('/validate')
+    @jwt_required_custom(optional=True)
+    def validate():
+        return jsonify({"valid": get_auth_context().session_valid})
+
+    return app
+
+
+def run(app, requests):
+    with app.app_context():
+        session_id = token_manager.register_session('42')
+        token = create_access_token(identity='42', additional_claims={'session_id': session_id})
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    # Calentamiento
+    for _ in range(50):
+        client.get('/validate', headers=headers)
+
+    calls["denylist"] = calls["sessions"] = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(requests):
+            response = client.get('/validate', headers=headers)
+    elapsed = time.perf_counter() - start
+    assert response.get_json()["valid"], response.get_json()
+    return elapsed / requests * 1e6, calls["denylist"] / requests, calls["sessions"] / requests
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    count_store_calls()
+    print(f"{requests} solicitudes a /validate con token válido")
+    for name, factory in (("anterior", legacy_app), ("contexto", context_app)):
+        per_request, denylist, sessions = run(factory(), requests)
+        print(f"{name:>9}: {per_request:8.1f} µs/solicitud, "
+              f"{denylist:.0f} consultas a denylist, {sessions:.0f} a sesiones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Prueba de concurrencia de la revocación masiva de sesiones
+#
+# Uso: python benchmarks/bench_bulk_revocation.py [segundos] (desde el directorio api)
+#
+# Varios hilos validan y registran sesiones mientras otros revocan en bloque
+# listas aleatorias de usuarios. Comprueba que ninguna operación se queda
+# bloqueada (sin deadlock entre particiones) y que ninguna sesión revocada
+# vuelve a validar.
+import os
+import random
+import sys
+import threading
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from helper.token_manager import TokenManager
+
+logging.getLogger("token_manager").setLevel(logging.WARNING)
+
+USERS = 500
+VALIDATORS = 8
+REVOKERS = 4
+USERS_PER_REVOCATION = 50
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    manager = TokenManager(stripes=16)
+    sessions = {str(user): [manager.register_session(str(user))] for user in range(USERS)}
+    sessions_lock = threading.Lock()
+    counts = {"validations": 0, "revocations": 0, "revoked_sessions": 0}
+    stop = threading.Event()
+    errors = []
+
+    def validator(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            user_id = str(rng.randrange(USERS))
+            with sessions_lock:
+                session_id = rng.choice(sessions[user_id]) if sessions[user_id] else None
+            if session_id:
+                manager.validate_session(user_id, session_id)
+            if rng.random() < 0.05:
+                new_session = manager.register_session(user_id)
+                with sessions_lock:
+                    sessions[user_id].append(new_session)
+            counts["validations"] += 1
+
+    def revoker(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            user_ids = rng.sample(range(USERS), USERS_PER_REVOCATION)
+            result = manager.revoke_users_sessions([str(u) for u in user_ids])
+            for user_id in result:
+                with sessions_lock:
+                    sessions[user_id] = []
+            counts["revocations"] += 1
+            counts["revoked_sessions"] += sum(result.values())
+
+    threads = [threading.Thread(target=validator, args=(i,), daemon=True) for i in range(VALIDATORS)]
+    threads += [threading.Thread(target=revoker, args=(100 + i,), daemon=True) for i in range(REVOKERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+
+    for thread in threads:
+        thread.join(timeout=10)
+        if thread.is_alive():
+            errors.append("un hilo no terminó en 10 s (posible deadlock)")
+
+    # Todas las sesiones revocadas deben estar en la denylist y no validar
+    for event in manager.get_activity(limit=10000):
+        if event["action"] != "session_invalidated":
+            continue
+        if manager.validate_session(event["user_id"], event["session_id"]):
+            errors.append(f"la sesión revocada {event['session_id']} sigue siendo válida")
+
+    print(f"{duration:.0f} s: {counts['validations']:,} validaciones, {counts['revocations']:,} revocaciones "
+          f"masivas ({counts['revoked_sessions']:,} sesiones)")
+    if errors:
+        print("ERRORES:")
+        for error in errors[:10]:
+            print(f"  {error}")
+        sys.exit(1)
+    print("OK: sin bloqueos y sin sesiones revocadas válidas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# Benchmark de la bandeja de salida de correo contra un servidor SMTP local
+#
+# Uso: python benchmarks/bench_email_outbox.py [mensajes] [latencia_conexion_ms] (desde el directorio api)
+#
+# Levanta un servidor SMTP mínimo en 127.0.0.1 que simula el coste de abrir una
+# conexión (TCP + TLS + login contra smtp.gmail.com) y de cada mensaje, y compara:
+# 1. Latencia en la solicitud: enviar en línea con una conexión nueva por correo
+#    (como Flask-Mail) frente a encolar en EmailOutbox.
+# 2. Entrega de la cola: tiempo hasta vaciarla y conexiones abiertas.
+# 3. Reintentos: el servidor responde 451 al primer intento de algunos correos.
+# Sale con código 1 si no se entregan todos los mensajes exactamente una vez.
+import logging
+import os
+import smtplib
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from email.header import decode_header, make_header
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from helper.email_outbox import EmailOutbox
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Servidor SMTP mínimo que acepta todo y cuenta conexiones y mensajes"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay, message_delay, fail_every=0):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.fail_every = fail_every
+        self.connections = 0
+        self.subjects = []
+        self.rejected = set()
+        self.lock = threading.Lock()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        time.sleep(server.connect_delay)
+        self.reply('220 localhost ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 Fin con <CRLF>.<CRLF>')
+                subject = ''
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b'.\r\n', b''):
+                        break
+                    if data.lower().startswith(b'subject:'):
+                        subject = str(make_header(decode_header(data[8:].decode().strip())))
+                time.sleep(server.message_delay)
+                with server.lock:
+                    number = int(subject.rsplit(' ', 1)[-1]) if subject else 0
+                    fail = (server.fail_every and number % server.fail_every == 0
+                            and subject not in server.rejected)
+                    if fail:
+                        server.rejected.add(subject)
+                    else:
+                        server.subjects.append(subject)
+                self.reply('451 Inténtelo más tarde' if fail else '250 Aceptado')
+            elif command == 'QUIT':
+                self.reply('221 Adiós')
+                return
+            else:
+                self.reply('502 No implementado')
+
+
+def start_server(connect_delay, message_delay, fail_every=0):
+    server = SMTPStandIn(connect_delay, message_delay, fail_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def message(number):
+    msg = EmailMessage()
+    msg['Subject'] = f"Recuperación {number}"
+    msg['From'] = 'no-reply@cronapp.local'
+    msg['To'] = 'paciente@example.com'
+    msg.set_content("Enlace de recuperación")
+    return msg
+
+
+def inline_send(port, count):
+    """Una conexión nueva por correo, dentro de la solicitud"""
+    latencies = []
+    for number in range(count):
+        start = time.perf_counter()
+        with smtplib.SMTP('127.0.0.1', port) as smtp:
+            smtp.send_message(message(number))
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def make_outbox(directory, port, name, retry_base=5.0):
+    outbox = EmailOutbox(os.path.join(directory, name), batch_size=20, poll_interval=0.05, retry_base=retry_base)
+    outbox.init_app(types.SimpleNamespace(config={
+        'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': port, 'MAIL_DEFAULT_SENDER': 'no-reply@cronapp.local'
+    }))
+    return outbox
+
+
+def wait_delivered(outbox, count, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        metrics = outbox.metrics()
+        if metrics["sent"] + metrics["failed"] >= count:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def percentiles(latencies):
+    return (f"p50 {statistics.median(latencies) * 1e3:7.2f} ms   "
+            f"p95 {sorted(latencies)[int(len(latencies) * 0.95)] * 1e3:7.2f} ms")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    connect_delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 150) / 1000
+    message_delay = 0.005
+    ok = True
+    # Los reintentos provocados se registran como advertencias
+    logging.getLogger("email_outbox").setLevel(logging.ERROR)
+
+    print(f"{count} correos; servidor SMTP local con {connect_delay * 1e3:.0f} ms por conexión "
+          f"y {message_delay * 1e3:.0f} ms por mensaje")
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(connect_delay, message_delay)
+        latencies = inline_send(server.server_address[1], count)
+        print(f"  envío en la solicitud   {percentiles(latencies)}   conexiones {server.connections}")
+
+        server = start_server(connect_delay, message_delay)
+        outbox = make_outbox(directory, server.server_address[1], 'outbox.db')
+        latencies = []
+        start = time.perf_counter()
+        for number in range(count):
+            begin = time.perf_counter()
+            outbox.enqueue(f"Recuperación {number}", ['paciente@example.com'], "Enlace de recuperación")
+            latencies.append(time.perf_counter() - begin)
+        delivered = wait_delivered(outbox, count)
+        elapsed = time.perf_counter() - start
+        metrics = outbox.metrics()
+        print(f"  encolar en la solicitud {percentiles(latencies)}")
+        print(f"  entrega de la cola: {elapsed:.2f} s ({count / elapsed:.0f} correos/s), conexiones "
+              f"{server.connections}, latencia hasta entrega p50 {metrics['latency_p50_ms']:.0f} ms "
+              f"p95 {metrics['latency_p95_ms']:.0f} ms")
+        if not delivered or sorted(server.subjects) != sorted(f"Recuperación {n}" for n in range(count)):
+            print("ERROR: la cola no entregó cada correo exactamente una vez")
+            ok = False
+
+        # Reintentos: uno de cada cinco correos recibe 451 en el primer intento
+        server = start_server(0.0, 0.0, fail_every=5)
+        outbox = make_outbox(directory, server.server_address[1], 'retry.db', retry_base=0.1)
+        for number in range(count):
+            outbox.enqueue(f"Recuperación {number}", ['paciente@example.com'], "Enlace de recuperación")
+        delivered = wait_delivered(outbox, count)
+        metrics = outbox.metrics()
+        print(f"  con errores temporales: enviados {metrics['sent']}, reintentos {metrics['retries']}, "
+              f"fallidos {metrics['failed']}, pendientes {metrics['pending']}")
+        if not delivered or metrics['sent'] != count or len(set(server.subjects)) != count:
+            print("ERROR: los reintentos no entregaron todos los correos")
+            ok = False
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
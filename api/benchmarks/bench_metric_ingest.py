@@ -0,0 +1,94 @@
+# Benchmark de throughput de la ingesta de métricas por lotes
+#
+# Uso: python benchmarks/bench_metric_ingest.py (desde el directorio api)
+#
+# Mide lecturas por segundo de validación + buffer + vaciado usando un destino
+# simulado con un costo fijo por commit, y lo compara con escribir lectura a lectura.
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from helper.metric_ingest import MetricWriteBuffer, validate_readings
+from helper.latest_values import LatestValueTable
+from helper.timeseries import TimeSeriesStore
+
+# Costo simulado de un commit en la base de datos (segundos)
+COMMIT_COST = 0.002
+TOTAL_READINGS = 200000
+PATIENTS = 500
+KEYS = ['glucose', 'systolic', 'diastolic', 'peak_flow']
+
+
+class SimulatedSink:
+    """Destino que simula el costo de un commit por llamada a write"""
+
+    def __init__(self):
+        self.rows = 0
+        self.commits = 0
+
+    def write(self, readings):
+        time.sleep(COMMIT_COST)
+        self.rows += len(readings)
+        self.commits += 1
+
+
+def build_payload(count):
+    now = time.time()
+    return [
+        {
+            "patientId": random.randint(1, PATIENTS),
+            "key": random.choice(KEYS),
+            "value": round(random.uniform(60, 200), 1),
+            "timestamp": now - count + i
+        }
+        for i in range(count)
+    ]
+
+
+def bench_batched(payload, request_size):
+    sink = SimulatedSink()
+    buffer = MetricWriteBuffer(sink=sink, batch_size=500, flush_interval=0.05, store=TimeSeriesStore(),
+                               latest=LatestValueTable())
+    patient_ids = set(range(1, PATIENTS + 1))
+
+    start = time.perf_counter()
+    for offset in range(0, len(payload), request_size):
+        valid, _ = validate_readings(payload[offset:offset + request_size], patient_ids)
+        buffer.add(valid)
+    buffer.flush()
+    elapsed = time.perf_counter() - start
+
+    return len(payload) / elapsed, sink.commits
+
+
+def bench_per_reading(payload):
+    sink = SimulatedSink()
+    patient_ids = set(range(1, PATIENTS + 1))
+
+    start = time.perf_counter()
+    for item in payload:
+        valid, _ = validate_readings([item], patient_ids)
+        sink.write(valid)
+    elapsed = time.perf_counter() - start
+
+    return len(payload) / elapsed, sink.commits
+
+
+def main():
+    payload = build_payload(TOTAL_READINGS)
+
+    # Lectura a lectura sólo sobre una muestra: es demasiado lento para el total
+    sample = payload[:2000]
+    rate, commits = bench_per_reading(sample)
+    print(f"Lectura a lectura:          {rate:>12,.0f} lecturas/s ({commits} commits para {len(sample)} lecturas)")
+
+    for request_size in (50, 500, 5000):
+        rate, commits = bench_batched(payload, request_size)
+        print(f"Lotes de {request_size:>5} por solicitud: {rate:>12,.0f} lecturas/s ({commits} commits para {len(payload)} lecturas)")
+
+
+if __name__ == "__main__":
+    main()
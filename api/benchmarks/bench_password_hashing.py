@@ -0,0 +1,125 @@
+# Benchmark del hash de contraseñas con y sin pool de procesos
+#
+# Uso: python benchmarks/bench_password_hashing.py [logins_concurrentes] [procesos] (desde el directorio api)
+#
+# N hilos simulan logins concurrentes (check_password_hash) mientras otro hilo
+# mide la latencia de una solicitud ligera que comparte el worker. Se compara el
+# hash en el hilo de la solicitud con PasswordHasher, y al final se satura un
+# pool pequeño para medir cuánto tarda en responder el rechazo (503).
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from helper.password_hasher import PasswordHasher, PasswordHashPoolSaturated
+
+PASSWORD = "Contraseña-de-prueba-123!"
+PROBE_PAYLOAD = {"id": 1, "nombre": "Ana", "metricas": list(range(200))}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def light_request():
+    # Trabajo típico de un endpoint ligero: serializar una respuesta pequeña
+    json.dumps(PROBE_PAYLOAD)
+
+
+def run(check, pwhash, concurrent, logins_per_thread):
+    login_latencies = []
+    probe_latencies = []
+    rejected = [0]
+    done = threading.Event()
+
+    def login_thread():
+        for _ in range(logins_per_thread):
+            start = time.perf_counter()
+            try:
+                check(pwhash, PASSWORD)
+            except PasswordHashPoolSaturated:
+                rejected[0] += 1
+            login_latencies.append(time.perf_counter() - start)
+
+    def probe_thread():
+        while not done.is_set():
+            start = time.perf_counter()
+            light_request()
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    probe = threading.Thread(target=probe_thread)
+    probe.start()
+    threads = [threading.Thread(target=login_thread) for _ in range(concurrent)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    probe.join()
+    return login_latencies, probe_latencies, elapsed, rejected[0]
+
+
+def report(label, login_latencies, probe_latencies, elapsed, rejected):
+    print(f"  {label}")
+    print(f"    login     p50 {statistics.median(login_latencies) * 1e3:7.1f} ms   "
+          f"p95 {percentile(login_latencies, 0.95) * 1e3:7.1f} ms   "
+          f"{len(login_latencies) / elapsed:6.1f} logins/s   rechazados {rejected}")
+    print(f"    ligera    p50 {statistics.median(probe_latencies) * 1e3:7.2f} ms   "
+          f"p95 {percentile(probe_latencies, 0.95) * 1e3:7.2f} ms   "
+          f"máx {max(probe_latencies) * 1e3:7.2f} ms")
+
+
+def main():
+    concurrent = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    logins_per_thread = 5
+
+    pwhash = generate_password_hash(PASSWORD)
+    start = time.perf_counter()
+    check_password_hash(pwhash, PASSWORD)
+    print(f"Hash {pwhash.split('$', 1)[0]}: {(time.perf_counter() - start) * 1e3:.1f} ms por verificación, "
+          f"{os.cpu_count()} CPU")
+    print(f"{concurrent} logins concurrentes x {logins_per_thread}")
+
+    report("en el hilo de la solicitud", *run(check_password_hash, pwhash, concurrent, logins_per_thread))
+
+    hasher = PasswordHasher(workers=workers, max_pending=concurrent * 2, timeout=60)
+    hasher.check(pwhash, PASSWORD)  # Arrancar los procesos fuera de la medida
+    report(f"pool de {workers} procesos", *run(hasher.check, pwhash, concurrent, logins_per_thread))
+    hasher.shutdown()
+
+    # Saturación: cola de 2 operaciones frente a la ráfaga completa
+    small = PasswordHasher(workers=1, max_pending=2, timeout=60)
+    small.check(pwhash, PASSWORD)
+    rejections = []
+    original = small._run
+
+    def timed(function, *args):
+        start = time.perf_counter()
+        try:
+            return original(function, *args)
+        except PasswordHashPoolSaturated:
+            rejections.append(time.perf_counter() - start)
+            raise
+
+    small._run = timed
+    report("pool de 1 proceso con 2 operaciones como máximo",
+           *run(small.check, pwhash, concurrent, logins_per_thread))
+    if rejections:
+        print(f"    rechazo (503) en p50 {statistics.median(rejections) * 1e6:.1f} µs, "
+              f"máx {max(rejections) * 1e6:.1f} µs")
+    small.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Benchmark del rate limiting compartido entre workers
+#
+# Uso: python benchmarks/bench_rate_limit_shared.py [workers] (desde el directorio api)
+#
+# 1. Coste por decisión de GCRALimiter (memoria del proceso) frente a
+#    SharedGCRALimiter (tabla mapeada con locks fcntl).
+# 2. Corrección entre procesos: N workers intentan 20 logins cada uno contra un
+#    límite de 5 por minuto. Con estado por proceso pasan 5·N; con la tabla
+#    compartida deben pasar exactamente 5. Sale con código 1 si no es así.
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from helper.Middleware.rate_limiter import GCRALimiter, SharedGCRALimiter
+from helper.rate_limit_table import SharedRateTable
+
+ATTEMPTS = 20
+LOGIN_LIMIT = 5
+
+
+def decision_cost(limiter, checks):
+    keys = [f"10.0.{i >> 8 & 255}.{i & 255}" for i in range(4096)]
+    start = time.perf_counter()
+    for i in range(checks):
+        limiter.hit(keys[i & 4095])
+    return (time.perf_counter() - start) / checks * 1e6
+
+
+def worker(path, start_at, results):
+    # Cada worker abre y mapea la tabla por su cuenta, como tras un fork de gunicorn
+    table = SharedRateTable(path, slots=4096, stripes=16)
+    limiter = SharedGCRALimiter(LOGIN_LIMIT, 60, table, "routes.auth.login")
+    while time.time() < start_at:
+        pass
+    allowed = sum(1 for _ in range(ATTEMPTS) if limiter.hit("/api/auth/login|198.51.100.23")[0])
+    results.put(allowed)
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    checks = 200_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        table = SharedRateTable(os.path.join(directory, 'cost.table'), slots=1 << 16, stripes=64)
+
+        print(f"Coste por decisión ({checks:,} decisiones sobre 4096 claves)")
+        print(f"  {'memoria del proceso':>22}: {decision_cost(GCRALimiter(100, 60), checks):5.2f} µs")
+        shared = SharedGCRALimiter(100, 60, table, "global")
+        print(f"  {'tabla compartida':>22}: {decision_cost(shared, checks):5.2f} µs")
+
+        path = os.path.join(directory, 'rate_limit.table')
+        results = multiprocessing.Queue()
+        start_at = time.time() + 0.5
+        processes = [multiprocessing.Process(target=worker, args=(path, start_at, results)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        allowed = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    total = sum(allowed)
+    print(f"{workers} workers x {ATTEMPTS} intentos, límite {LOGIN_LIMIT}/min: "
+          f"permitidos {total} (por worker: {allowed}; con estado por proceso serían {LOGIN_LIMIT * workers})")
+    if total != LOGIN_LIMIT:
+        print("ERROR: el límite no se aplicó entre procesos")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
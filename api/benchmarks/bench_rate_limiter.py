@@ -0,0 +1,87 @@
+# Benchmark del limitador de tasa
+#
+# Uso: python benchmarks/bench_rate_limiter.py [claves] (desde el directorio api)
+#
+# Compara el limitador anterior (lista de timestamps por IP, reconstruida en cada
+# solicitud bajo un lock global) con GCRALimiter (un float por clave):
+#   - µs por comprobación con una IP que mantiene 100 solicitudes en la ventana
+#   - memoria asignada con 1M de claves distintas (una solicitud cada una)
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from helper.Middleware.rate_limiter import GCRALimiter
+
+MAX_REQUESTS = 100
+PER_SECONDS = 60
+
+
+class LegacyLimiter:
+    """Algoritmo anterior de rate_limit / global_rate_limit"""
+
+    def __init__(self, max_requests, per_seconds):
+        self.max_requests = max_requests
+        self.per_seconds = per_seconds
+        self.store = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def hit(self, key, now):
+        with self.lock:
+            self.store[key].append(now)
+            self.store[key] = [ts for ts in self.store[key] if now - ts < self.per_seconds]
+            return len(self.store[key]) <= self.max_requests
+
+
+def check_cost(limiter, checks):
+    # La IP llena su ventana (100 solicitudes en 60 s) y sigue al ritmo límite
+    interval = PER_SECONDS / MAX_REQUESTS
+    now = 1_000_000.0
+    for _ in range(MAX_REQUESTS):
+        limiter.hit('203.0.113.7', now)
+        now += 0.001
+    start = time.perf_counter()
+    for _ in range(checks):
+        now += interval
+        limiter.hit('203.0.113.7', now)
+    return (time.perf_counter() - start) / checks * 1e6
+
+
+def memory(factory, keys):
+    ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(keys)]
+    tracemalloc.start()
+    limiter = factory()
+    start = time.perf_counter()
+    now = time.time()
+    for ip in ips:
+        limiter.hit(ip, now)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, elapsed
+
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    checks = 100_000
+    factories = (
+        ("lista de timestamps", lambda: LegacyLimiter(MAX_REQUESTS, PER_SECONDS)),
+        ("GCRA", lambda: GCRALimiter(MAX_REQUESTS, PER_SECONDS)),
+    )
+
+    print(f"Comprobación con {MAX_REQUESTS} solicitudes en la ventana ({checks:,} comprobaciones)")
+    for name, factory in factories:
+        print(f"  {name:>20}: {check_cost(factory(), checks):6.2f} µs")
+
+    print(f"Memoria con {keys:,} claves distintas (sin contar los strings de las IPs)")
+    for name, factory in factories:
+        used, elapsed = memory(factory, keys)
+        print(f"  {name:>20}: {used / 2**20:7.1f} MiB ({used / keys:5.1f} B/clave, {elapsed:5.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
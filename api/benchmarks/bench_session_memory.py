@@ -0,0 +1,82 @@
+# Benchmark de memoria de la tabla de sesiones
+#
+# Uso: python benchmarks/bench_session_memory.py [sesiones] (desde el directorio api)
+#
+# Registra 1M de sesiones (4 por usuario) con el formato anterior
+# (dict[user_id][session_id] = datetime) y con MemorySessionStore, y compara la
+# memoria asignada con tracemalloc y el tiempo de validación.
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from helper.session_store import MemorySessionStore
+
+SESSIONS_PER_USER = 4
+
+
+def build_ids(total):
+    users = total // SESSIONS_PER_USER
+    return [(str(i % users), str(uuid.uuid4())) for i in range(total)]
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    table = build()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return table, current, elapsed
+
+
+def build_legacy(ids):
+    expires_at = datetime.now() + timedelta(days=7)
+    sessions = {}
+    for user_id, session_id in ids:
+        # Copia del identificador: en producción cada sesión llega como un string nuevo
+        sessions.setdefault(user_id, {})[''.join(session_id)] = expires_at + timedelta(seconds=len(sessions))
+    return sessions
+
+
+def build_compact(ids):
+    expires_at = time.time() + 7 * 86400
+    store = MemorySessionStore(64, max_sessions_per_user=SESSIONS_PER_USER)
+    for user_id, session_id in ids:
+        store.add_session(user_id, session_id, expires_at)
+    return store
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    ids = build_ids(total)
+    print(f"{total:,} sesiones, {SESSIONS_PER_USER} por usuario")
+
+    legacy, legacy_bytes, legacy_time = measure(lambda: build_legacy(ids))
+    print(f"dict[str][str] = datetime: {legacy_bytes / 2**20:8.1f} MiB "
+          f"({legacy_bytes / total:6.1f} B/sesión, {legacy_time:5.2f} s)")
+
+    compact, compact_bytes, compact_time = measure(lambda: build_compact(ids))
+    print(f"MemorySessionStore:        {compact_bytes / 2**20:8.1f} MiB "
+          f"({compact_bytes / total:6.1f} B/sesión, {compact_time:5.2f} s)")
+    print(f"Sesiones en la tabla compacta: {compact.count_sessions():,}")
+
+    sample = ids[::100]
+    start = time.perf_counter()
+    for user_id, session_id in sample:
+        legacy[user_id].get(session_id)
+    legacy_lookup = (time.perf_counter() - start) / len(sample) * 1e9
+
+    start = time.perf_counter()
+    for user_id, session_id in sample:
+        compact.get_session_expiry(user_id, session_id)
+    compact_lookup = (time.perf_counter() - start) / len(sample) * 1e9
+    print(f"Búsqueda: {legacy_lookup:.0f} ns (dict) vs {compact_lookup:.0f} ns (compacta, con lock y LRU)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Benchmark de contención del TokenManager
+#
+# Uso: python benchmarks/bench_token_contention.py [hilos] (desde el directorio api)
+#
+# Ejecuta validate_session / is_denied / register_session desde muchos hilos a la
+# vez y compara un único lock (1 partición) con locks particionados.
+import os
+import sys
+import threading
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from helper.token_manager import TokenManager
+
+logging.getLogger("token_manager").setLevel(logging.WARNING)
+
+USERS = 2000
+OPERATIONS_PER_THREAD = 20000
+
+
+def run(stripes, threads):
+    manager = TokenManager(stripes=stripes)
+    sessions = [(str(user), manager.register_session(str(user))) for user in range(USERS)]
+
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        own = sessions[index::threads]
+        samples = latencies[index]
+        barrier.wait()
+        for i in range(OPERATIONS_PER_THREAD):
+            user_id, session_id = own[i % len(own)]
+            start = time.perf_counter()
+            manager.validate_session(user_id, session_id)
+            # Cada 100 validaciones, una escritura (login o logout de otro dispositivo)
+            if i % 100 == 0:
+                manager.register_session(user_id)
+            samples.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_samples = sorted(sample for samples in latencies for sample in samples)
+    p99 = all_samples[int(len(all_samples) * 0.99)] * 1e6
+    total = threads * OPERATIONS_PER_THREAD
+    return total / elapsed, p99
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    print(f"{threads} hilos, {OPERATIONS_PER_THREAD} operaciones por hilo")
+    for stripes in (1, 16, 64):
+        rate, p99 = run(stripes, threads)
+        print(f"{stripes:>3} particiones: {rate:>12,.0f} validaciones/s, p99 {p99:8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
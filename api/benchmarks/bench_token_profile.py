@@ -0,0 +1,72 @@
+# Benchmark del tamaño y el coste del access token
+#
+# Uso: python benchmarks/bench_token_profile.py [tokens] (desde el directorio api)
+#
+# Emite access tokens con el perfil completo (email, nombre, apellido y
+# fecha_nacimiento en cada token) y con el perfil compacto (sub, session_id y
+# exp), y compara el tamaño de la cabecera Cookie que el navegador envía en
+# cada solicitud y el tiempo de codificar y de verificar cada token.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from flask_jwt_extended import create_access_token, decode_token
+
+from config import JWT_TOKEN_PROFILE, JWT_VERIFIED_CACHE
+from helper.jwt_cache import CachingJWTManager
+
+PROFILE = {
+    'email': 'maria.fernanda.gonzalez@example.com',
+    'nombre': 'María Fernanda',
+    'apellido': 'González Rodríguez',
+    'fecha_nacimiento': '1987-04-23'
+}
+SESSION_ID = '5f0b3338-6382-4f2b-8357-5b3df20e496a'
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'benchmark-secret-key-with-enough-length!'
+    app.config['JWT_COOKIE_CSRF_PROTECT'] = False  # Igual que app.py
+    CachingJWTManager(app)
+    return app
+
+
+def measure(app, mode, tokens):
+    JWT_TOKEN_PROFILE["MODE"] = mode
+    claims = {'session_id': SESSION_ID}
+    if mode == "full":
+        claims.update(PROFILE)
+
+    with app.app_context():
+        start = time.perf_counter()
+        for _ in range(tokens):
+            token = create_access_token(identity='123456', additional_claims=claims)
+        encode = (time.perf_counter() - start) / tokens * 1e6
+
+        start = time.perf_counter()
+        for _ in range(tokens):
+            decoded = decode_token(token)
+        decode = (time.perf_counter() - start) / tokens * 1e6
+
+    cookie = f"access_token_cookie={token}"
+    return len(cookie), encode, decode, sorted(decoded)
+
+
+def main():
+    tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # Medir la verificación real, no la caché de tokens verificados
+    JWT_VERIFIED_CACHE["ENABLED"] = False
+    app = create_app()
+    print(f"{tokens} tokens por perfil")
+    for mode in ("full", "compact"):
+        cookie, encode, decode, claims = measure(app, mode, tokens)
+        print(f"{mode:>8}: cookie {cookie:4d} B, codificar {encode:6.1f} µs, verificar {decode:6.1f} µs")
+        print(f"          claims tras decodificar: {', '.join(claims)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,138 @@ EXPIRE_TOKEN_TIME = {
 # Token denylist settings - Siempre habilitado
 TOKEN_BLACKLIST_ENABLED = True
 
+# Número de particiones (cada una con su propio lock) para sesiones y denylist
+TOKEN_MANAGER_STRIPES = int(os.environ.get('TOKEN_MANAGER_STRIPES', '64'))
+
+# Almacén de sesiones y denylist: "memory" (un solo proceso) o "sqlite"
+# (compartido por todos los workers de la máquina)
+TOKEN_STORE = {
+    "BACKEND": os.environ.get('TOKEN_STORE_BACKEND', 'memory'),
+    # "sessions": una entrada por sesión activa; "epoch": sin estado por sesión,
+    # los tokens llevan la época del usuario y revocar todo la incrementa
+    "SESSION_MODE": os.environ.get('TOKEN_SESSION_MODE', 'sessions'),
+    "SQLITE_PATH": os.environ.get('TOKEN_STORE_PATH', os.path.join(os.path.dirname(__file__), 'mock_data', 'token_store.db')),
+    # Contador de revocaciones mapeado en memoria para invalidar las cachés locales
+    "VERSION_PATH": os.environ.get('TOKEN_STORE_VERSION_PATH', os.path.join(os.path.dirname(__file__), 'mock_data', 'token_store.version')),
+    "CACHE_SIZE": 50000,                # Entradas en la caché de lectura de cada proceso
+    # Sesiones activas por usuario; al superarlo se desaloja la menos usada
+    "MAX_SESSIONS_PER_USER": int(os.environ.get('TOKEN_MAX_SESSIONS_PER_USER', '10')),
+    # Snapshot binario del almacén en memoria para conservar sesiones entre reinicios
+    "SNAPSHOT_PATH": os.environ.get('TOKEN_SNAPSHOT_PATH', os.path.join(os.path.dirname(__file__), 'mock_data', 'token_store.snapshot')),
+    "SNAPSHOT_INTERVAL_SECONDS": 30
+}
+
+# Caché de JWT ya verificados (clave: digest del token) para no repetir la
+# verificación de firma y el parseo de claims en cada solicitud
+JWT_VERIFIED_CACHE = {
+    "ENABLED": os.environ.get('JWT_VERIFIED_CACHE', 'true').lower() == 'true',
+    "MAX_ENTRIES": 10000,
+    "MAX_TTL_SECONDS": 900              # Tope para tokens sin exp
+}
+
+# Contenido del access token: "compact" (sub, session_id y exp; el perfil se
+# sirve desde helper.user_profile) o "full" (además email, nombre, apellido,
+# fecha_nacimiento, iat, jti, type y fresh)
+JWT_TOKEN_PROFILE = {
+    "MODE": os.environ.get('JWT_TOKEN_PROFILE', 'compact'),
+    "PROFILE_CACHE_SIZE": 10000,
+    "PROFILE_CACHE_TTL_SECONDS": 60     # Cuánto puede tardar otro worker en ver un cambio de perfil
+}
+
+# Rate limiting: "memory" (estado propio de cada proceso) o "shared" (tabla
+# mapeada en memoria común a todos los workers de la máquina)
+RATE_LIMIT = {
+    "BACKEND": os.environ.get('RATE_LIMIT_BACKEND', 'memory'),
+    "SHARED_PATH": os.environ.get('RATE_LIMIT_TABLE_PATH', os.path.join(os.path.dirname(__file__), 'mock_data', 'rate_limit.table')),
+    "SHARED_SLOTS": 1 << 20,            # Claves simultáneas (16 bytes cada una)
+    "STRIPES": 64,                      # Particiones con lock propio
+    # Políticas declarativas (además de las de @rate_limit en cada vista).
+    # "limit" por "per_seconds" es un ritmo (GCRA): ráfagas de hasta "burst"
+    # (por defecto "limit") y después una solicitud cada per_seconds / limit, así
+    # que una ventana que empieza con la ráfaga admite hasta limit + burst - 1.
+    # Con "burst": 1 ninguna ventana de per_seconds admite más de "limit".
+    # Filtros opcionales: "endpoints", "blueprints", "path_prefix".
+    # "key": ip | sub | email | route; "scope": "policy" (un cupo para todos
+    # los endpoints que cubre) o "endpoint" (un cupo por endpoint)
+    "POLICIES": [
+        {"name": "global", "path_prefix": "/api/", "limit": 100, "per_seconds": 60, "key": "ip"},
+    ]
+}
+
+# Proxies de confianza delante de la API (balanceador). La IP del cliente se
+# toma de X-Forwarded-For (o Forwarded) atravesando sólo saltos de estos rangos
+# y como mucho HOPS saltos (0 = sin límite). Sin CIDRs ni HOPS se usa remote_addr
+TRUSTED_PROXIES = {
+    "CIDRS": os.environ.get('TRUSTED_PROXY_CIDRS', '').split(','),
+    "HOPS": int(os.environ.get('TRUSTED_PROXY_HOPS', '0')),
+    "HEADER": os.environ.get('TRUSTED_PROXY_HEADER', 'X-Forwarded-For'),  # o "Forwarded"
+    "CACHE_SIZE": 4096                  # Direcciones con la pertenencia a los rangos memorizada
+}
+
+# URL pública del frontend para enlaces y redirecciones (ver helper.frontend_url).
+# ALLOWED_ORIGINS: orígenes que una solicitud puede pedir con la cabecera Origin
+# (p. ej. "http://localhost:5000" en desarrollo); lista separada por comas
+FRONTEND = {
+    "DEFAULT_URL": 'https://cronapp-healthtech.replit.app',
+    "ALLOWED_ORIGINS": [origin for origin in os.environ.get('FRONTEND_ALLOWED_ORIGINS', '').split(',') if origin.strip()]
+}
+
+# Limitación de intentos de login por cuenta (espera exponencial tras fallos)
+LOGIN_THROTTLE = {
+    "MAX_ACCOUNTS": 100000,             # Cuentas con fallos recientes en memoria (LRU)
+    "FREE_FAILURES": 3,                 # Fallos sin espera
+    "BASE_DELAY_SECONDS": 1,            # Espera tras el primer fallo de más; se duplica con cada uno
+    "MAX_DELAY_SECONDS": 900,
+    "DECAY_HALF_LIFE_SECONDS": 900      # Los fallos pierden la mitad de su peso en este tiempo
+}
+
+# Hash de contraseñas en un pool de procesos acotado (WORKERS = 0: en el hilo de la solicitud)
+PASSWORD_HASHING = {
+    "WORKERS": int(os.environ.get('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1))),
+    "MAX_PENDING": int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '32')),  # En curso + en cola antes de responder 503
+    "TIMEOUT_SECONDS": 10,
+    "RETRY_AFTER_SECONDS": 1,
+    # 'forkserver' o 'spawn': 'fork' no es seguro con los hilos que ya corren en el worker
+    "START_METHOD": os.environ.get('PASSWORD_HASH_START_METHOD', 'forkserver'),
+    # Coste: METHOD fija los parámetros (p. ej. 'scrypt:65536:8:1'); vacío = calibrar al arrancar
+    "METHOD": os.environ.get('PASSWORD_HASH_METHOD', ''),
+    "ALGORITHM": os.environ.get('PASSWORD_HASH_ALGORITHM', 'scrypt'),   # 'scrypt' o 'pbkdf2:sha256'
+    "TARGET_MS": float(os.environ.get('PASSWORD_HASH_TARGET_MS', '100')),  # Tiempo objetivo por hash
+    "MIN_SCRYPT_N": 2 ** 15,
+    "SCRYPT_MAX_MEMORY_MB": 64,         # Por hash y proceso del pool
+    "MIN_PBKDF2_ITERATIONS": 600000
+}
+
+# Bandeja de salida de correo (SQLite compartida por los workers) y envío en segundo plano
+EMAIL_OUTBOX = {
+    "PATH": os.environ.get('EMAIL_OUTBOX_PATH', os.path.join(os.path.dirname(__file__), 'mock_data', 'email_outbox.db')),
+    "BATCH_SIZE": 20,                   # Mensajes reclamados por lote
+    "POLL_INTERVAL_SECONDS": 1.0,       # Además, encolar despierta al hilo de envío del proceso
+    "MAX_ATTEMPTS": 6,
+    "RETRY_BASE_SECONDS": 5,            # Espera tras el primer fallo; se duplica con cada uno
+    "RETRY_MAX_SECONDS": 600,
+    "LEASE_SECONDS": 60,                # Reserva de un lote por un worker
+    "IDLE_CLOSE_SECONDS": 30,           # Cerrar la conexión SMTP tras este tiempo sin uso
+    "SMTP_TIMEOUT_SECONDS": 10,
+    "RETENTION_SECONDS": 24 * 3600      # Conservar los entregados (sin contenido) para métricas
+}
+
+# Registro de auditoría de sesiones (segmentos append-only rotados)
+AUDIT_LOG = {
+    "DIRECTORY": os.environ.get('AUDIT_LOG_DIR', os.path.join(os.path.dirname(__file__), 'logs', 'audit')),
+    "RING_CAPACITY": 10000,             # Eventos recientes consultables en memoria
+    "MAX_PENDING": 50000,               # Eventos pendientes de escribir antes de descartar
+    "INDEX_KEYS": 10000,                # Usuarios/sesiones indexados como máximo
+    "EVENTS_PER_KEY": 100,              # Eventos recientes por usuario/sesión en el índice
+    "FLUSH_INTERVAL_SECONDS": 1.0,
+    "SEGMENT_MAX_BYTES": 8 * 1024 * 1024,
+    "MAX_SEGMENTS": 20,
+    # Fracción de eventos registrados por acción (1.0 = todos)
+    "SAMPLE_RATES": {
+        "session_validated": float(os.environ.get('AUDIT_SAMPLE_SESSION_VALIDATED', '0.01'))
+    }
+}
+
 # Clave secreta para JWT y operaciones de seguridad - Alta entropía
 # Asegurar que SECRET_KEY siempre tenga un valor válido
 SECRET_KEY = os.environ.get('SESSION_SECRET')  # Usar la variable de entorno existente
@@ -47,4 +179,38 @@ JWT_REFRESH_COOKIE_PATH = "/api/auth/refresh"
 JWT_TOKEN_LOCATION = ["cookies"]  # Solo cookies, sin headers
 
 # Configuración para password reset - Salt único y seguro
-SECURITY_PASSWORD_SALT = os.environ.get('SECURITY_PASSWORD_SALT', secrets.token_hex(16))
\ No newline at end of file
+SECURITY_PASSWORD_SALT = os.environ.get('SECURITY_PASSWORD_SALT', secrets.token_hex(16))
+
+# Ingesta de métricas por lotes
+# DURABILITY: 'buffered' (confirmar al quedar en memoria), 'wal' (registro local
+# con fsync antes de confirmar) o 'sync' (escribir en la base de datos antes de confirmar)
+METRIC_INGEST = {
+    "BATCH_SIZE": int(os.environ.get('METRIC_INGEST_BATCH_SIZE', '500')),
+    "FLUSH_INTERVAL_SECONDS": float(os.environ.get('METRIC_INGEST_FLUSH_INTERVAL', '1.0')),
+    "MAX_BUFFER": int(os.environ.get('METRIC_INGEST_MAX_BUFFER', '100000')),
+    "MAX_READINGS_PER_REQUEST": 5000,
+    # Ventana de timestamps aceptados: hasta MAX_AGE_DAYS atrás y MAX_CLOCK_SKEW_SECONDS adelante
+    "MAX_AGE_DAYS": 5 * 365,
+    "MAX_CLOCK_SKEW_SECONDS": 300,
+    "DURABILITY": os.environ.get('METRIC_INGEST_DURABILITY', 'buffered'),
+    "WAL_PATH": os.environ.get('METRIC_INGEST_WAL_PATH', os.path.join(os.path.dirname(__file__), 'mock_data', 'metric_ingest.wal'))
+}
+
+# Detección de anomalías respecto a la línea base de cada paciente
+ANOMALY_DETECTION = {
+    "WINDOW": 30,            # Lecturas en la ventana móvil
+    "MIN_PERIODS": 10,       # Lecturas mínimas antes de evaluar
+    "EWMA_ALPHA": 0.2,       # Factor de suavizado de la media exponencial
+    "Z_WARNING": 3.0,        # |z| a partir del cual se genera una advertencia
+    "Z_CRITICAL": 4.5        # |z| a partir del cual la alerta es crítica
+}
+
+# Deduplicación de alertas por (paciente, regla)
+ALERTS = {
+    "RENOTIFY_SECONDS": int(os.environ.get('ALERTS_RENOTIFY_SECONDS', str(6 * 3600))),     # Re-notificar una alerta abierta
+    "SUPPRESSION_SECONDS": int(os.environ.get('ALERTS_SUPPRESSION_SECONDS', '3600')),     # Reabrir sin notificar si se cerró hace poco
+    "AUTO_CLOSE_SECONDS": int(os.environ.get('ALERTS_AUTO_CLOSE_SECONDS', str(24 * 3600))),  # Cerrar si la regla deja de dispararse
+    "CLOSED_RETENTION_SECONDS": 7 * 24 * 3600,
+    "PERSIST_INTERVAL_SECONDS": 30,
+    "STATE_PATH": os.environ.get('ALERTS_STATE_PATH', os.path.join(os.path.dirname(__file__), 'mock_data', 'alert_state.json'))
+}
@@ -6,11 +6,12 @@ import os
 import requests
 from flask import Blueprint, redirect, request, url_for, make_response
 from flask_login import login_required, login_user, logout_user
-from werkzeug.security import generate_password_hash
 
 from helper.database import get_db_cursor, fetch_one_dict_from_result
 from helper.response_utils import success_response, error_response
 from helper.token_manager import TokenManager
+from helper.frontend_url import frontend_urls
+from helper.password_hasher import password_hasher, PasswordHashPoolSaturated, hashing_unavailable_response
 from routes.auth import build_token
 
 # Obtener credenciales de variables de entorno o secrets
@@ -26,30 +27,8 @@ else:
     print(f"Credenciales de Google OAuth configuradas - Client ID: {GOOGLE_CLIENT_ID[:8]}...")
     GOOGLE_AUTH_CONFIGURED = True
 
-# Configure la URL de redirección usando el dominio de desarrollo de Replit
-def get_replit_domain():
-    """
-    Intentar obtener el dominio de Replit de varias formas
-    """
-    # Obtenemos el dominio de Replit
-    if os.environ.get("REPL_SLUG") and os.environ.get("REPL_OWNER"):
-        return f'https://{os.environ.get("REPL_SLUG")}.{os.environ.get("REPL_OWNER")}.repl.co'
-    
-    # Alternativa: dominio directo si está disponible
-    if os.environ.get("REPL_IDENTITY"):
-        return f'https://{os.environ.get("REPL_IDENTITY")}.repl.co'
-    
-    # Último recurso
-    import socket
-    try:
-        host_name = socket.gethostname()
-        return f'https://{host_name}.repl.co'
-    except:
-        # Si todo falla, usar un dominio genérico (será necesario actualizar manualmente)
-        return 'https://your-repl-name.repl.co'
-
-REPLIT_DOMAIN = get_replit_domain()
-DEV_REDIRECT_URL = f'{REPLIT_DOMAIN}/api/google_auth/callback'
+# URL de redirección sobre la URL base del frontend (resuelta al arrancar)
+DEV_REDIRECT_URL = frontend_urls.url('/api/google_auth/callback')
 
 # Verificar si las credenciales de Google están configuradas
 GOOGLE_AUTH_CONFIGURED = GOOGLE_CLIENT_ID != "not-configured" and GOOGLE_CLIENT_SECRET != "not-configured"
@@ -171,7 +150,7 @@ def callback():
                 # Usamos una contraseña aleatoria que el usuario nunca necesitará
                 import secrets
                 random_password = secrets.token_hex(16)
-                hashed_password = generate_password_hash(random_password)
+                hashed_password = password_hasher.generate(random_password)
                 
                 # Insertar el nuevo usuario
                 cursor.execute(
@@ -207,9 +186,7 @@ def callback():
         # Generar token de refresco
         refresh_token = create_refresh_token(
             identity=user_id,
-            additional_claims={
-                'session_id': session_id  # Incluir session_id en el token de refresco
-            },
+            additional_claims=token_manager.session_claims(str(user_id), session_id),  # Incluir session_id en el token de refresco
             expires_delta=timedelta(days=EXPIRE_TOKEN_TIME["REFRESH_TOKEN_DAYS"])
         )
         
@@ -233,6 +210,8 @@ def callback():
         print(f"Autenticación con Google exitosa para {user_email}, redirigiendo a {response_url}")
         
         return resp
+    except PasswordHashPoolSaturated:
+        return hashing_unavailable_response()
     except Exception as e:
         print(f"Error en el callback de Google: {str(e)}")
         return error_response(f"Error en la autenticación con Google: {str(e)}", 500)
@@ -0,0 +1,114 @@
+"""
+Identificación de la IP del cliente detrás de proxies de confianza
+
+Detrás del balanceador request.remote_addr es la IP del balanceador. La cadena
+de saltos se reconstruye con X-Forwarded-For (o Forwarded, RFC 7239) más
+remote_addr y se recorre de derecha a izquierda: cada salto es un proxy que
+añadió la dirección de su cliente. Sólo se atraviesan saltos de confianza
+(TRUSTED_PROXIES["CIDRS"]) y como mucho TRUSTED_PROXIES["HOPS"]; la primera
+dirección que no cumple es el cliente. Lo que hay más a la izquierda lo puede
+escribir el propio cliente y nunca se usa.
+
+Sin CIDRs ni saltos configurados se usa remote_addr, como hasta ahora.
+"""
+
+from functools import lru_cache
+from typing import List, Optional
+import ipaddress
+
+from flask import g, request
+
+from config import TRUSTED_PROXIES
+
+_NETWORKS = tuple(ipaddress.ip_network(cidr.strip(), strict=False)
+                  for cidr in TRUSTED_PROXIES["CIDRS"] if cidr.strip())
+_HOPS = TRUSTED_PROXIES["HOPS"]
+_USE_FORWARDED = TRUSTED_PROXIES["HEADER"].lower() == "forwarded"
+_ENABLED = bool(_NETWORKS) or _HOPS > 0
+
+
+@lru_cache(maxsize=TRUSTED_PROXIES["CACHE_SIZE"])
+def is_trusted_proxy(address: str) -> bool:
+    """Si la dirección está en un rango de confianza (memorizado por dirección)"""
+    if not _NETWORKS:
+        # Sólo número de saltos: se confía en cualquier dirección válida
+        return _valid_address(address)
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _NETWORKS)
+
+
+def _valid_address(address: str) -> bool:
+    try:
+        ipaddress.ip_address(address)
+        return True
+    except ValueError:
+        return False
+
+
+def _strip_port(value: str) -> str:
+    """Quita comillas, corchetes IPv6 y puerto de un nodo de Forwarded/X-Forwarded-For"""
+    value = value.strip().strip('"')
+    if value.startswith('['):
+        return value[1:value.find(']')] if ']' in value else value[1:]
+    if value.count(':') == 1:
+        return value.split(':', 1)[0]
+    return value
+
+
+def _forwarded_chain(environ) -> List[str]:
+    """Direcciones del encabezado configurado, de la más lejana a la más cercana"""
+    if _USE_FORWARDED:
+        header = environ.get('HTTP_FORWARDED', '')
+        chain = []
+        for element in header.split(','):
+            for pair in element.split(';'):
+                name, _, value = pair.partition('=')
+                if name.strip().lower() == 'for' and value:
+                    chain.append(_strip_port(value))
+        return chain
+
+    header = environ.get('HTTP_X_FORWARDED_FOR', '')
+    return [_strip_port(value) for value in header.split(',') if value.strip()]
+
+
+def resolve_client_ip(remote_addr: Optional[str], chain: List[str]) -> str:
+    """
+    IP del cliente a partir de remote_addr y la cadena de saltos
+
+    Args:
+        remote_addr: Dirección del par TCP
+        chain: Direcciones del encabezado, de la más lejana a la más cercana
+    """
+    address = remote_addr or 'unknown'
+    if not _ENABLED:
+        return address
+
+    hops = 0
+    position = len(chain)
+    # Mientras el salto actual sea un proxy de confianza, su cliente está a la izquierda
+    while is_trusted_proxy(address) and position > 0:
+        if _HOPS and hops >= _HOPS:
+            break
+        position -= 1
+        address = chain[position]
+        hops += 1
+    return address
+
+
+def client_ip() -> str:
+    """IP del cliente de la solicitud actual (calculada una vez por solicitud)"""
+    address = g.get('_client_ip')
+    if address is None:
+        # Se lee el environ WSGI directamente: request.headers es más lento
+        environ = request.environ
+        remote_addr = environ.get('REMOTE_ADDR')
+        # Conexión directa de un cliente: no hace falta leer encabezados
+        if not _ENABLED or not remote_addr or not is_trusted_proxy(remote_addr):
+            address = remote_addr or 'unknown'
+        else:
+            address = resolve_client_ip(remote_addr, _forwarded_chain(environ))
+        g._client_ip = address
+    return address
@@ -1,63 +1,112 @@
-
+from collections import namedtuple
 from functools import wraps
-from flask import jsonify
+from flask import g, jsonify
 from flask_jwt_extended import verify_jwt_in_request, get_jwt
 from ..token_manager import token_manager
 
+# Resultado de consultar la sesión de un token: denylist, sesión activa y usuario
+SessionStatus = namedtuple('SessionStatus', ['denied', 'valid', 'user'])
+
+# Contexto de autenticación de la solicitud actual
+AuthContext = namedtuple('AuthContext', ['claims', 'user_id', 'session_id', 'denied', 'session_valid', 'user'])
+
+_NO_SESSION = SessionStatus(denied=False, valid=False, user=None)
+
+
+def resolve_session(jwt_payload):
+    """
+    Estado de la sesión de un token, calculado una sola vez por solicitud
+
+    Lo comparten token_in_blocklist_loader, user_lookup_loader,
+    jwt_required_custom y las vistas, que antes consultaban cada uno al
+    token_manager por separado.
+    """
+    user_id = jwt_payload.get("sub")
+    session_id = jwt_payload.get("session_id")
+    if not user_id or not session_id:
+        return _NO_SESSION
+
+    key = (str(user_id), str(session_id), jwt_payload.get("session_epoch"))
+    resolved = g.get('_auth_sessions')
+    if resolved is None:
+        resolved = g._auth_sessions = {}
+    status = resolved.get(key)
+    if status is None:
+        denied, valid = token_manager.check_session(*key)
+        user = {"id": key[0], "session_id": key[1]} if valid else None
+        status = resolved[key] = SessionStatus(denied, valid, user)
+    return status
+
+
+def get_auth_context():
+    """
+    Contexto de autenticación de la solicitud (decodificado y validado una vez)
+
+    Si un decorador ya verificó el JWT se reutiliza su resultado; si no, se
+    verifica de forma opcional. Nunca lanza excepciones: sin token válido
+    devuelve un contexto con claims=None.
+    """
+    context = g.get('_auth_context')
+    if context is not None:
+        return context
+
+    try:
+        # Ya verificado por un decorador en esta solicitud
+        claims = get_jwt()
+    except RuntimeError:
+        try:
+            verify_jwt_in_request(optional=True, locations=['headers', 'cookies'])
+            claims = get_jwt()
+        except Exception:
+            claims = None
+
+    if not claims:
+        context = AuthContext(None, None, None, False, False, None)
+    else:
+        status = resolve_session(claims)
+        context = AuthContext(
+            claims=claims,
+            user_id=claims.get('sub'),
+            session_id=claims.get('session_id'),
+            denied=status.denied,
+            session_valid=status.valid,
+            user=status.user
+        )
+    g._auth_context = context
+    return context
+
+
 def jwt_required_custom(optional=False, refresh=False):
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
             try:
-                # Configuración más permisiva para depuración
+                # Decodifica el token; los loaders resuelven la sesión y la memorizan
                 verify_jwt_in_request(optional=optional, refresh=refresh, locations=['headers', 'cookies'])
-                
-                # Si es opcional y no hay token, continuamos
-                if optional:
-                    try:
-                        jwt = get_jwt()
-                    except Exception:
-                        print("Modo opcional: continuando sin token")
-                        return fn(*args, **kwargs)
-                
-                # Intentar obtener el token JWT
-                try:
-                    jwt = get_jwt()
-                except Exception as e:
-                    print(f"Error obteniendo JWT: {str(e)}")
-                    if optional:
-                        return fn(*args, **kwargs)
-                    return jsonify({"msg": "Token no proporcionado o inválido"}), 401
-                
-                # Verificar que exista el token
-                if not jwt and not optional:
-                    return jsonify({"msg": "Token no proporcionado"}), 401
-                
-                # Verificar si la sesión está en la denylist (invalidada)
-                session_id = jwt.get('session_id', '')
-                if session_id and token_manager.is_denied(session_id):
-                    print(f"Sesión {session_id} ha sido revocada")
-                    return jsonify({"msg": "La sesión ha sido revocada"}), 401
-                
-                # Verificar session_id si existe en el token
-                if 'session_id' in jwt and 'sub' in jwt:
-                    session_id = jwt.get('session_id')
-                    user_id = jwt.get('sub')
-                    
-                    # Solo validamos la sesión para todos los tokens
-                    if session_id:
-                        # Verificar si la sesión está activa para este usuario
-                        if not token_manager.validate_session(str(user_id), session_id):
-                            print(f"Sesión {session_id} inválida para usuario {user_id}")
-                            return jsonify({"msg": "Sesión inválida o expirada"}), 401
-                        
-                        print(f"Sesión {session_id} validada correctamente para usuario {user_id}")
-                
-                return fn(*args, **kwargs)
             except Exception as e:
                 print(f"Error en validación de token: {str(e)}")
                 if optional:
                     return fn(*args, **kwargs)
                 return jsonify({"msg": "Token inválido", "error": str(e)}), 401
+
+            context = get_auth_context()
+
+            # Si es opcional y no hay token, continuamos
+            if context.claims is None:
+                if optional:
+                    return fn(*args, **kwargs)
+                return jsonify({"msg": "Token no proporcionado"}), 401
+
+            # Verificar si la sesión está en la denylist (invalidada)
+            if context.denied:
+                print(f"Sesión {context.session_id} ha sido revocada")
+                return jsonify({"msg": "La sesión ha sido revocada"}), 401
+
+            # Verificar que la sesión esté activa para este usuario
+            if context.session_id and not context.session_valid:
+                print(f"Sesión {context.session_id} inválida para usuario {context.user_id}")
+                return jsonify({"msg": "Sesión inválida o expirada"}), 401
+
+            return fn(*args, **kwargs)
         return decorator
     return wrapper
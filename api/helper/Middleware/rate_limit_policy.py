@@ -0,0 +1,248 @@
+"""
+Motor de políticas de rate limiting
+
+Las políticas se declaran en RATE_LIMIT["POLICIES"] (globales, por blueprint,
+por endpoint o por prefijo de ruta) o junto a la vista con @rate_limit. Al
+arrancar se compilan una sola vez en una tabla endpoint -> políticas, cada una
+con su cupo en un namespace propio ("política" para un cupo compartido por
+todos los endpoints que cubre, "política:endpoint" para uno por endpoint).
+
+En cada solicitud un único before_request evalúa todas las políticas del
+endpoint y responde con las cabeceras RateLimit-Limit, RateLimit-Remaining,
+RateLimit-Reset y RateLimit-Policy de la política más restrictiva, más
+Retry-After cuando la solicitud se rechaza.
+
+Claves de los cupos:
+    ip      dirección del cliente (detrás de proxies de confianza, ver client_ip)
+    sub     usuario autenticado (sub del JWT); sin sesión, la IP
+    email   campo email del cuerpo JSON (login, recuperación); sin él, la IP
+    route   un único cupo compartido por todos los clientes del endpoint
+"""
+
+from collections import namedtuple
+from typing import Dict, List, Optional
+import logging
+import math
+import threading
+
+from flask import g, request
+
+from config import RATE_LIMIT
+from helper.Middleware.client_ip import client_ip
+from helper.Middleware.jwt_manager import get_auth_context
+from helper.Middleware.rate_limiter import RATE_LIMIT_ATTR, create_limiter
+from helper.response_utils import error_response
+
+logger = logging.getLogger("rate_limit_policy")
+
+# Política compilada: límites, clave, limitador y prefijo a comprobar en tiempo
+# de ejecución (sólo para reglas con variables, p. ej. la ruta comodín)
+CompiledPolicy = namedtuple('CompiledPolicy', ['name', 'limit', 'per_seconds', 'burst', 'key', 'limiter', 'path_prefix'])
+
+# Resultado de la política más restrictiva de la solicitud
+RateLimitStatus = namedtuple('RateLimitStatus', ['allowed', 'limit', 'per_seconds', 'remaining', 'reset', 'retry_after'])
+
+_EPSILON = 1e-9
+
+
+def _key_ip() -> str:
+    return f"ip:{client_ip()}"
+
+
+def _key_sub() -> str:
+    user_id = get_auth_context().user_id
+    return f"sub:{user_id}" if user_id else _key_ip()
+
+
+def _key_email() -> str:
+    data = request.get_json(silent=True)
+    email = data.get('email') if isinstance(data, dict) else None
+    if isinstance(email, str) and email.strip():
+        return f"email:{email.strip().lower()}"
+    return _key_ip()
+
+
+def _key_route() -> str:
+    return "route"
+
+
+KEY_FUNCTIONS = {
+    "ip": _key_ip,
+    "sub": _key_sub,
+    "email": _key_email,
+    "route": _key_route,
+}
+
+
+class RateLimitPolicyEngine:
+    """Compila las políticas por endpoint y las evalúa en una sola pasada"""
+
+    def __init__(self, policies: Optional[List[Dict]] = None):
+        self.policies = list(policies if policies is not None else RATE_LIMIT.get("POLICIES", []))
+        self._by_endpoint: Dict[str, tuple] = {}
+        self._limiters: Dict[str, object] = {}
+        self._compiled = False
+        self._lock = threading.Lock()
+
+    def _limiter(self, namespace: str, policy: Dict):
+        limiter = self._limiters.get(namespace)
+        if limiter is None:
+            limiter = create_limiter(policy["limit"], policy["per_seconds"], namespace, policy.get("burst"))
+            self._limiters[namespace] = limiter
+        return limiter
+
+    @staticmethod
+    def _validate(policy: Dict):
+        if policy.get("key", "ip") not in KEY_FUNCTIONS:
+            raise ValueError(f"Clave de rate limiting desconocida en {policy.get('name')}: {policy.get('key')}")
+        if policy["limit"] <= 0 or policy["per_seconds"] <= 0 or policy.get("burst", 1) <= 0:
+            raise ValueError(f"Límites inválidos en la política {policy.get('name')}")
+
+    def _compile_policy(self, policy: Dict, endpoint: str, rules: List[str]) -> Optional[CompiledPolicy]:
+        """Política aplicada a un endpoint (con todas sus reglas), o None si no lo cubre"""
+        if "endpoints" in policy and endpoint not in policy["endpoints"]:
+            return None
+        blueprint = endpoint.rsplit('.', 1)[0] if '.' in endpoint else None
+        if "blueprints" in policy and blueprint not in policy["blueprints"]:
+            return None
+
+        runtime_prefix = None
+        prefix = policy.get("path_prefix")
+        if prefix:
+            always = [rule.startswith(prefix) for rule in rules]
+            maybe = [rule.startswith(prefix) or ('<' in rule and prefix.startswith(rule.split('<', 1)[0]))
+                     for rule in rules]
+            if not any(maybe):
+                return None
+            if not all(always):
+                # Alguna regla tiene variables o queda fuera del prefijo: se
+                # comprueba con la ruta concreta de cada solicitud
+                runtime_prefix = prefix
+
+        scope = policy.get("scope", "policy")
+        namespace = f"{policy['name']}:{endpoint}" if scope == "endpoint" else policy["name"]
+        return CompiledPolicy(
+            policy["name"], policy["limit"], policy["per_seconds"], policy.get("burst") or policy["limit"],
+            policy.get("key", "ip"),
+            self._limiter(namespace, policy), runtime_prefix
+        )
+
+    def compile(self, app):
+        """Construye la tabla endpoint -> políticas (una sola vez)"""
+        with self._lock:
+            if self._compiled:
+                return
+            for policy in self.policies:
+                self._validate(policy)
+
+            rules_by_endpoint: Dict[str, List[str]] = {}
+            for rule in app.url_map.iter_rules():
+                rules_by_endpoint.setdefault(rule.endpoint, []).append(rule.rule)
+
+            by_endpoint = {}
+            for endpoint, rules in rules_by_endpoint.items():
+                view = app.view_functions.get(endpoint)
+                declared = list(getattr(view, RATE_LIMIT_ATTR, ()))
+                for policy in declared:
+                    self._validate(policy)
+
+                compiled = []
+                for policy in self.policies + declared:
+                    entry = self._compile_policy(policy, endpoint, rules)
+                    if entry is not None:
+                        compiled.append(entry)
+                by_endpoint[endpoint] = tuple(compiled)
+
+            self._by_endpoint = by_endpoint
+            self._compiled = True
+            covered = sum(1 for policies in by_endpoint.values() if policies)
+            logger.info(f"Políticas de rate limiting compiladas: {covered}/{len(by_endpoint)} endpoints, "
+                        f"{len(self._limiters)} cupos")
+
+    def evaluate(self) -> Optional[RateLimitStatus]:
+        """
+        Cuenta la solicitud actual en todas las políticas de su endpoint
+
+        Returns:
+            Estado de la política más restrictiva, o None si no aplica ninguna
+        """
+        policies = self._by_endpoint.get(request.endpoint)
+        if not policies:
+            return None
+
+        path = request.path
+        keys = {}
+        worst = None
+        for policy in policies:
+            if policy.path_prefix and not path.startswith(policy.path_prefix):
+                continue
+            key = keys.get(policy.key)
+            if key is None:
+                key = keys[policy.key] = KEY_FUNCTIONS[policy.key]()
+
+            allowed, retry_after, reset = policy.limiter.hit(key)
+            interval = policy.per_seconds / policy.limit
+            # Solicitudes que caben ahora mismo: lo que queda de la ráfaga
+            remaining = 0 if not allowed else max(0, policy.burst - math.ceil(reset / interval - _EPSILON))
+            status = RateLimitStatus(allowed, policy.limit, policy.per_seconds, remaining, reset, retry_after)
+
+            if worst is None:
+                worst = status
+            elif not status.allowed:
+                if worst.allowed or status.retry_after > worst.retry_after:
+                    worst = status
+            elif worst.allowed and (status.remaining, -status.reset) < (worst.remaining, -worst.reset):
+                worst = status
+        return worst
+
+
+def rate_limit_headers(status: RateLimitStatus) -> Dict[str, str]:
+    headers = {
+        'RateLimit-Limit': str(status.limit),
+        'RateLimit-Remaining': str(status.remaining),
+        'RateLimit-Reset': str(math.ceil(status.reset)),
+        'RateLimit-Policy': f"{status.limit};w={int(status.per_seconds)}",
+    }
+    if not status.allowed:
+        headers['Retry-After'] = str(max(1, math.ceil(status.retry_after)))
+    return headers
+
+
+rate_limit_engine = RateLimitPolicyEngine()
+
+
+def setup_rate_limit_policies(app, engine: RateLimitPolicyEngine = rate_limit_engine):
+    """
+    Registra el motor de políticas en la aplicación
+
+    La compilación ocurre en compile(app) una vez registrados los blueprints,
+    o en la primera solicitud si no se llamó antes.
+    """
+    @app.before_request
+    def apply_rate_limit_policies():
+        if request.method == 'OPTIONS':
+            return None
+        if not engine._compiled:
+            engine.compile(app)
+
+        status = engine.evaluate()
+        if status is None:
+            return None
+        g._rate_limit_status = status
+        if not status.allowed:
+            response = error_response(
+                msg="Demasiadas solicitudes. Por favor, inténtelo de nuevo más tarde.",
+                status_code=429
+            )
+            response.headers.update(rate_limit_headers(status))
+            return response
+        return None  # Continuar con la solicitud
+
+    @app.after_request
+    def add_rate_limit_headers(response):
+        status = g.get('_rate_limit_status')
+        if status is not None and status.allowed:
+            response.headers.update(rate_limit_headers(status))
+        return response
+
+    return engine
@@ -1,120 +1,221 @@
 """
 Rate Limiter Middleware
 
-Este módulo proporciona un middleware para limitar la tasa de solicitudes 
+Este módulo proporciona un middleware para limitar la tasa de solicitudes
 a endpoints específicos, ayudando a prevenir ataques de fuerza bruta y
 abuso de la API.
+
+Usa GCRA (Generic Cell Rate Algorithm): por cada clave se guarda un único
+float, el TAT (instante teórico de llegada de la siguiente solicitud). Una
+solicitud se admite si el TAT no va más de la tolerancia de ráfaga
+(burst - 1) * T por delante del reloj, y entonces lo avanza un intervalo de
+emisión T = per_seconds / max_requests. Estado de tamaño constante y trabajo
+O(1) por solicitud.
+
+Con la ráfaga por defecto (burst = max_requests) el límite es un ritmo: una
+clave inactiva puede gastar max_requests solicitudes de golpe y después
+recupera una cada T, así que una ventana de per_seconds que empieza con la
+ráfaga admite hasta 2 * max_requests - 1. Con burst = 1 (tolerancia 0) las
+solicitudes quedan espaciadas al menos T y ninguna ventana de per_seconds
+admite más de max_requests; es lo que usan los endpoints de autenticación.
+
+Con RATE_LIMIT["BACKEND"] = "shared" el TAT vive en una tabla mapeada en
+memoria común a todos los workers (helper.rate_limit_table), de modo que los
+límites son por máquina y no por proceso.
+
+Los límites se declaran con @rate_limit o en RATE_LIMIT["POLICIES"] y los
+aplica el motor de políticas (helper.Middleware.rate_limit_policy).
 """
 
 import time
-from collections import defaultdict
 import threading
-from functools import wraps
-from flask import request, jsonify
-from helper.response_utils import error_response
+from typing import Dict, List, Optional, Tuple
+from config import RATE_LIMIT
+from helper.rate_limit_table import SharedRateTable, key_digest
+
+# Particiones (cada una con su propio lock) de cada limitador en memoria
+RATE_LIMIT_STRIPES = 16
+
+# Cada cuánto se eliminan las claves cuyo TAT ya pasó
+CLEANUP_INTERVAL_SECONDS = 60
+
+# Tolerancia para el error de redondeo al sumar intervalos de emisión
+_EPSILON = 1e-9
+
+
+class GCRALimiter:
+    """Limitador GCRA: clave -> TAT en segundos epoch"""
+
+    def __init__(self, max_requests: int, per_seconds: float, stripes: int = RATE_LIMIT_STRIPES,
+                 burst: Optional[int] = None):
+        self.max_requests = max_requests
+        self.per_seconds = per_seconds
+        self.burst = burst or max_requests
+        # Intervalo de emisión: separación media permitida entre solicitudes
+        self.interval = per_seconds / max_requests
+        # Cuánto puede adelantarse el TAT al reloj: ráfaga de burst solicitudes
+        self.tolerance = (self.burst - 1) * self.interval
+        self._mask = stripes - 1 if stripes & (stripes - 1) == 0 else None
+        self._stripes = stripes
+        self._tats: List[Dict[str, float]] = [{} for _ in range(stripes)]
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _stripe(self, key: str) -> int:
+        h = hash(key)
+        return h & self._mask if self._mask is not None else h % self._stripes
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, float, float]:
+        """
+        Cuenta una solicitud de la clave
+
+        Las solicitudes rechazadas no consumen cupo.
+
+        Returns:
+            Tupla (permitida, segundos hasta que se permita la siguiente,
+            segundos hasta recuperar el cupo completo)
+        """
+        if now is None:
+            now = time.time()
+        index = self._stripe(key)
+        tats = self._tats[index]
+        with self._locks[index]:
+            tat = tats.get(key, now)
+            if tat < now:
+                tat = now
+            wait = tat - self.tolerance - now
+            if wait > _EPSILON:
+                return False, wait, tat - now
+            new_tat = tat + self.interval
+            tats[key] = new_tat
+        return True, 0.0, new_tat - now
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """
+        Elimina las claves cuyo TAT ya pasó (su estado equivale a no tener entrada)
+
+        Returns:
+            Número de claves eliminadas
+        """
+        if now is None:
+            now = time.time()
+        removed = 0
+        for tats, lock in zip(self._tats, self._locks):
+            # Un lock por partición: el camino de las solicitudes sólo espera a una
+            with lock:
+                expired = [key for key, tat in tats.items() if tat <= now]
+                for key in expired:
+                    del tats[key]
+            removed += len(expired)
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(tats) for tats in self._tats)
+
+
+class SharedGCRALimiter:
+    """Limitador GCRA sobre la tabla compartida entre workers"""
 
-# Store para IP addresses y timestamps (en memoria)
-ip_store = defaultdict(list)
-ip_store_lock = threading.Lock()
+    def __init__(self, max_requests: int, per_seconds: float, table: SharedRateTable, namespace: str,
+                 burst: Optional[int] = None):
+        self.max_requests = max_requests
+        self.per_seconds = per_seconds
+        self.burst = burst or max_requests
+        self.interval = per_seconds / max_requests
+        self.tolerance = (self.burst - 1) * self.interval
+        self.table = table
+        # El namespace separa las claves de cada limitador dentro de la tabla
+        self.namespace = namespace
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, float, float]:
+        return self.table.hit(key_digest(self.namespace, key), self.interval, self.tolerance, now)
+
+    def purge(self, now: Optional[float] = None) -> int:
+        # Los slots expirados se reutilizan al insertar: no hay nada que limpiar
+        return 0
+
+
+# Limitadores creados (global y por decorador) para la limpieza periódica
+_limiters: List[GCRALimiter] = []
+_limiters_lock = threading.Lock()
+
+_shared_table: Optional[SharedRateTable] = None
+
+
+def _get_shared_table() -> SharedRateTable:
+    global _shared_table
+    if _shared_table is None:
+        _shared_table = SharedRateTable(
+            RATE_LIMIT["SHARED_PATH"],
+            slots=RATE_LIMIT["SHARED_SLOTS"],
+            stripes=RATE_LIMIT["STRIPES"]
+        )
+    return _shared_table
+
+
+def create_limiter(max_requests: int, per_seconds: float, namespace: str, burst: Optional[int] = None):
+    """
+    Crea un limitador con el backend configurado en RATE_LIMIT
+
+    Args:
+        namespace: Nombre estable del limitador (el mismo en todos los workers)
+        burst: Ráfaga máxima (None = max_requests)
+    """
+    if RATE_LIMIT["BACKEND"] == "shared":
+        return SharedGCRALimiter(max_requests, per_seconds, _get_shared_table(), namespace, burst)
+    if RATE_LIMIT["BACKEND"] != "memory":
+        raise ValueError(f"Backend de rate limiting desconocido: {RATE_LIMIT['BACKEND']}")
+
+    limiter = GCRALimiter(max_requests, per_seconds, burst=burst)
+    with _limiters_lock:
+        _limiters.append(limiter)
+    return limiter
 
-# Store para rutas específicas
-route_store = defaultdict(lambda: defaultdict(list))
-route_store_lock = threading.Lock()
 
 # Función para limpiar entradas antiguas (ejecutar periódicamente)
 def cleanup_old_entries():
-    """Limpia entradas antiguas del store de IPs para evitar crecimiento infinito."""
+    """Limpia las claves expiradas de todos los limitadores para evitar crecimiento infinito."""
     while True:
-        time.sleep(60)  # Limpiar cada minuto
-        current_time = time.time()
-        
-        # Limpiar store de IPs
-        with ip_store_lock:
-            for ip in list(ip_store.keys()):
-                # Mantener solo las solicitudes de los últimos 10 minutos
-                ip_store[ip] = [ts for ts in ip_store[ip] if current_time - ts < 600]
-                if not ip_store[ip]:
-                    del ip_store[ip]
-        
-        # Limpiar store de rutas
-        with route_store_lock:
-            for route in list(route_store.keys()):
-                for ip in list(route_store[route].keys()):
-                    # Mantener solo las solicitudes de los últimos 10 minutos
-                    route_store[route][ip] = [ts for ts in route_store[route][ip] if current_time - ts < 600]
-                    if not route_store[route][ip]:
-                        del route_store[route][ip]
-                if not route_store[route]:
-                    del route_store[route]
+        time.sleep(CLEANUP_INTERVAL_SECONDS)
+        with _limiters_lock:
+            limiters = list(_limiters)
+        for limiter in limiters:
+            limiter.purge()
 
 # Iniciar thread de limpieza
 cleanup_thread = threading.Thread(target=cleanup_old_entries, daemon=True)
 cleanup_thread.start()
 
-def rate_limit(max_requests=100, per_seconds=60, by_route=False):
+# Atributo de la vista donde @rate_limit declara sus políticas
+RATE_LIMIT_ATTR = '_rate_limit_policies'
+
+def rate_limit(max_requests=100, per_seconds=60, by_route=False, key='ip', burst=None):
     """
-    Decorador para limitar la tasa de solicitudes.
-    
+    Decorador que declara un límite de tasa para el endpoint.
+
+    No cuenta nada por sí mismo: el motor de políticas (rate_limit_policy)
+    lo compila al arrancar junto con las políticas de RATE_LIMIT["POLICIES"]
+    y evalúa todas las del endpoint en una sola pasada, sin contar dos veces
+    la misma solicitud.
+
     Args:
-        max_requests: Número máximo de solicitudes permitidas en el período
+        max_requests: Solicitudes sostenidas por período
         per_seconds: Período de tiempo en segundos
-        by_route: Si es True, el límite se aplica por ruta específica
+        by_route: Se mantiene por compatibilidad; el cupo de un decorador es
+            siempre propio de su endpoint
+        key: Clave del cupo: 'ip', 'sub', 'email' o 'route'
+        burst: Ráfaga máxima (None = max_requests); con 1 ninguna ventana de
+            per_seconds admite más de max_requests (ver GCRA en la cabecera)
     """
     def decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
-            ip = request.remote_addr or 'unknown'
-            current_time = time.time()
-            route = request.path if by_route else 'global'
-            
-            if by_route:
-                with route_store_lock:
-                    route_store[route][ip].append(current_time)
-                    # Eliminar requests antiguas fuera del período de tiempo
-                    route_store[route][ip] = [
-                        ts for ts in route_store[route][ip] 
-                        if current_time - ts < per_seconds
-                    ]
-                    request_count = len(route_store[route][ip])
-            else:
-                with ip_store_lock:
-                    ip_store[ip].append(current_time)
-                    # Eliminar requests antiguas fuera del período de tiempo
-                    ip_store[ip] = [
-                        ts for ts in ip_store[ip] 
-                        if current_time - ts < per_seconds
-                    ]
-                    request_count = len(ip_store[ip])
-            
-            if request_count > max_requests:
-                return error_response(
-                    msg=f"Demasiadas solicitudes. Por favor, inténtelo de nuevo después de {per_seconds} segundos.",
-                    status_code=429
-                )
-                
-            return f(*args, **kwargs)
-        return wrapper
+        policies = list(getattr(f, RATE_LIMIT_ATTR, ()))
+        policies.append({
+            "name": f"{f.__module__}.{f.__qualname__}",
+            "limit": max_requests,
+            "per_seconds": per_seconds,
+            "key": key,
+            "burst": burst or max_requests,
+            "scope": "endpoint"
+        })
+        setattr(f, RATE_LIMIT_ATTR, policies)
+        return f
     return decorator
-
-# Middleware para aplicar globalmente usando before_request
-def setup_global_rate_limit(app):
-    """Configura un límite de tasa global para la aplicación Flask."""
-    @app.before_request
-    def global_rate_limit():
-        if request.path.startswith('/api/') and request.method != 'OPTIONS':
-            ip = request.remote_addr or 'unknown'
-            current_time = time.time()
-            
-            with ip_store_lock:
-                ip_store[ip].append(current_time)
-                # Mantener solo solicitudes de los últimos 60 segundos
-                ip_store[ip] = [ts for ts in ip_store[ip] if current_time - ts < 60]
-                
-                # Límite global de 100 solicitudes por minuto
-                if len(ip_store[ip]) > 100:
-                    return error_response(
-                        msg="Límite de tasa excedido. Por favor, inténtelo de nuevo más tarde.",
-                        status_code=429
-                    ), 429
-        
-        return None  # Continuar con la solicitud
\ No newline at end of file
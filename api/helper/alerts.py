@@ -0,0 +1,417 @@
+"""
+Motor de alertas de pacientes
+
+Evalúa las lecturas ingeridas con dos tipos de reglas:
+
+- Rangos fijos del catálogo de condiciones (por ejemplo, presión arterial elevada).
+- Anomalías respecto a la línea base del propio paciente (helper.anomaly).
+
+Cada alerta se identifica por (paciente, regla). Un índice en memoria guarda el
+estado abierta/cerrada de cada identidad, de modo que una regla que se dispara
+en cada evaluación actualiza la misma alerta en O(1) en lugar de crear una nueva.
+Sólo se notifica al abrir, al escalar de severidad o al vencer la ventana de
+re-notificación. El índice se persiste periódicamente en disco y al salir.
+
+Sólo un proceso escribe el archivo de estado: el primero que tiene cambios
+propios (alertas registradas o cerradas) toma un lock fcntl sobre
+STATE_PATH.lock y lo conserva. Un proceso que sólo cargó el estado, como el
+padre del reloader de Flask, no lo sobrescribe con su copia del arranque.
+"""
+
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from config import ALERTS
+from helper.condition_catalog import METRICS_BY_KEY, range_status
+
+logger = logging.getLogger("alerts")
+
+# Reglas de rango fijo: (métrica, dirección) -> (id de regla, descripción)
+THRESHOLD_RULES = {
+    ('systolic', 'high'): ('presion_arterial_elevada', "Presión arterial elevada"),
+    ('diastolic', 'high'): ('presion_arterial_elevada', "Presión arterial elevada"),
+    ('systolic', 'low'): ('presion_arterial_baja', "Presión arterial baja"),
+    ('diastolic', 'low'): ('presion_arterial_baja', "Presión arterial baja"),
+    ('glucose', 'high'): ('glucosa_alta', "Nivel de glucosa por encima del rango objetivo"),
+    ('glucose', 'low'): ('glucosa_baja', "Nivel de glucosa por debajo del rango objetivo"),
+    ('hba1c', 'high'): ('hba1c_alta', "HbA1c por encima del objetivo"),
+    ('peak_flow', 'low'): ('flujo_respiratorio_bajo', "Disminución en mediciones de flujo respiratorio"),
+    ('pain_level', 'high'): ('dolor_elevado', "Nivel de dolor elevado"),
+    ('tsh', 'high'): ('tsh_alta', "TSH por encima del rango de referencia"),
+    ('tsh', 'low'): ('tsh_baja', "TSH por debajo del rango de referencia")
+}
+
+# Orden de severidad para detectar escalamientos
+SEVERITY_RANK = {'warning': 1, 'critical': 2}
+
+# Presentación de cada severidad en el panel de riesgo
+SEVERITY_STYLES = {
+    'warning': {"level": 2, "alertType": "warning", "riskLevel": 65, "riskColor": "#FF9800"},
+    'critical': {"level": 3, "alertType": "critical", "riskLevel": 85, "riskColor": "#F44336"}
+}
+
+
+def anomaly_rule(key: str, zscore: float) -> Tuple[str, str]:
+    """Devuelve (id de regla, descripción) para una anomalía de una métrica"""
+    name = METRICS_BY_KEY[key]["name"]
+    if zscore < 0:
+        return f"anomalia_{key}_baja", f"Caída brusca de {name} respecto a su línea base"
+    return f"anomalia_{key}_alta", f"Aumento brusco de {name} respecto a su línea base"
+
+
+class AlertState:
+    """Estado de una identidad de alerta (paciente, regla)"""
+    __slots__ = ('alert', 'severity', 'status', 'opened_at', 'last_seen', 'last_notified', 'closed_at', 'occurrences')
+
+    def __init__(self, alert: Dict, severity: str, now: float):
+        self.alert = alert
+        self.severity = severity
+        self.status = 'open'
+        self.opened_at = now
+        self.last_seen = now
+        self.last_notified = now
+        self.closed_at = None
+        self.occurrences = 1
+
+    def to_row(self) -> list:
+        return [self.alert, self.severity, self.status, self.opened_at, self.last_seen,
+                self.last_notified, self.closed_at, self.occurrences]
+
+    @classmethod
+    def from_row(cls, row: list) -> 'AlertState':
+        state = cls.__new__(cls)
+        (state.alert, state.severity, state.status, state.opened_at, state.last_seen,
+         state.last_notified, state.closed_at, state.occurrences) = row
+        return state
+
+
+class AlertEngine:
+    """
+    Genera alertas por paciente con deduplicación por (paciente, regla)
+
+    Args:
+        renotify_seconds: Tiempo mínimo entre notificaciones de una alerta abierta
+        suppression_seconds: Una alerta cerrada hace menos de este tiempo se reabre
+            sin volver a notificar (evita alertas intermitentes)
+        auto_close_seconds: Una alerta abierta se cierra si su regla no se dispara
+            durante este tiempo
+        state_path: Archivo donde se persiste el índice (None = sólo memoria)
+    """
+
+    def __init__(self, renotify_seconds: int = ALERTS["RENOTIFY_SECONDS"],
+                 suppression_seconds: int = ALERTS["SUPPRESSION_SECONDS"],
+                 auto_close_seconds: int = ALERTS["AUTO_CLOSE_SECONDS"],
+                 closed_retention_seconds: int = ALERTS["CLOSED_RETENTION_SECONDS"],
+                 persist_interval: float = ALERTS["PERSIST_INTERVAL_SECONDS"],
+                 state_path: Optional[str] = ALERTS["STATE_PATH"]):
+        self.renotify_seconds = renotify_seconds
+        self.suppression_seconds = suppression_seconds
+        self.auto_close_seconds = auto_close_seconds
+        self.closed_retention_seconds = closed_retention_seconds
+        self.persist_interval = persist_interval
+        self.state_path = state_path
+
+        # Índice paciente -> regla -> estado; la búsqueda por identidad es O(1)
+        self._index: Dict[int, Dict[str, AlertState]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._dirty = False
+        # Cambios originados en este proceso (no sólo la limpieza de lo cargado)
+        self._modified = False
+        self._writer_fd = None
+        self._writer_warned = False
+        self._persist_lock = threading.Lock()
+        self._listeners: List[Callable[[Dict, str], None]] = []
+
+        self.stats = {"opened": 0, "suppressed": 0, "escalated": 0, "renotified": 0, "closed": 0}
+
+        self._load()
+
+        if self.state_path:
+            persist_thread = threading.Thread(target=self._persist_loop, daemon=True)
+            persist_thread.start()
+            atexit.register(self.persist)
+
+    def subscribe(self, listener: Callable[[Dict, str], None]):
+        """
+        Registra un receptor de notificaciones
+
+        El receptor recibe la alerta y el motivo: 'opened', 'escalated' o 'renotify'.
+        """
+        self._listeners.append(listener)
+
+    def evaluate(self, readings: List[Tuple[int, str, float, float]], anomalies=()) -> List[Dict]:
+        """
+        Evalúa un lote de lecturas y las anomalías detectadas en él
+
+        Args:
+            readings: Lecturas (patient_id, key, timestamp, valor)
+            anomalies: Eventos de helper.anomaly.AnomalyDetector
+
+        Returns:
+            Lista de alertas notificadas (las duplicadas suprimidas no se incluyen)
+        """
+        raised = []
+
+        for patient_id, key, timestamp, value in readings:
+            status = range_status(key, value)
+            if status is None:
+                continue
+            severity, direction = status
+            rule = THRESHOLD_RULES.get((key, direction))
+            if rule is None:
+                continue
+            rule_id, description = rule
+            raised.append(self.raise_alert(patient_id, rule_id, severity, description, timestamp, {
+                "metricKey": key,
+                "value": value
+            }))
+
+        for event in anomalies:
+            rule_id, description = anomaly_rule(event.key, event.zscore)
+            raised.append(self.raise_alert(event.patient_id, rule_id, event.severity, description, event.timestamp, {
+                "metricKey": event.key,
+                "value": event.value,
+                "zscore": round(event.zscore, 2),
+                "baseline": round(event.baseline, 2)
+            }))
+
+        return [alert for alert in raised if alert is not None]
+
+    def raise_alert(self, patient_id: int, rule_id: str, severity: str, description: str,
+                    timestamp: float, details: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Registra una ocurrencia de una regla para un paciente
+
+        Returns:
+            La alerta si debe notificarse, o None si la ocurrencia fue suprimida
+        """
+        now = time.time()
+        reason = None
+
+        with self._lock:
+            rules = self._index.get(patient_id)
+            if rules is None:
+                rules = {}
+                self._index[patient_id] = rules
+            state = rules.get(rule_id)
+
+            if state is not None and state.status == 'open' and now - state.last_seen > self.auto_close_seconds:
+                self._close_locked(state, state.last_seen + self.auto_close_seconds)
+
+            if state is None or (state.status == 'closed' and now - state.closed_at > self.suppression_seconds):
+                # Identidad nueva o cerrada hace tiempo: abrir una alerta nueva
+                alert = self._build_alert(patient_id, rule_id, severity, description, timestamp, details)
+                state = AlertState(alert, severity, now)
+                rules[rule_id] = state
+                reason = 'opened'
+            else:
+                if state.status == 'closed':
+                    # Cerrada hace poco: reabrir la misma alerta sin notificar
+                    state.status = 'open'
+                    state.closed_at = None
+                state.last_seen = now
+                state.occurrences += 1
+
+                if SEVERITY_RANK[severity] > SEVERITY_RANK[state.severity]:
+                    state.severity = severity
+                    reason = 'escalated'
+                elif now - state.last_notified >= self.renotify_seconds:
+                    reason = 'renotify'
+
+                self._update_alert(state, severity if reason == 'escalated' else state.severity,
+                                   description, timestamp, details)
+
+            state.alert["status"] = state.status
+            state.alert["occurrences"] = state.occurrences
+            self._dirty = True
+            self._modified = True
+
+            if reason is None:
+                self.stats["suppressed"] += 1
+                return None
+
+            state.last_notified = now
+            self.stats["opened" if reason == 'opened' else "escalated" if reason == 'escalated' else "renotified"] += 1
+            alert = dict(state.alert)
+
+        self._notify(alert, reason)
+        return alert
+
+    def resolve(self, patient_id: int, rule_id: str) -> bool:
+        """Cierra explícitamente una alerta abierta"""
+        with self._lock:
+            state = self._index.get(patient_id, {}).get(rule_id)
+            if state is None or state.status != 'open':
+                return False
+            self._close_locked(state, time.time())
+            self._modified = True
+            return True
+
+    def get_patient_alerts(self, patient_id: int) -> List[Dict]:
+        """Obtiene las alertas de un paciente: abiertas primero y luego por recencia"""
+        now = time.time()
+        with self._lock:
+            rules = self._index.get(patient_id)
+            if not rules:
+                return []
+            for state in rules.values():
+                if state.status == 'open' and now - state.last_seen > self.auto_close_seconds:
+                    self._close_locked(state, state.last_seen + self.auto_close_seconds)
+            states = sorted(rules.values(), key=lambda s: (s.status != 'open', -s.last_seen))
+            return [dict(state.alert) for state in states]
+
+    def _build_alert(self, patient_id: int, rule_id: str, severity: str, description: str,
+                     timestamp: float, details: Optional[Dict]) -> Dict:
+        alert = {
+            "id": self._next_id,
+            "patientId": str(patient_id),
+            "rule": rule_id,
+            "days": 1
+        }
+        self._next_id += 1
+        self._apply(alert, severity, description, timestamp, details)
+        return alert
+
+    def _update_alert(self, state: AlertState, severity: str, description: str,
+                      timestamp: float, details: Optional[Dict]):
+        self._apply(state.alert, severity, description, timestamp, details)
+        state.alert["days"] = int((state.last_seen - state.opened_at) // 86400) + 1
+
+    @staticmethod
+    def _apply(alert: Dict, severity: str, description: str, timestamp: float, details: Optional[Dict]):
+        style = SEVERITY_STYLES[severity]
+        moment = datetime.fromtimestamp(timestamp)
+        alert.update({
+            "severity": severity,
+            "description": description,
+            "level": style["level"],
+            "alertType": style["alertType"],
+            "time": moment.strftime("%H:%M"),
+            "timestamp": moment.isoformat(),
+            "riskLevel": style["riskLevel"],
+            "riskColor": style["riskColor"],
+            **(details or {})
+        })
+
+    def _close_locked(self, state: AlertState, closed_at: float):
+        state.status = 'closed'
+        state.closed_at = closed_at
+        state.alert["status"] = 'closed'
+        self.stats["closed"] += 1
+        self._dirty = True
+
+    def _notify(self, alert: Dict, reason: str):
+        logger.info(f"Alerta {alert['rule']} ({alert['severity']}, {reason}) para paciente {alert['patientId']}")
+        for listener in self._listeners:
+            try:
+                listener(alert, reason)
+            except Exception as e:
+                logger.error(f"Error notificando alerta: {str(e)}")
+
+    def _sweep_locked(self, now: float):
+        # Cerrar alertas inactivas y olvidar las cerradas hace mucho
+        for patient_id in list(self._index.keys()):
+            rules = self._index[patient_id]
+            for rule_id in list(rules.keys()):
+                state = rules[rule_id]
+                if state.status == 'open' and now - state.last_seen > self.auto_close_seconds:
+                    self._close_locked(state, state.last_seen + self.auto_close_seconds)
+                if state.status == 'closed' and now - state.closed_at > self.closed_retention_seconds:
+                    del rules[rule_id]
+                    self._dirty = True
+            if not rules:
+                del self._index[patient_id]
+
+    def _acquire_writer(self) -> bool:
+        """Toma el lock de escritor del archivo de estado (llamar con _lock)"""
+        if self._writer_fd is not None or fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        fd = os.open(self.state_path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            if not self._writer_warned:
+                logger.warning(f"Otro proceso escribe {self.state_path}: las alertas de este no se persisten")
+                self._writer_warned = True
+            return False
+        self._writer_fd = fd
+        return True
+
+    def persist(self):
+        """Guarda el índice de alertas en disco si cambió (escritura atómica)"""
+        if not self.state_path:
+            return
+        # Un solo volcado a la vez (hilo periódico y atexit): el último en
+        # reemplazar el archivo es también el más reciente
+        with self._persist_lock:
+            with self._lock:
+                self._sweep_locked(time.time())
+                if not self._dirty:
+                    return
+                # Sin cambios propios no se reclama el archivo: se reescribiría la
+                # copia cargada al arrancar sobre el estado del proceso que escribe
+                if self._writer_fd is None and not self._modified:
+                    return
+                if not self._acquire_writer():
+                    return
+                snapshot = {
+                    "next_id": self._next_id,
+                    "alerts": [
+                        [patient_id, rule_id, state.to_row()]
+                        for patient_id, rules in self._index.items()
+                        for rule_id, state in rules.items()
+                    ]
+                }
+                self._dirty = False
+
+            directory, name = os.path.split(self.state_path)
+            fd, tmp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    json.dump(snapshot, file, separators=(',', ':'))
+                os.replace(tmp_path, self.state_path)
+            except Exception:
+                os.unlink(tmp_path)
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                snapshot = json.load(file)
+            for patient_id, rule_id, row in snapshot.get("alerts", []):
+                self._index.setdefault(int(patient_id), {})[rule_id] = AlertState.from_row(row)
+            self._next_id = snapshot.get("next_id", 1)
+            logger.info(f"Cargadas {len(snapshot.get('alerts', []))} alertas desde {self.state_path}")
+        except Exception as e:
+            logger.error(f"Error cargando el estado de alertas: {str(e)}")
+
+    def _persist_loop(self):
+        while True:
+            time.sleep(self.persist_interval)
+            try:
+                self.persist()
+            except Exception as e:
+                logger.error(f"Error persistiendo alertas: {str(e)}")
+
+
+# Instancia compartida del motor de alertas
+alert_engine = AlertEngine()
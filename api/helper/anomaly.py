@@ -0,0 +1,265 @@
+"""
+Detección de anomalías sobre las series de métricas
+
+Además de los rangos fijos del catálogo, marca lecturas que se desvían de la
+línea base del propio paciente (por ejemplo, una caída repentina del flujo
+máximo). Calcula EWMA, media y desviación estándar móviles y z-score:
+
+- De forma vectorizada con NumPy sobre el historial completo de una serie,
+  para re-evaluar una cohorte entera.
+- De forma incremental (O(1) por lectura) a medida que llegan lecturas nuevas,
+  usando un buffer circular por (paciente, métrica).
+
+El z-score de una lectura se calcula contra la ventana anterior, sin incluirla,
+para que un valor atípico no diluya su propia desviación.
+"""
+
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+import math
+import threading
+
+import numpy as np
+
+from config import ANOMALY_DETECTION
+
+AnomalyEvent = namedtuple('AnomalyEvent', ['patient_id', 'key', 'timestamp', 'value', 'zscore', 'baseline', 'severity'])
+
+# Desviación mínima para evitar z-scores infinitos en series casi constantes
+MIN_STD = 1e-6
+
+
+def ewma(values, alpha: float, initial: Optional[float] = None) -> np.ndarray:
+    """
+    Media móvil exponencial vectorizada
+
+    Usa la forma cerrada y[t] = (1-a)^(t+1)·y0 + a·Σ (1-a)^(t-k)·x[k] por bloques,
+    con bloques lo bastante cortos para que las potencias no desborden.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    n = x.size
+    out = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return out
+
+    decay = 1.0 - alpha
+    state = x[0] if initial is None else float(initial)
+    if decay <= 0.0:
+        out[:] = x
+        return out
+
+    # Limitar decay^-bloque a ~1e150
+    block = max(1, min(n, int(150 / -math.log10(decay)) if decay < 1.0 else n))
+    for start in range(0, n, block):
+        chunk = x[start:start + block]
+        steps = np.arange(1, chunk.size + 1, dtype=np.float64)
+        powers = decay ** steps
+        # Σ a·(1-a)^(t-k)·x[k] = (1-a)^t · Σ a·x[k]·(1-a)^(-k)
+        weighted = np.cumsum(alpha * chunk / (powers / decay))
+        out[start:start + chunk.size] = powers * state + (powers / decay) * weighted
+        state = out[start + chunk.size - 1]
+    return out
+
+
+def rolling_mean_std(values, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Media y desviación estándar móviles vectorizadas (con sumas acumuladas)
+
+    Las posiciones con menos de `window` lecturas usan las disponibles.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    n = x.size
+    if n == 0:
+        return np.empty(0), np.empty(0)
+
+    csum = np.concatenate(([0.0], np.cumsum(x)))
+    csq = np.concatenate(([0.0], np.cumsum(x * x)))
+    ends = np.arange(1, n + 1)
+    starts = np.maximum(ends - window, 0)
+    counts = ends - starts
+
+    mean = (csum[ends] - csum[starts]) / counts
+    var = (csq[ends] - csq[starts]) / counts - mean * mean
+    std = np.sqrt(np.maximum(var, 0.0))
+    return mean, std
+
+
+def score_series(values, window: int = ANOMALY_DETECTION["WINDOW"],
+                 min_periods: int = ANOMALY_DETECTION["MIN_PERIODS"]) -> np.ndarray:
+    """
+    Calcula el z-score de cada lectura respecto a la ventana previa
+
+    Returns:
+        Array de z-scores (NaN donde aún no hay `min_periods` lecturas previas)
+    """
+    x = np.asarray(values, dtype=np.float64)
+    n = x.size
+    z = np.full(n, np.nan)
+    if n < 2:
+        return z
+
+    mean, std = rolling_mean_std(x, window)
+    # La línea base de la lectura t es la ventana que termina en t-1
+    base_mean = mean[:-1]
+    base_std = np.maximum(std[:-1], MIN_STD)
+    z[1:] = (x[1:] - base_mean) / base_std
+
+    previous_counts = np.minimum(np.arange(n), window)
+    z[previous_counts < min_periods] = np.nan
+    return z
+
+
+def classify(zscore: float, z_warning: float = ANOMALY_DETECTION["Z_WARNING"],
+             z_critical: float = ANOMALY_DETECTION["Z_CRITICAL"]) -> Optional[str]:
+    """Clasifica un z-score en 'critical', 'warning' o None"""
+    if zscore is None or math.isnan(zscore):
+        return None
+    magnitude = abs(zscore)
+    if magnitude >= z_critical:
+        return 'critical'
+    if magnitude >= z_warning:
+        return 'warning'
+    return None
+
+
+class RollingBaseline:
+    """Línea base incremental de una serie (ventana circular + EWMA)"""
+    __slots__ = ('window', 'alpha', '_buffer', '_index', '_count', '_sum', '_sumsq', 'ewma')
+
+    def __init__(self, window: int, alpha: float):
+        self.window = window
+        self.alpha = alpha
+        self._buffer = np.zeros(window, dtype=np.float64)
+        self._index = 0
+        self._count = 0
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self.ewma = None
+
+    def stats(self) -> Tuple[int, float, float]:
+        """Devuelve (lecturas en ventana, media, desviación estándar)"""
+        if self._count == 0:
+            return 0, 0.0, 0.0
+        mean = self._sum / self._count
+        var = max(self._sumsq / self._count - mean * mean, 0.0)
+        return self._count, mean, math.sqrt(var)
+
+    def update(self, value: float) -> Tuple[int, float, float]:
+        """
+        Incorpora una lectura a la ventana
+
+        Returns:
+            Estadísticas de la ventana previa a la lectura (para calcular su z-score)
+        """
+        previous = self.stats()
+
+        if self._count == self.window:
+            leaving = float(self._buffer[self._index])
+            self._sum -= leaving
+            self._sumsq -= leaving * leaving
+        else:
+            self._count += 1
+
+        self._buffer[self._index] = value
+        self._index = (self._index + 1) % self.window
+        self._sum += value
+        self._sumsq += value * value
+
+        # Recalcular las sumas en cada vuelta completa para evitar error acumulado
+        if self._index == 0:
+            self._sum = float(self._buffer.sum())
+            self._sumsq = float(np.dot(self._buffer, self._buffer))
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+
+        return previous
+
+    def reset(self, values):
+        """Reconstruye la ventana a partir de las últimas lecturas de una serie"""
+        tail = np.asarray(values, dtype=np.float64)[-self.window:]
+        self._buffer[:] = 0.0
+        self._buffer[:tail.size] = tail
+        self._count = int(tail.size)
+        self._index = self._count % self.window
+        self._sum = float(tail.sum())
+        self._sumsq = float((tail * tail).sum())
+        self.ewma = float(ewma(values, self.alpha)[-1]) if len(values) else None
+
+
+class AnomalyDetector:
+    """Detector de anomalías por (paciente, métrica)"""
+
+    def __init__(self, window: int = ANOMALY_DETECTION["WINDOW"],
+                 min_periods: int = ANOMALY_DETECTION["MIN_PERIODS"],
+                 alpha: float = ANOMALY_DETECTION["EWMA_ALPHA"],
+                 z_warning: float = ANOMALY_DETECTION["Z_WARNING"],
+                 z_critical: float = ANOMALY_DETECTION["Z_CRITICAL"]):
+        self.window = window
+        self.min_periods = min_periods
+        self.alpha = alpha
+        self.z_warning = z_warning
+        self.z_critical = z_critical
+        self._baselines: Dict[Tuple[int, str], RollingBaseline] = {}
+        self._lock = threading.Lock()
+
+    def observe_many(self, readings: List[Tuple[int, str, float, float]]) -> List[AnomalyEvent]:
+        """
+        Actualiza las líneas base con un lote de lecturas y devuelve las anomalías
+
+        Las lecturas de cada serie se procesan en orden de tiempo.
+        """
+        events = []
+        with self._lock:
+            for patient_id, key, timestamp, value in sorted(readings, key=lambda r: r[2]):
+                baseline = self._baselines.get((patient_id, key))
+                if baseline is None:
+                    baseline = RollingBaseline(self.window, self.alpha)
+                    self._baselines[(patient_id, key)] = baseline
+
+                count, mean, std = baseline.update(value)
+                if count < self.min_periods:
+                    continue
+
+                zscore = float((value - mean) / max(std, MIN_STD))
+                severity = classify(zscore, self.z_warning, self.z_critical)
+                if severity:
+                    events.append(AnomalyEvent(patient_id, key, timestamp, value, zscore, mean, severity))
+        return events
+
+    def rescore(self, patient_id: int, key: str, timestamps, values) -> List[AnomalyEvent]:
+        """
+        Re-evalúa una serie completa de forma vectorizada
+
+        También reconstruye la línea base incremental con el final de la serie.
+        """
+        x = np.asarray(values, dtype=np.float64)
+        z = score_series(x, self.window, self.min_periods)
+        mean, _ = rolling_mean_std(x, self.window)
+
+        magnitude = np.abs(np.nan_to_num(z))
+        flagged = np.nonzero(magnitude >= self.z_warning)[0]
+
+        events = [
+            AnomalyEvent(
+                patient_id, key, float(timestamps[i]), float(x[i]), float(z[i]),
+                float(mean[i - 1]), 'critical' if magnitude[i] >= self.z_critical else 'warning'
+            )
+            for i in flagged
+        ]
+
+        baseline = RollingBaseline(self.window, self.alpha)
+        baseline.reset(x)
+        with self._lock:
+            self._baselines[(patient_id, key)] = baseline
+        return events
+
+    def get_baseline(self, patient_id: int, key: str) -> Optional[Dict]:
+        """Obtiene las estadísticas actuales de la línea base de una serie"""
+        baseline = self._baselines.get((patient_id, key))
+        if baseline is None:
+            return None
+        count, mean, std = baseline.stats()
+        return {"count": count, "mean": mean, "std": std, "ewma": baseline.ewma}
+
+
+# Instancia compartida del detector
+anomaly_detector = AnomalyDetector()
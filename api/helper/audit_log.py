@@ -0,0 +1,289 @@
+"""
+Registro de auditoría asíncrono
+
+Los eventos de seguridad (sesiones creadas, validadas, invalidadas...) se
+registran en el hilo de la solicitud con un simple append a una cola sin lock.
+Un hilo en segundo plano los indexa por usuario y sesión, los conserva en un
+buffer circular para consultas recientes y los escribe por lotes en segmentos
+JSONL append-only que rotan por tamaño.
+
+Todos los workers escriben en el mismo directorio: cada proceso abre sus
+propios segmentos (audit-<fecha>-<pid>-<n>.jsonl) y mantiene un lock fcntl
+sobre el que tiene abierto. Al rotar se borran los segmentos más antiguos que
+superan MAX_SEGMENTS, pero nunca uno que otro proceso tenga abierto.
+
+Las acciones de alto volumen (como session_validated, que ocurre en cada
+solicitud autenticada) se pueden muestrear con una tasa configurable.
+"""
+
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from config import AUDIT_LOG
+
+logger = logging.getLogger("audit_log")
+
+
+class AuditLog:
+    """Pipeline de eventos de auditoría con índice en memoria y segmentos en disco"""
+
+    def __init__(self, directory: Optional[str], ring_capacity: int = 10000, max_pending: int = 50000,
+                 index_keys: int = 10000, events_per_key: int = 100, flush_interval: float = 1.0,
+                 segment_max_bytes: int = 8 * 1024 * 1024, max_segments: int = 20,
+                 sample_rates: Optional[Dict[str, float]] = None):
+        self.directory = directory
+        self.max_pending = max_pending
+        self.index_keys = index_keys
+        self.events_per_key = events_per_key
+        self.flush_interval = flush_interval
+        self.segment_max_bytes = segment_max_bytes
+        self.max_segments = max_segments
+        self.sample_rates = dict(sample_rates or {})
+
+        # Cola de entrada: deque.append es atómico, el hilo de la solicitud no toma locks
+        self._pending = deque()
+        # Eventos recientes e índices por usuario y sesión (protegidos por _lock)
+        self._ring = deque(maxlen=ring_capacity)
+        self._by_user: "OrderedDict[str, deque]" = OrderedDict()
+        self._by_session: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+
+        self._segment = None
+        self._segment_path = None
+        self._segment_bytes = 0
+        self._segment_pid = None
+
+        self.stats = {"recorded": 0, "sampled_out": 0, "dropped": 0, "written": 0, "segments": 0}
+
+        sink_thread = threading.Thread(target=self._run, daemon=True)
+        sink_thread.start()
+        atexit.register(self.flush)
+
+    def record(self, action: str, user_id: Optional[str], session_id: Optional[str],
+               details: Optional[Dict] = None) -> bool:
+        """
+        Registra un evento de auditoría sin bloquear
+
+        Returns:
+            True si el evento se encoló, False si se descartó por muestreo o saturación
+        """
+        rate = self.sample_rates.get(action, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            self.stats["sampled_out"] += 1
+            return False
+
+        if len(self._pending) >= self.max_pending:
+            self.stats["dropped"] += 1
+            return False
+
+        event = {
+            "ts": time.time(),
+            "action": action,
+            "user_id": user_id,
+            "session_id": session_id,
+            "details": details or {}
+        }
+        if rate < 1.0:
+            event["sample_rate"] = rate
+        self._pending.append(event)
+        self.stats["recorded"] += 1
+        return True
+
+    def query(self, user_id: Optional[str] = None, session_id: Optional[str] = None,
+              action: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """
+        Consulta eventos recientes por usuario y/o sesión usando el índice
+
+        Returns:
+            Eventos del más reciente al más antiguo, con timestamp ISO-8601
+        """
+        self.flush()
+
+        with self._lock:
+            if session_id is not None:
+                source = list(self._by_session.get(session_id, ()))
+            elif user_id is not None:
+                source = list(self._by_user.get(user_id, ()))
+            else:
+                source = list(self._ring)
+
+        result = []
+        for event in reversed(source):
+            if user_id is not None and event["user_id"] != user_id:
+                continue
+            if action is not None and event["action"] != action:
+                continue
+            result.append(self._format(event))
+            if len(result) >= limit:
+                break
+        return result
+
+    def search_segments(self, user_id: Optional[str] = None,
+                        session_id: Optional[str] = None) -> Iterator[Dict]:
+        """Recorre los segmentos en disco (del más antiguo al más reciente) filtrando eventos"""
+        self.flush()
+        for path in self._list_segments():
+            with open(path, 'r', encoding='utf-8') as segment:
+                for line in segment:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if user_id is not None and event.get("user_id") != user_id:
+                        continue
+                    if session_id is not None and event.get("session_id") != session_id:
+                        continue
+                    yield event
+
+    def flush(self):
+        """Indexa y escribe en disco los eventos pendientes"""
+        with self._flush_lock:
+            batch = []
+            while self._pending:
+                batch.append(self._pending.popleft())
+            if not batch:
+                return
+
+            with self._lock:
+                for event in batch:
+                    self._ring.append(event)
+                    if event["user_id"]:
+                        self._index(self._by_user, event["user_id"], event)
+                    if event["session_id"]:
+                        self._index(self._by_session, event["session_id"], event)
+
+            if self.directory:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logger.error(f"Error escribiendo segmento de auditoría: {str(e)}")
+
+    def _index(self, index: "OrderedDict[str, deque]", key: str, event: Dict):
+        events = index.get(key)
+        if events is None:
+            events = deque(maxlen=self.events_per_key)
+            index[key] = events
+            # Olvidar la clave menos reciente para acotar la memoria del índice
+            if len(index) > self.index_keys:
+                index.popitem(last=False)
+        else:
+            index.move_to_end(key)
+        events.append(event)
+
+    @staticmethod
+    def _format(event: Dict) -> Dict:
+        formatted = dict(event)
+        formatted["timestamp"] = datetime.fromtimestamp(formatted.pop("ts")).isoformat()
+        return formatted
+
+    def _write(self, batch: List[Dict]):
+        data = ''.join(json.dumps(self._format(event), ensure_ascii=False) + '\n' for event in batch)
+        encoded = data.encode('utf-8')
+
+        # Tras un fork el segmento heredado es del proceso padre
+        if (self._segment is None or self._segment_pid != os.getpid()
+                or self._segment_bytes + len(encoded) > self.segment_max_bytes):
+            self._rotate()
+
+        self._segment.write(encoded)
+        self._segment.flush()
+        self._segment_bytes += len(encoded)
+        self.stats["written"] += len(batch)
+
+    def _rotate(self):
+        if self._segment is not None:
+            # Cerrar libera el lock: el segmento pasa a poder borrarse
+            self._segment.close()
+
+        os.makedirs(self.directory, exist_ok=True)
+        pid = os.getpid()
+        while True:
+            name = f"audit-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{pid}-{self.stats['segments']:06d}.jsonl"
+            self._segment_path = os.path.join(self.directory, name)
+            self.stats["segments"] += 1
+            try:
+                # Append-only y exclusivo: nunca se escribe en un segmento ajeno
+                self._segment = open(self._segment_path, 'xb')
+                break
+            except FileExistsError:
+                continue
+        if fcntl is not None:
+            fcntl.lockf(self._segment.fileno(), fcntl.LOCK_EX)
+        self._segment_bytes = 0
+        self._segment_pid = pid
+
+        self._prune()
+
+    def _prune(self):
+        """Borra los segmentos más antiguos que superan max_segments si ya están cerrados"""
+        for path in self._list_segments()[:-self.max_segments]:
+            if path == self._segment_path:
+                continue
+            if fcntl is None:
+                # Sin locks sólo se sabe que están cerrados los de este proceso
+                if f"-{os.getpid()}-" not in os.path.basename(path):
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+            except OSError:
+                continue
+            try:
+                # Un segmento abierto por otro proceso tiene su lock tomado
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(path)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+    def _list_segments(self) -> List[str]:
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith('audit-') and name.endswith('.jsonl')
+        )
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error en el registro de auditoría: {str(e)}")
+
+
+# Instancia compartida del registro de auditoría
+audit_log = AuditLog(
+    directory=AUDIT_LOG["DIRECTORY"],
+    ring_capacity=AUDIT_LOG["RING_CAPACITY"],
+    max_pending=AUDIT_LOG["MAX_PENDING"],
+    index_keys=AUDIT_LOG["INDEX_KEYS"],
+    events_per_key=AUDIT_LOG["EVENTS_PER_KEY"],
+    flush_interval=AUDIT_LOG["FLUSH_INTERVAL_SECONDS"],
+    segment_max_bytes=AUDIT_LOG["SEGMENT_MAX_BYTES"],
+    max_segments=AUDIT_LOG["MAX_SEGMENTS"],
+    sample_rates=AUDIT_LOG["SAMPLE_RATES"]
+)
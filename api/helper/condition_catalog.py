@@ -0,0 +1,129 @@
+"""
+Catálogo de condiciones médicas y sus métricas
+
+Define de forma estática las condiciones crónicas soportadas y las métricas
+que se registran para cada una. Se construye una sola vez al importar el módulo
+y se comparte entre las rutas de pacientes y el almacén de series temporales.
+"""
+
+# Colores usados por el frontend para resaltar valores fuera de rango
+CRITICAL_COLOR = "#EF4444"
+WARNING_COLOR = "#F97316"
+
+# Cada métrica define sus rangos de referencia en "ranges":
+#   high / low: fuera del rango objetivo (advertencia)
+#   critical_high / critical_low: requiere atención (crítico)
+CONDITIONS = [
+    {
+        "id": 1,
+        "name": "Hipertensión",
+        "type": "chronic",
+        "icon": "heart-pulse",
+        "color": "#EF4444",
+        "metrics": [
+            {"id": 1, "key": "systolic", "name": "Sistólica", "label": "mmHg",
+             "ranges": {"high": 130, "critical_high": 160, "low": 90}},
+            {"id": 2, "key": "diastolic", "name": "Diastólica", "label": "mmHg",
+             "ranges": {"high": 85, "critical_high": 100, "low": 60}}
+        ]
+    },
+    {
+        "id": 2,
+        "name": "Diabetes Tipo 2",
+        "type": "chronic",
+        "icon": "droplet",
+        "color": "#3B82F6",
+        "metrics": [
+            {"id": 4, "key": "glucose", "name": "Glucosa", "label": "mg/dL",
+             "ranges": {"high": 140, "critical_high": 250, "low": 70, "critical_low": 54}},
+            {"id": 5, "key": "hba1c", "name": "HbA1c", "label": "%",
+             "ranges": {"high": 7.0, "critical_high": 9.0}}
+        ]
+    },
+    {
+        "id": 3,
+        "name": "Asma",
+        "type": "chronic",
+        "icon": "lungs",
+        "color": "#22C55E",
+        "metrics": [
+            {"id": 7, "key": "peak_flow", "name": "Flujo máximo", "label": "L/min",
+             "ranges": {"low": 350, "critical_low": 250}}
+        ]
+    },
+    {
+        "id": 4,
+        "name": "Artritis",
+        "type": "chronic",
+        "icon": "activity",
+        "color": "#EC4899",
+        "metrics": [
+            {"id": 9, "key": "pain_level", "name": "Nivel de dolor", "label": "/10",
+             "ranges": {"high": 5, "critical_high": 8}}
+        ]
+    },
+    {
+        "id": 5,
+        "name": "Hipotiroidismo",
+        "type": "chronic",
+        "icon": "activity",
+        "color": "#A855F7",
+        "metrics": [
+            {"id": 11, "key": "tsh", "name": "TSH", "label": "mIU/L",
+             "ranges": {"high": 4.5, "critical_high": 10.0, "low": 0.4}}
+        ]
+    }
+]
+
+# Índices de búsqueda por id de condición y por clave de métrica
+CONDITIONS_BY_ID = {condition["id"]: condition for condition in CONDITIONS}
+
+METRICS_BY_KEY = {
+    metric["key"]: {**metric, "condition_id": condition["id"]}
+    for condition in CONDITIONS
+    for metric in condition["metrics"]
+}
+
+
+def range_status(key: str, value: float):
+    """
+    Evalúa un valor contra los rangos de referencia de su métrica
+
+    Returns:
+        Tupla (severidad, dirección) con severidad 'critical' o 'warning' y
+        dirección 'high' o 'low', o None si el valor está en rango
+    """
+    metric = METRICS_BY_KEY.get(key)
+    if not metric:
+        return None
+    ranges = metric.get("ranges", {})
+
+    if value >= ranges.get("critical_high", float('inf')):
+        return 'critical', 'high'
+    if value < ranges.get("critical_low", float('-inf')):
+        return 'critical', 'low'
+    if value >= ranges.get("high", float('inf')):
+        return 'warning', 'high'
+    if value < ranges.get("low", float('-inf')):
+        return 'warning', 'low'
+    return None
+
+
+def value_color(key: str, value: float):
+    """
+    Calcula el color de resaltado de un valor según los rangos de su métrica
+
+    Returns:
+        CRITICAL_COLOR, WARNING_COLOR o None si el valor está en rango
+    """
+    status = range_status(key, value)
+    if status is None:
+        return None
+    return CRITICAL_COLOR if status[0] == 'critical' else WARNING_COLOR
+
+
+def format_metric_value(value: float) -> str:
+    """Formatea un valor de métrica como texto (enteros sin decimales)"""
+    if float(value).is_integer():
+        return str(int(value))
+    return str(round(value, 2))
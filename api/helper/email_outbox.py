@@ -0,0 +1,397 @@
+"""
+Bandeja de salida de correo con envío en segundo plano
+
+Enviar con Flask-Mail dentro de la solicitud abre una conexión TLS nueva con el
+servidor SMTP en cada correo, así que la latencia del endpoint es la del
+servidor SMTP. EmailOutbox guarda el mensaje en una tabla SQLite (modo WAL,
+compartida por todos los workers de la máquina) y responde en cuanto queda
+encolado.
+
+Un hilo por proceso reclama lotes de mensajes pendientes con un lease (un
+mensaje no se envía dos veces aunque varios workers compitan por la tabla). Antes
+de cada envío el lease del mensaje se renueva sólo si sigue siendo el reclamado:
+si el lote tardó más que el lease y otro worker recogió el mensaje, se omite. Los
+envía por una conexión SMTP que se mantiene abierta entre lotes y se cierra
+tras IDLE_CLOSE_SECONDS sin uso, y registra el resultado:
+    - entregado: se marca 'sent' y se borra el contenido (puede llevar enlaces
+      de recuperación); la fila se purga pasado RETENTION_SECONDS
+    - error temporal (red, 4xx): se reprograma con espera exponencial
+    - error permanente (5xx, destinatarios rechazados) o MAX_ATTEMPTS agotados:
+      se marca 'failed' con el último error
+
+Las métricas de entrega (enviados, reintentos, fallidos, conexiones abiertas y
+latencia desde que se encola hasta que se entrega) están en metrics().
+"""
+
+from collections import deque
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from typing import Dict, List, Optional
+import json
+import logging
+import os
+import smtplib
+import sqlite3
+import ssl
+import threading
+import time
+
+from config import EMAIL_OUTBOX
+
+logger = logging.getLogger("email_outbox")
+
+
+class SMTPConnection:
+    """Conexión SMTP reutilizable entre envíos"""
+
+    def __init__(self, host: str, port: int, use_tls: bool = False, use_ssl: bool = False,
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 timeout: float = 10.0, idle_close: float = 30.0):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.idle_close = idle_close
+        self._smtp = None
+        self._last_used = 0.0
+        self.connections = 0
+
+    def _open(self):
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls(context=ssl.create_default_context())
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.connections += 1
+
+    def send(self, message: EmailMessage):
+        """Envía por la conexión abierta; si el servidor la cerró, reconecta una vez"""
+        if self._smtp is None:
+            self._open()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._open()
+            self._smtp.send_message(message)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_close:
+            self.close()
+
+    def close(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Errores que no se arreglan reintentando el mismo mensaje"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        # Credenciales mal configuradas: se corrigen sin tocar el mensaje
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+def _is_connection_error(error: Exception) -> bool:
+    """Fallos de la conexión, no del mensaje: no tiene sentido seguir con el lote"""
+    return isinstance(error, (OSError, smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected,
+                              smtplib.SMTPAuthenticationError, smtplib.SMTPNotSupportedError))
+
+
+class EmailOutbox:
+    """Cola persistente de correos con un hilo de envío por proceso"""
+
+    def __init__(self, path: str, batch_size: int = 20, poll_interval: float = 1.0,
+                 max_attempts: int = 6, retry_base: float = 5.0, retry_max: float = 600.0,
+                 lease_seconds: float = 60.0, retention_seconds: float = 86400.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.default_sender = None
+        self.transport: Optional[SMTPConnection] = None
+
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._send_lock = threading.Lock()
+        self._thread = None
+        self._latencies = deque(maxlen=1000)
+        self._last_purge = 0.0
+
+        self.stats = {"enqueued": 0, "sent": 0, "retries": 0, "failed": 0, "batches": 0}
+        self._create_tables()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                sender TEXT,
+                recipients TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT,
+                html TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                lease_until REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                sent_at REAL
+            )
+        """)
+        # El hilo de envío sólo recorre los pendientes que ya tocan
+        conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+
+    def init_app(self, app, transport: Optional[SMTPConnection] = None):
+        """Toma la configuración MAIL_* de la aplicación e inicia el hilo de envío"""
+        config = app.config
+        self.default_sender = config.get('MAIL_DEFAULT_SENDER') or config.get('MAIL_USERNAME')
+        self.transport = transport or SMTPConnection(
+            host=config.get('MAIL_SERVER', 'localhost'),
+            port=int(config.get('MAIL_PORT', 25)),
+            use_tls=bool(config.get('MAIL_USE_TLS')),
+            use_ssl=bool(config.get('MAIL_USE_SSL')),
+            username=config.get('MAIL_USERNAME'),
+            password=config.get('MAIL_PASSWORD'),
+            timeout=EMAIL_OUTBOX["SMTP_TIMEOUT_SECONDS"],
+            idle_close=EMAIL_OUTBOX["IDLE_CLOSE_SECONDS"]
+        )
+        self.start()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._send_loop, daemon=True)
+            self._thread.start()
+
+    def enqueue(self, subject: str, recipients: List[str], body: str,
+                html: Optional[str] = None, sender: Optional[str] = None) -> int:
+        """
+        Guarda un correo para enviarlo en segundo plano
+
+        Returns:
+            ID del mensaje en la bandeja de salida
+        """
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO outbox (created_at, sender, recipients, subject, body, html, next_attempt_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (now, sender, json.dumps(list(recipients)), subject, body, html, now)
+        )
+        self.stats["enqueued"] += 1
+        self._wake.set()
+        return cursor.lastrowid
+
+    def _claim(self, now: float) -> List[sqlite3.Row]:
+        """Reserva un lote de mensajes pendientes para este proceso"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, created_at, sender, recipients, subject, body, html, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt_at <= ? AND lease_until <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (now, now, self.batch_size)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE outbox SET lease_until = ? WHERE id = ?",
+                    [(now + self.lease_seconds, row[0]) for row in rows]
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _build_message(self, row) -> EmailMessage:
+        _, _, sender, recipients, subject, body, html, _ = row
+        message = EmailMessage()
+        message['Subject'] = subject
+        message['From'] = sender or self.default_sender or 'no-reply@localhost'
+        message['To'] = ', '.join(json.loads(recipients))
+        message['Date'] = formatdate(localtime=True)
+        message['Message-ID'] = make_msgid()
+        message.set_content(body or '')
+        if html:
+            message.add_alternative(html, subtype='html')
+        return message
+
+    def _mark_sent(self, message_id: int, created_at: float, now: float):
+        # El contenido puede incluir enlaces de recuperación: no se conserva
+        self._conn().execute(
+            "UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, "
+            "body = NULL, html = NULL, last_error = NULL WHERE id = ?",
+            (now, message_id)
+        )
+        self.stats["sent"] += 1
+        self._latencies.append(now - created_at)
+
+    def _mark_failed(self, message_id: int, attempts: int, error: Exception, now: float):
+        attempts += 1
+        if attempts >= self.max_attempts or _is_permanent(error):
+            self._conn().execute(
+                "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ?, body = NULL, html = NULL "
+                "WHERE id = ?",
+                (attempts, str(error)[:500], message_id)
+            )
+            self.stats["failed"] += 1
+            logger.error(f"Correo {message_id} descartado tras {attempts} intentos: {str(error)}")
+            return
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+        self._conn().execute(
+            "UPDATE outbox SET attempts = ?, next_attempt_at = ?, lease_until = 0, last_error = ? WHERE id = ?",
+            (attempts, now + delay, str(error)[:500], message_id)
+        )
+        self.stats["retries"] += 1
+        logger.warning(f"Correo {message_id}: intento {attempts} fallido, reintento en {delay:g} s: {str(error)}")
+
+    def _renew(self, message_id: int, lease_until: float, now: float) -> Optional[float]:
+        """
+        Extiende el lease de un mensaje justo antes de enviarlo
+
+        Returns:
+            El nuevo vencimiento, o None si el mensaje ya no tiene el lease
+            reclamado (venció y otro worker lo recogió, o ya no está pendiente)
+        """
+        renewed = now + self.lease_seconds
+        cursor = self._conn().execute(
+            "UPDATE outbox SET lease_until = ? WHERE id = ? AND status = 'pending' AND lease_until = ?",
+            (renewed, message_id, lease_until)
+        )
+        return renewed if cursor.rowcount == 1 else None
+
+    def _release(self, rows, lease_until: float):
+        # Sólo los que siguen con nuestro lease: otro worker puede haber recogido alguno
+        self._conn().executemany(
+            "UPDATE outbox SET lease_until = 0 WHERE id = ? AND lease_until = ?",
+            [(row[0], lease_until) for row in rows]
+        )
+
+    def send_pending(self) -> int:
+        """
+        Envía un lote de mensajes pendientes
+
+        Returns:
+            Número de mensajes reclamados (enviados o no)
+        """
+        if self.transport is None:
+            return 0
+        with self._send_lock:
+            now = time.time()
+            rows = self._claim(now)
+            if not rows:
+                return 0
+            lease_until = now + self.lease_seconds
+            self.stats["batches"] += 1
+            for index, row in enumerate(rows):
+                message_id, created_at, attempts = row[0], row[1], row[7]
+                # El lease del lote puede vencer antes de llegar a los últimos mensajes
+                if self._renew(message_id, lease_until, time.time()) is None:
+                    continue
+                try:
+                    self.transport.send(self._build_message(row))
+                except Exception as e:
+                    self._mark_failed(message_id, attempts, e, time.time())
+                    if _is_connection_error(e):
+                        # Sin conexión el resto del lote fallaría igual
+                        self.transport.close()
+                        self._release(rows[index + 1:], lease_until)
+                        break
+                    continue
+                self._mark_sent(message_id, created_at, time.time())
+            return len(rows)
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """Elimina los mensajes entregados hace más de RETENTION_SECONDS"""
+        now = now or time.time()
+        cursor = self._conn().execute(
+            "DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?",
+            (now - self.retention_seconds,)
+        )
+        return cursor.rowcount
+
+    def _send_loop(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                # Vaciar mientras salgan lotes completos
+                while self.send_pending() == self.batch_size:
+                    pass
+                self.transport.close_if_idle()
+                now = time.time()
+                if now - self._last_purge > 3600:
+                    self.purge(now)
+                    self._last_purge = now
+            except Exception as e:
+                logger.error(f"Error en el envío de correos: {str(e)}")
+
+    def metrics(self) -> Dict:
+        """Contadores de entrega y latencia desde que se encola hasta que se entrega"""
+        counts = dict(self._conn().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+        return {
+            **self.stats,
+            "pending": counts.get('pending', 0),
+            "failed_total": counts.get('failed', 0),
+            "connections": self.transport.connections if self.transport else 0,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+        }
+
+
+email_outbox = EmailOutbox(
+    path=EMAIL_OUTBOX["PATH"],
+    batch_size=EMAIL_OUTBOX["BATCH_SIZE"],
+    poll_interval=EMAIL_OUTBOX["POLL_INTERVAL_SECONDS"],
+    max_attempts=EMAIL_OUTBOX["MAX_ATTEMPTS"],
+    retry_base=EMAIL_OUTBOX["RETRY_BASE_SECONDS"],
+    retry_max=EMAIL_OUTBOX["RETRY_MAX_SECONDS"],
+    lease_seconds=EMAIL_OUTBOX["LEASE_SECONDS"],
+    retention_seconds=EMAIL_OUTBOX["RETENTION_SECONDS"]
+)
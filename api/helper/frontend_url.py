@@ -0,0 +1,81 @@
+"""
+URL base del frontend
+
+Los enlaces que salen del servidor (recuperación de contraseña, redirección de
+Google OAuth) necesitan la URL pública del frontend. Se resuelve una sola vez
+al arrancar, por este orden:
+    1. FRONTEND_URL
+    2. REPL_SLUG y REPL_OWNER: https://<slug>.<owner>.repl.co
+    3. REPL_IDENTITY: https://<identity>.repl.co
+    4. FRONTEND["DEFAULT_URL"]
+
+Una solicitud puede pedir otro origen con la cabecera Origin (p. ej. el
+frontend de desarrollo), pero sólo si está en FRONTEND["ALLOWED_ORIGINS"]: el
+enlace de recuperación se envía por correo y no debe poder apuntar a un
+dominio elegido por quien hace la solicitud.
+"""
+
+from typing import Iterable, Optional
+import logging
+import os
+
+from flask import has_request_context, request
+
+from config import FRONTEND
+
+logger = logging.getLogger("frontend_url")
+
+
+def _normalize(origin: str) -> str:
+    return origin.strip().rstrip('/').lower()
+
+
+def resolve_base_url(environ=os.environ, default: str = FRONTEND["DEFAULT_URL"]) -> str:
+    """URL base del frontend a partir del entorno (sin barra final)"""
+    configured = environ.get('FRONTEND_URL')
+    if configured:
+        return configured.strip().rstrip('/')
+    if environ.get('REPL_SLUG') and environ.get('REPL_OWNER'):
+        return f"https://{environ['REPL_SLUG']}.{environ['REPL_OWNER']}.repl.co"
+    if environ.get('REPL_IDENTITY'):
+        return f"https://{environ['REPL_IDENTITY']}.repl.co"
+    return default.rstrip('/')
+
+
+class FrontendURLResolver:
+    """URL base resuelta al arrancar más los orígenes que una solicitud puede pedir"""
+
+    def __init__(self, base_url: str, allowed_origins: Iterable[str] = ()):
+        self.base_url = base_url
+        # La URL base siempre es un origen válido
+        self._allowed = {_normalize(origin): origin.strip().rstrip('/')
+                         for origin in [base_url, *allowed_origins] if origin and origin.strip()}
+
+    def is_allowed(self, origin: Optional[str]) -> bool:
+        return bool(origin) and _normalize(origin) in self._allowed
+
+    def for_request(self, origin: Optional[str] = None) -> str:
+        """
+        URL base para la solicitud actual
+
+        Args:
+            origin: Origen pedido (por defecto la cabecera Origin de la solicitud)
+
+        Returns:
+            El origen si está permitido; si no, la URL base
+        """
+        if origin is None and has_request_context():
+            origin = request.headers.get('Origin')
+        if origin:
+            allowed = self._allowed.get(_normalize(origin))
+            if allowed:
+                return allowed
+        return self.base_url
+
+    def url(self, path: str, origin: Optional[str] = None) -> str:
+        """URL absoluta del frontend para una ruta"""
+        return f"{self.for_request(origin)}/{path.lstrip('/')}"
+
+
+frontend_urls = FrontendURLResolver(resolve_base_url(), FRONTEND["ALLOWED_ORIGINS"])
+logger.info(f"URL base del frontend: {frontend_urls.base_url}")
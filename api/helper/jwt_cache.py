@@ -0,0 +1,141 @@
+"""
+Caché de JWT verificados
+
+El mismo access token llega en cada solicitud durante sus 15 minutos de vida.
+CachingJWTManager guarda los claims ya verificados en un LRU acotado cuya clave
+es el SHA-256 del token, de modo que las solicitudes repetidas no vuelven a
+verificar la firma HMAC ni a parsear el JSON de los claims.
+
+Cada entrada caduca como tarde en el exp del token. La caché sólo sustituye la
+decodificación: flask-jwt-extended sigue llamando a token_in_blocklist_loader
+y a user_lookup_loader en cada solicitud, así que una sesión revocada se
+rechaza aunque su token esté en caché.
+
+Con JWT_TOKEN_PROFILE["MODE"] = "compact" los access tokens se emiten sólo con
+sub, exp y los claims de sesión (más csrf si está activo): sin iat, jti, type
+ni fresh, que flask-jwt-extended rellena al decodificar. La cookie que viaja en
+cada solicitud es más corta y más barata de firmar y verificar.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import hashlib
+import threading
+import time
+import uuid
+
+import jwt as pyjwt
+from flask_jwt_extended import JWTManager
+from flask_jwt_extended.config import config
+
+from config import JWT_VERIFIED_CACHE, JWT_TOKEN_PROFILE
+
+
+class VerifiedTokenCache:
+    """LRU de digest del token -> (claims verificados, expiración)"""
+
+    def __init__(self, max_entries: int = 10000, max_ttl: float = 900):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def digest(encoded_token: str) -> bytes:
+        return hashlib.sha256(encoded_token.encode('utf-8')).digest()
+
+    def get(self, key: bytes) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            claims, expires_at = entry
+            if now >= expires_at:
+                del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        # Copia: quien recibe los claims puede modificarlos
+        return dict(claims)
+
+    def put(self, key: bytes, claims: Dict):
+        now = time.time()
+        expires_at = now + self.max_ttl
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        if expires_at <= now:
+            return
+
+        with self._lock:
+            self._entries[key] = (dict(claims), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager que reutiliza los claims de tokens ya verificados y emite access tokens compactos"""
+
+    def __init__(self, app=None, cache: Optional[VerifiedTokenCache] = None, **kwargs):
+        self.verified_cache = cache or VerifiedTokenCache(
+            max_entries=JWT_VERIFIED_CACHE["MAX_ENTRIES"],
+            max_ttl=JWT_VERIFIED_CACHE["MAX_TTL_SECONDS"]
+        )
+        super().__init__(app, **kwargs)
+
+    def _encode_jwt_from_config(self, identity, token_type, claims=None, fresh=False,
+                                expires_delta=None, headers=None) -> str:
+        # Refresh tokens y tokens fresh conservan el formato completo
+        if token_type != "access" or fresh or JWT_TOKEN_PROFILE["MODE"] != "compact":
+            return super()._encode_jwt_from_config(identity, token_type, claims, fresh, expires_delta, headers)
+
+        header_overrides = self._jwt_additional_header_callback(identity)
+        if headers is not None:
+            header_overrides.update(headers)
+
+        payload = self._user_claims_callback(identity)
+        if claims is not None:
+            payload.update(claims)
+        payload[config.identity_claim_key] = self._user_identity_callback(identity)
+
+        if expires_delta is None:
+            expires_delta = config.access_expires
+        if expires_delta:
+            payload["exp"] = datetime.now(timezone.utc) + expires_delta
+        if config.cookie_csrf_protect:
+            payload["csrf"] = str(uuid.uuid4())
+        if config.encode_issuer:
+            payload["iss"] = config.encode_issuer
+        if config.encode_audience:
+            payload["aud"] = config.encode_audience
+
+        return pyjwt.encode(
+            payload,
+            self._encode_key_callback(identity),
+            algorithm=config.algorithm,
+            json_encoder=config.json_encoder,
+            headers=header_overrides
+        )
+
+    def _decode_jwt_from_config(self, encoded_token: str, csrf_value=None, allow_expired: bool = False) -> dict:
+        # La verificación CSRF y los tokens expirados siguen el camino normal
+        if csrf_value or allow_expired or not JWT_VERIFIED_CACHE["ENABLED"]:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = self.verified_cache.digest(encoded_token)
+        claims = self.verified_cache.get(key)
+        if claims is None:
+            claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+            self.verified_cache.put(key, claims)
+        return claims
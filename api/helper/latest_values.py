@@ -0,0 +1,86 @@
+"""
+Tabla materializada del último valor por métrica
+
+Mantiene, por (paciente, condición), la lectura más reciente de cada métrica
+junto con su valor formateado, fecha y color de resaltado. Se actualiza en la
+ingesta, de modo que las tarjetas de condiciones se construyen con una búsqueda
+por clave en lugar de recorrer el historial de lecturas.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+import threading
+
+from helper.condition_catalog import METRICS_BY_KEY, value_color, format_metric_value
+
+LatestValue = namedtuple('LatestValue', ['value', 'timestamp', 'value_color', 'value_text', 'date_recorded'])
+
+
+class LatestValueTable:
+    """Último valor por (paciente, condición, métrica)"""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[int, int], Dict[str, LatestValue]] = {}
+        # Pacientes con al menos una lectura registrada
+        self._patients: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def update(self, patient_id: int, key: str, timestamp: float, value: float) -> bool:
+        """
+        Registra una lectura si es más reciente que la almacenada
+
+        Returns:
+            True si la lectura pasó a ser el último valor de la métrica
+        """
+        return self.update_many([(patient_id, key, timestamp, value)]) > 0
+
+    def update_many(self, readings: List[Tuple[int, str, float, float]]) -> int:
+        """
+        Registra un lote de lecturas (patient_id, key, timestamp, valor)
+
+        Cada entrada se reemplaza por una tupla inmutable, así que los lectores
+        nunca ven un valor sin su fecha o su color correspondiente.
+
+        Returns:
+            Número de métricas cuyo último valor cambió
+        """
+        updated = 0
+        with self._lock:
+            for patient_id, key, timestamp, value in readings:
+                metric = METRICS_BY_KEY.get(key)
+                if metric is None:
+                    continue
+
+                metrics = self._entries.get((patient_id, metric["condition_id"]))
+                if metrics is None:
+                    metrics = {}
+                    self._entries[(patient_id, metric["condition_id"])] = metrics
+                    self._patients.add(patient_id)
+
+                current = metrics.get(key)
+                if current is not None and current.timestamp > timestamp:
+                    # Lectura atrasada: el historial la conserva pero no es la última
+                    continue
+
+                metrics[key] = LatestValue(
+                    value=value,
+                    timestamp=timestamp,
+                    value_color=value_color(key, value),
+                    value_text=format_metric_value(value),
+                    date_recorded=datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+                )
+                updated += 1
+        return updated
+
+    def get(self, patient_id: int, condition_id: int) -> Dict[str, LatestValue]:
+        """Obtiene los últimos valores de las métricas de una condición"""
+        return self._entries.get((patient_id, condition_id), {})
+
+    def has_readings(self, patient_id: int) -> bool:
+        """Si el paciente tiene alguna lectura registrada"""
+        return patient_id in self._patients
+
+
+# Instancia compartida de la tabla
+latest_values = LatestValueTable()
@@ -0,0 +1,119 @@
+"""
+Limitación de intentos de login por cuenta
+
+El rate limiting por IP no frena el credential stuffing repartido entre muchas
+IPs contra una misma cuenta. LoginThrottle cuenta los fallos por email y, a
+partir de FREE_FAILURES, exige esperar un tiempo que se duplica con cada fallo
+(hasta MAX_DELAY_SECONDS). La comprobación se hace antes de consultar la base
+de datos o verificar el hash, de modo que un intento bloqueado no cuesta CPU ni
+una consulta a MySQL.
+
+Estado compacto y acotado: un LRU de como mucho MAX_ACCOUNTS entradas cuya
+clave es un digest de 64 bits del email normalizado (no se guardan emails) y
+cuyo valor es (puntuación de fallos, instante del último fallo). La puntuación
+decae a la mitad cada DECAY_HALF_LIFE_SECONDS, así que una cuenta con fallos
+antiguos vuelve sola a no tener espera.
+
+Los emails inexistentes se cuentan igual que los existentes para no revelar
+qué cuentas existen.
+"""
+
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import threading
+import time
+
+from config import LOGIN_THROTTLE
+
+
+def _account_key(email: str) -> int:
+    normalized = email.strip().lower().encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(normalized, digest_size=8).digest(), 'little')
+
+
+class LoginThrottle:
+    """Contadores de fallos de login por cuenta con espera exponencial"""
+
+    def __init__(self, max_accounts: int = 100000, free_failures: int = 3,
+                 base_delay: float = 1.0, max_delay: float = 900.0, half_life: float = 900.0):
+        self.max_accounts = max_accounts
+        self.free_failures = free_failures
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.half_life = half_life
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"throttled": 0, "failures": 0, "evictions": 0}
+
+    def _delay(self, score: float) -> float:
+        """Espera exigida tras alcanzar una puntuación de fallos"""
+        excess = int(score + 1e-9) - self.free_failures
+        if excess <= 0:
+            return 0.0
+        if excess > 30:
+            return self.max_delay
+        return min(self.max_delay, self.base_delay * (1 << (excess - 1)))
+
+    def retry_after(self, email: str, now: Optional[float] = None) -> float:
+        """
+        Segundos que debe esperar la cuenta antes de otro intento
+
+        Returns:
+            0 si se permite el intento
+        """
+        if now is None:
+            now = time.time()
+        key = _account_key(email)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0.0
+            score, last_failure = entry
+            wait = last_failure + self._delay(score) - now
+            if wait <= 0:
+                return 0.0
+            self.stats["throttled"] += 1
+        return wait
+
+    def record_failure(self, email: str, now: Optional[float] = None) -> float:
+        """
+        Registra un intento fallido
+
+        Returns:
+            Segundos de espera exigidos a partir de este fallo
+        """
+        if now is None:
+            now = time.time()
+        key = _account_key(email)
+        with self._lock:
+            entry = self._entries.get(key)
+            score = 0.0
+            if entry is not None:
+                previous, last_failure = entry
+                score = previous * 0.5 ** (max(0.0, now - last_failure) / self.half_life)
+            score += 1.0
+            self._entries[key] = (score, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_accounts:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self.stats["failures"] += 1
+        return self._delay(score)
+
+    def record_success(self, email: str):
+        """Un login correcto borra los fallos de la cuenta"""
+        with self._lock:
+            self._entries.pop(_account_key(email), None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+login_throttle = LoginThrottle(
+    max_accounts=LOGIN_THROTTLE["MAX_ACCOUNTS"],
+    free_failures=LOGIN_THROTTLE["FREE_FAILURES"],
+    base_delay=LOGIN_THROTTLE["BASE_DELAY_SECONDS"],
+    max_delay=LOGIN_THROTTLE["MAX_DELAY_SECONDS"],
+    half_life=LOGIN_THROTTLE["DECAY_HALF_LIFE_SECONDS"]
+)
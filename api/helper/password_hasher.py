@@ -0,0 +1,279 @@
+"""
+Hash de contraseñas en un pool de procesos acotado
+
+generate_password_hash y check_password_hash (scrypt/pbkdf2) cuestan decenas de
+milisegundos de CPU. Ejecutados en el hilo de la solicitud compiten por la CPU
+y el GIL con el resto de solicitudes del worker, y un pico de logins deja al
+worker sin responder a nada más.
+
+PasswordHasher los ejecuta en un pool de procesos dedicado de WORKERS procesos.
+Como mucho MAX_PENDING operaciones pueden estar en curso o en cola; a partir de
+ahí la solicitud se rechaza al instante con PasswordHashPoolSaturated (503 con
+Retry-After) en lugar de acumular espera. Con WORKERS = 0 el hash se calcula
+en el hilo de la solicitud, como antes.
+
+El pool se crea en el primer uso de cada proceso, de modo que cada worker de
+gunicorn tiene el suyo y no hereda el del proceso maestro. Sus procesos se
+inician con forkserver (START_METHOD): para entonces el worker ya tiene hilos en
+marcha (buffer de métricas, bandeja de correo, limpieza del rate limiter) y un
+fork copiaría locks que otro hilo tuviera tomados. El servidor de forkserver
+sólo precarga este módulo.
+
+Coste adaptativo: salvo que METHOD fije los parámetros, calibrate() mide al
+arrancar (init_app) el hash en la máquina actual y elige los de ALGORITHM que más se acercan a
+TARGET_MS por hash sin bajar de los mínimos configurados (scrypt: n potencia de
+dos, memoria acotada por SCRYPT_MAX_MEMORY_MB y p para el tiempo restante;
+pbkdf2: iteraciones). needs_rehash() indica si un hash guardado es de otro
+algoritmo o más barato que los parámetros actuales; el login lo recalcula
+entonces con la contraseña en claro. Nunca se rebaja un hash más caro, así que
+workers que calibren algo distinto no se pisan entre sí.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import PASSWORD_HASHING
+from helper.response_utils import error_response
+
+logger = logging.getLogger("password_hasher")
+
+
+class PasswordHashPoolSaturated(Exception):
+    """El pool de hash está lleno o no respondió a tiempo"""
+
+
+def _generate(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+
+def _check(pwhash: str, password: str) -> bool:
+    return check_password_hash(pwhash, password)
+
+
+def hash_cost(pwhash: str) -> Tuple[str, int]:
+    """
+    Familia y coste relativo de un hash de werkzeug
+
+    Returns:
+        ('scrypt', n·r·p), ('pbkdf2:<digest>', iteraciones) o (prefijo, 0) si
+        el formato no se reconoce o no lleva parámetros
+    """
+    method = pwhash.split('$', 1)[0] if pwhash else ''
+    name, *args = method.split(':')
+    try:
+        if name == 'scrypt' and len(args) == 3:
+            n, r, p = map(int, args)
+            return 'scrypt', n * r * p
+        if name == 'pbkdf2' and len(args) == 2:
+            return f"pbkdf2:{args[0]}", int(args[1])
+    except ValueError:
+        pass
+    return (f"pbkdf2:{args[0]}" if name == 'pbkdf2' and args else name), 0
+
+
+def _time_hash(function, repeat: int = 2) -> float:
+    """Mejor tiempo en ms de varias ejecuciones (descarta el ruido de arranque)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def calibrate(algorithm: str = 'scrypt', target_ms: float = 100.0, min_scrypt_n: int = 2 ** 15,
+              scrypt_max_memory_mb: int = 64, min_pbkdf2_iterations: int = 600000) -> str:
+    """
+    Parámetros de hash que cuestan unos target_ms en esta máquina
+
+    Returns:
+        Método para generate_password_hash, p. ej. 'scrypt:65536:8:1'
+    """
+    password, salt = b'calibracion', b'0123456789abcdef'
+    if algorithm == 'scrypt':
+        r = 8
+        n = 1 << 14
+        elapsed = _time_hash(lambda: hashlib.scrypt(password, salt=salt, n=n, r=r, p=1, maxmem=132 * n * r))
+        max_n = max(min_scrypt_n, (scrypt_max_memory_mb * 1024 * 1024) // (128 * r))
+        # El tiempo de scrypt es lineal en n: duplicar mientras quepa en el objetivo
+        while n * 2 <= max_n and (elapsed * 2 <= target_ms or n < min_scrypt_n):
+            n *= 2
+            elapsed *= 2
+        # Sin más memoria disponible, p alarga el cálculo sin aumentarla
+        p = max(1, int(target_ms // elapsed)) if elapsed > 0 else 1
+        return f"scrypt:{n}:{r}:{p}"
+
+    if algorithm.startswith('pbkdf2'):
+        digest = algorithm.split(':', 1)[1] if ':' in algorithm else 'sha256'
+        sample = 100000
+        elapsed = _time_hash(lambda: hashlib.pbkdf2_hmac(digest, password, salt, sample))
+        iterations = int(sample * target_ms / elapsed) if elapsed > 0 else min_pbkdf2_iterations
+        iterations = max(min_pbkdf2_iterations, iterations // 10000 * 10000)
+        return f"pbkdf2:{digest}:{iterations}"
+
+    raise ValueError(f"Algoritmo de hash desconocido: {algorithm}")
+
+
+class PasswordHasher:
+    """Pool de procesos acotado para calcular y verificar hashes de contraseña"""
+
+    def __init__(self, workers: int = 2, max_pending: int = 32, timeout: float = 10.0,
+                 start_method: str = 'forkserver', method: Optional[str] = None, calibration: Optional[dict] = None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._method = method
+        self._calibration = calibration or {}
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = {"completed": 0, "rejected": 0, "timeouts": 0, "restarts": 0, "rehashed": 0}
+
+    def init_app(self, app=None):
+        """Calibra los parámetros al arrancar la aplicación, no en el primer login"""
+        return self.method
+
+    @property
+    def method(self) -> str:
+        """Parámetros actuales (calibrados en init_app, o en el primer uso si no están fijados)"""
+        if self._method is None:
+            with self._lock:
+                if self._method is None:
+                    start = time.perf_counter()
+                    self._method = calibrate(**self._calibration)
+                    logger.info(f"Hash de contraseñas calibrado: {self._method} "
+                                f"(calibración en {(time.perf_counter() - start) * 1000:.0f} ms)")
+        return self._method
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """Si el hash es de otro algoritmo o más barato que los parámetros actuales"""
+        family, cost = hash_cost(pwhash)
+        current_family, current_cost = hash_cost(self.method)
+        return family != current_family or cost < current_cost
+
+    def rehash(self, pwhash: str, password: str) -> Optional[str]:
+        """
+        Nuevo hash con los parámetros actuales si el guardado está desfasado
+
+        Se llama tras verificar la contraseña. Si el pool está saturado no se
+        rehace (se reintentará en el próximo login).
+
+        Returns:
+            El nuevo hash, o None si no hace falta o no se pudo calcular
+        """
+        if not self.needs_rehash(pwhash):
+            return None
+        try:
+            new_hash = self.generate(password)
+        except PasswordHashPoolSaturated:
+            return None
+        self.stats["rehashed"] += 1
+        return new_hash
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        executor = self._executor
+        if executor is not None and self._pid == os.getpid():
+            return executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Tras un fork el pool heredado no pertenece a este proceso
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    context.set_forkserver_preload([__name__])
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+                logger.info(f"Pool de hash de contraseñas iniciado: {self.workers} procesos, "
+                            f"{self.max_pending} operaciones como máximo")
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.stats["restarts"] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, function, *args):
+        if self.workers <= 0:
+            return function(*args)
+
+        # Sin hueco libre se rechaza ya: esperar sólo alargaría la cola
+        if not self._slots.acquire(blocking=False):
+            self.stats["rejected"] += 1
+            raise PasswordHashPoolSaturated()
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset(executor)
+            raise PasswordHashPoolSaturated()
+        except BaseException:
+            self._slots.release()
+            raise
+        # El hueco se libera cuando el proceso termina, no cuando se deja de esperar
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.stats["timeouts"] += 1
+            raise PasswordHashPoolSaturated()
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise PasswordHashPoolSaturated()
+        self.stats["completed"] += 1
+        return result
+
+    def generate(self, password: str) -> str:
+        """Equivalente a generate_password_hash fuera del hilo de la solicitud"""
+        return self._run(_generate, password, self.method)
+
+    def check(self, pwhash: str, password: str) -> bool:
+        """Equivalente a check_password_hash fuera del hilo de la solicitud"""
+        return self._run(_check, pwhash, password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=True)
+
+
+def hashing_unavailable_response():
+    """Respuesta 503 cuando el pool de hash está saturado"""
+    response = error_response(
+        "El servicio está ocupado. Por favor, inténtelo de nuevo en unos segundos.",
+        503
+    )
+    response.headers['Retry-After'] = str(PASSWORD_HASHING["RETRY_AFTER_SECONDS"])
+    return response
+
+
+password_hasher = PasswordHasher(
+    workers=PASSWORD_HASHING["WORKERS"],
+    max_pending=PASSWORD_HASHING["MAX_PENDING"],
+    timeout=PASSWORD_HASHING["TIMEOUT_SECONDS"],
+    start_method=PASSWORD_HASHING["START_METHOD"],
+    method=PASSWORD_HASHING["METHOD"] or None,
+    calibration={
+        "algorithm": PASSWORD_HASHING["ALGORITHM"],
+        "target_ms": PASSWORD_HASHING["TARGET_MS"],
+        "min_scrypt_n": PASSWORD_HASHING["MIN_SCRYPT_N"],
+        "scrypt_max_memory_mb": PASSWORD_HASHING["SCRYPT_MAX_MEMORY_MB"],
+        "min_pbkdf2_iterations": PASSWORD_HASHING["MIN_PBKDF2_ITERATIONS"]
+    }
+)
@@ -0,0 +1,176 @@
+"""
+Tabla de rate limiting compartida entre procesos
+
+Los workers de la máquina mapean el mismo archivo, de modo que "5 logins por
+minuto" son 5 en total y no 5 por worker. La tabla es de tamaño fijo:
+
+    cabecera   64 bytes: b"RLTB", versión u16, buckets u32
+    buckets    n buckets de 8 slots; cada slot es (digest u64, TAT f64)
+
+Cada clave (namespace del limitador + clave de la solicitud) se reduce a un
+digest BLAKE2b de 64 bits estable entre procesos y cae siempre en el mismo
+bucket. Un slot cuyo TAT ya pasó equivale a un slot vacío, así que la tabla
+no necesita limpieza: cuando un bucket está lleno se reutiliza el slot con el
+TAT más antiguo.
+
+Cada bucket pertenece a una partición protegida por un lock de thread y un
+lock fcntl sobre un byte del archivo (los locks fcntl son por proceso).
+"""
+
+from typing import Optional, Tuple
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger("rate_limit_table")
+
+MAGIC = b"RLTB"
+FORMAT_VERSION = 1
+HEADER_SIZE = 64
+BUCKET_SLOTS = 8
+
+_HEADER = struct.Struct('<4sHI')
+_SLOT = struct.Struct('<Qd')
+_BUCKET = struct.Struct('<' + 'Qd' * BUCKET_SLOTS)
+BUCKET_SIZE = _BUCKET.size
+
+# Tolerancia para el error de redondeo al sumar intervalos de emisión
+_EPSILON = 1e-9
+
+
+def key_digest(namespace: str, key: str) -> int:
+    """Digest de 64 bits de una clave, igual en todos los procesos"""
+    data = f"{namespace}|{key}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+class SharedRateTable:
+    """Tabla GCRA (digest -> TAT) en un archivo mapeado por todos los workers"""
+
+    def __init__(self, path: str, slots: int = 1 << 20, stripes: int = 64):
+        if fcntl is None:
+            raise RuntimeError("La tabla de rate limiting compartida requiere fcntl")
+        self.path = path
+        self.buckets = max(1, slots // BUCKET_SLOTS)
+        self.stripes = stripes
+        self.size = HEADER_SIZE + self.buckets * BUCKET_SIZE
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = self._open()
+        self._map = mmap.mmap(self._fd, self.size)
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _open(self) -> int:
+        """
+        Abre la tabla, creándola si no existe
+
+        Si el archivo tiene otro tamaño o formato (p. ej. otro SHARED_SLOTS) se
+        sustituye por uno nuevo en lugar de truncarlo: los procesos que aún
+        tienen mapeado el anterior siguen usándolo sin leer fuera del mapeo.
+        """
+        expected = _HEADER.pack(MAGIC, FORMAT_VERSION, self.buckets)
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            # Lock sobre todo el archivo: serializa la creación entre procesos
+            fcntl.lockf(fd, fcntl.LOCK_EX, 0, 0)
+            try:
+                stat = os.fstat(fd)
+                try:
+                    current = os.stat(self.path).st_ino == stat.st_ino
+                except FileNotFoundError:
+                    current = False
+
+                # Si otro proceso sustituyó el archivo mientras esperábamos el lock, se reabre
+                if current:
+                    if stat.st_size == 0:
+                        os.ftruncate(fd, self.size)
+                        os.pwrite(fd, expected, 0)
+                        return fd
+                    if stat.st_size == self.size and os.pread(fd, _HEADER.size, 0) == expected:
+                        return fd
+
+                    logger.warning(f"Tabla de rate limiting {self.path} con otro tamaño o formato: se sustituye")
+                    os.unlink(self.path)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 0, 0)
+            os.close(fd)
+
+    def hit(self, digest: int, interval: float, tolerance: float,
+            now: Optional[float] = None) -> Tuple[bool, float, float]:
+        """
+        Cuenta una solicitud de la clave con el algoritmo GCRA
+
+        Args:
+            interval: Intervalo de emisión (per_seconds / max_requests)
+            tolerance: Cuánto puede ir el TAT por delante del reloj
+                ((max_requests - 1) * interval)
+
+        Returns:
+            Tupla (permitida, segundos hasta que se permita la siguiente,
+            segundos hasta recuperar el cupo completo)
+        """
+        if now is None:
+            now = time.time()
+        bucket = digest % self.buckets
+        offset = HEADER_SIZE + bucket * BUCKET_SIZE
+        stripe = bucket % self.stripes
+
+        with self._locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                values = _BUCKET.unpack_from(self._map, offset)
+                slot = -1
+                victim = 0
+                victim_tat = values[1]
+                tat = now
+                for i in range(0, 2 * BUCKET_SLOTS, 2):
+                    if values[i] == digest:
+                        slot = i >> 1
+                        tat = values[i + 1]
+                        break
+                    if values[i + 1] < victim_tat:
+                        victim = i >> 1
+                        victim_tat = values[i + 1]
+                if slot < 0:
+                    # Clave nueva: ocupa el slot expirado (o el más antiguo) del bucket
+                    slot = victim
+
+                if tat < now:
+                    tat = now
+                wait = tat - tolerance - now
+                if wait > _EPSILON:
+                    return False, wait, tat - now
+                new_tat = tat + interval
+                _SLOT.pack_into(self._map, offset + slot * _SLOT.size, digest, new_tat)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+        return True, 0.0, new_tat - now
+
+    def count_active(self, now: Optional[float] = None) -> int:
+        """Número de slots con un TAT futuro (lectura sin locks, aproximada)"""
+        if now is None:
+            now = time.time()
+        active = 0
+        for offset in range(HEADER_SIZE, self.size, BUCKET_SIZE):
+            values = _BUCKET.unpack_from(self._map, offset)
+            active += sum(1 for tat in values[1::2] if tat > now)
+        return active
+
+    def clear(self):
+        """Vacía la tabla para todos los procesos"""
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 0, 0)
+        try:
+            self._map[HEADER_SIZE:self.size] = bytes(self.size - HEADER_SIZE)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 0, 0)
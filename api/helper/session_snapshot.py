@@ -0,0 +1,190 @@
+"""
+Snapshots binarios de las sesiones y la denylist en memoria
+
+Permiten que un reinicio o despliegue conserve las sesiones activas en lugar
+de obligar a todos los usuarios a iniciar sesión de nuevo a la vez.
+
+Formato (little-endian):
+    cabecera     b"TMSS", versión u16, creado u32
+    usuario      tag 1, longitud u16, user_id utf-8, n u16, n registros de 20 bytes
+    denylist     tag 2, n u32, n registros de 20 bytes
+    épocas       tag 3, n u32, n veces (longitud u16, user_id utf-8, época u32)
+    fin          tag 0, crc32 u32 de todo lo anterior
+
+Los registros son los mismos que usa MemorySessionStore (UUID de 16 bytes +
+expiración en segundos), así que se escriben y cargan sin conversión. El
+archivo se escribe en un temporal, se sincroniza y se renombra sobre el
+anterior: un fallo a mitad de escritura deja intacto el último snapshot.
+"""
+
+from typing import Tuple
+import logging
+import os
+import struct
+import time
+import zlib
+
+from helper.session_store import MemorySessionStore, RECORD_SIZE
+
+logger = logging.getLogger("session_snapshot")
+
+MAGIC = b"TMSS"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sHI')
+_TAG = struct.Struct('<B')
+_USER = struct.Struct('<H')
+_COUNT_USER = struct.Struct('<H')
+_COUNT = struct.Struct('<I')
+_EPOCH = struct.Struct('<I')
+_CRC = struct.Struct('<I')
+
+TAG_END = 0
+TAG_USER = 1
+TAG_DENIED = 2
+TAG_EPOCH = 3
+
+
+class SnapshotError(Exception):
+    """Snapshot truncado, corrupto o de una versión desconocida"""
+
+
+class _ChecksumWriter:
+    def __init__(self, file):
+        self.file = file
+        self.crc = 0
+
+    def write(self, data: bytes):
+        self.crc = zlib.crc32(data, self.crc)
+        self.file.write(data)
+
+
+class _ChecksumReader:
+    def __init__(self, file):
+        self.file = file
+        self.crc = 0
+
+    def read(self, size: int) -> bytes:
+        data = self.file.read(size)
+        if len(data) != size:
+            raise SnapshotError("Snapshot truncado")
+        self.crc = zlib.crc32(data, self.crc)
+        return data
+
+
+def write_snapshot(store: MemorySessionStore, path: str) -> Tuple[int, int]:
+    """
+    Escribe un snapshot atómico del almacén
+
+    Las sesiones se copian antes que la denylist: si una sesión se revoca
+    mientras se escribe, el snapshot la contiene ya denegada o no la contiene.
+
+    Returns:
+        Tupla (sesiones, entradas de denylist) escritas
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    sessions = 0
+    denied = 0
+
+    with open(tmp_path, 'wb', buffering=1024 * 1024) as file:
+        out = _ChecksumWriter(file)
+        out.write(_HEADER.pack(MAGIC, FORMAT_VERSION, int(time.time())))
+
+        for user_id, records in store.iter_user_records():
+            encoded = user_id.encode('utf-8')
+            count = len(records) // RECORD_SIZE
+            out.write(_TAG.pack(TAG_USER) + _USER.pack(len(encoded)) + encoded + _COUNT_USER.pack(count))
+            out.write(records)
+            sessions += count
+
+        for records in store.iter_denylist_records():
+            count = len(records) // RECORD_SIZE
+            out.write(_TAG.pack(TAG_DENIED) + _COUNT.pack(count))
+            out.write(records)
+            denied += count
+
+        # Las épocas (modo epoch) no expiran: perderlas revalidaría tokens revocados
+        for entries in store.iter_epochs():
+            block = bytearray(_TAG.pack(TAG_EPOCH) + _COUNT.pack(len(entries)))
+            for user_id, epoch in entries:
+                encoded = user_id.encode('utf-8')
+                block += _USER.pack(len(encoded)) + encoded + _EPOCH.pack(epoch)
+            out.write(bytes(block))
+
+        out.write(_TAG.pack(TAG_END))
+        file.write(_CRC.pack(out.crc))
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(tmp_path, path)
+    # Persistir también la entrada del directorio tras el renombrado
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+    return sessions, denied
+
+
+def load_snapshot(store: MemorySessionStore, path: str) -> Tuple[int, int]:
+    """
+    Carga un snapshot en el almacén leyéndolo por bloques
+
+    Descarta las entradas ya expiradas. Si el archivo está dañado se vacía el
+    almacén por completo: cargar sesiones sin su denylist podría revivir
+    sesiones revocadas.
+
+    Returns:
+        Tupla (sesiones, entradas de denylist) cargadas
+    """
+    if not os.path.exists(path):
+        return 0, 0
+
+    now = time.time()
+    sessions = 0
+    denied = 0
+
+    try:
+        with open(path, 'rb', buffering=1024 * 1024) as file:
+            source = _ChecksumReader(file)
+            magic, version, _ = _HEADER.unpack(source.read(_HEADER.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise SnapshotError(f"Formato de snapshot desconocido: {magic!r} v{version}")
+
+            while True:
+                tag, = _TAG.unpack(source.read(_TAG.size))
+                if tag == TAG_END:
+                    expected = source.crc
+                    stored, = _CRC.unpack(file.read(_CRC.size))
+                    if stored != expected:
+                        raise SnapshotError("Checksum del snapshot inválido")
+                    break
+                if tag == TAG_USER:
+                    length, = _USER.unpack(source.read(_USER.size))
+                    user_id = source.read(length).decode('utf-8')
+                    count, = _COUNT_USER.unpack(source.read(_COUNT_USER.size))
+                    sessions += store.restore_user(user_id, source.read(count * RECORD_SIZE), now)
+                elif tag == TAG_DENIED:
+                    count, = _COUNT.unpack(source.read(_COUNT.size))
+                    denied += store.restore_denied(source.read(count * RECORD_SIZE), now)
+                elif tag == TAG_EPOCH:
+                    count, = _COUNT.unpack(source.read(_COUNT.size))
+                    for _ in range(count):
+                        length, = _USER.unpack(source.read(_USER.size))
+                        user_id = source.read(length).decode('utf-8')
+                        epoch, = _EPOCH.unpack(source.read(_EPOCH.size))
+                        store.restore_epoch(user_id, epoch)
+                else:
+                    raise SnapshotError(f"Bloque desconocido en el snapshot: {tag}")
+    except (SnapshotError, struct.error, UnicodeDecodeError) as e:
+        logger.error(f"Snapshot de sesiones descartado ({path}): {str(e)}")
+        store.clear()
+        return 0, 0
+
+    return sessions, denied
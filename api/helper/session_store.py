@@ -0,0 +1,786 @@
+"""
+Almacenes de sesiones activas y denylist para el TokenManager
+
+- MemorySessionStore: particiones en memoria del proceso (un solo worker).
+- SQLiteSessionStore: base de datos SQLite en modo WAL compartida por todos los
+  workers de la máquina, con una caché de lectura por proceso.
+
+La caché de SQLite sólo guarda resultados que dejan de ser ciertos cuando una
+sesión se revoca ("la sesión existe", "la sesión no está denegada"). Cada
+revocación incrementa un contador de versión en un archivo mapeado en memoria;
+los demás procesos lo leen sin llamadas al sistema y descartan su caché cuando
+cambia. Registrar sesiones nuevas no invalida la caché.
+
+Todas las expiraciones se expresan en segundos epoch (time.time()). La
+limpieza sólo toca las entradas vencidas: en memoria cada partición mantiene un
+min-heap por expiración y en SQLite hay índices sobre expires_at.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import heapq
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class SessionStore:
+    """Interfaz común de los almacenes de sesiones"""
+
+    def add_session(self, user_id: str, session_id: str, expires_at: float) -> List[str]:
+        """Registra la sesión; devuelve los session_id desalojados por el tope por usuario"""
+        raise NotImplementedError
+
+    def get_session_expiry(self, user_id: str, session_id: str) -> Optional[float]:
+        """Expiración de la sesión o None si no está registrada para el usuario"""
+        raise NotImplementedError
+
+    def remove_session(self, user_id: str, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def revoke_users(self, user_ids: Iterable[str], deny_until: float) -> Dict[str, List[str]]:
+        """
+        Retira todas las sesiones de los usuarios y las añade a la denylist en
+        una sola sección crítica; devuelve los session_id revocados por usuario
+        """
+        raise NotImplementedError
+
+    def list_sessions(self, user_id: str) -> Dict[str, float]:
+        raise NotImplementedError
+
+    def deny(self, session_id: str, expires_at: float):
+        raise NotImplementedError
+
+    def is_denied(self, session_id: str, now: float) -> bool:
+        raise NotImplementedError
+
+    def get_epoch(self, user_id: str) -> int:
+        """Época de sesión del usuario (modo epoch); 0 si nunca se revocó"""
+        raise NotImplementedError
+
+    def bump_epochs(self, user_ids: Iterable[str]) -> Dict[str, int]:
+        """Incrementa la época de los usuarios, invalidando todos sus tokens; devuelve las nuevas"""
+        raise NotImplementedError
+
+    def purge_expired(self, now: float) -> Tuple[int, int]:
+        """Elimina entradas expiradas; devuelve (denylist, sesiones) eliminadas"""
+        raise NotImplementedError
+
+    def next_expiry(self) -> Optional[float]:
+        """Próxima expiración pendiente (aproximada), o None si no hay entradas"""
+        raise NotImplementedError
+
+    def _record_lock_hold(self, total: float, longest: float):
+        """Guarda cuánto tiempo retuvo locks la última limpieza (en ms)"""
+        stats = self.lock_hold
+        stats["last_total_ms"] = total * 1000
+        stats["last_max_ms"] = longest * 1000
+        stats["max_ms"] = max(stats["max_ms"], longest * 1000)
+
+
+# Registro de sesión compacto: 16 bytes del UUID + expiración en segundos (uint32)
+_RECORD = struct.Struct('<16sI')
+RECORD_SIZE = _RECORD.size
+
+
+def encode_session_id(session_id: str) -> Optional[bytes]:
+    """UUID en texto -> 16 bytes; None si el identificador no es un UUID"""
+    try:
+        raw = bytes.fromhex(session_id.replace('-', ''))
+    except (ValueError, AttributeError):
+        return None
+    return raw if len(raw) == 16 else None
+
+
+def decode_session_id(raw: bytes) -> str:
+    return str(uuid.UUID(bytes=bytes(raw)))
+
+
+def _find_record(records: bytearray, raw: bytes) -> int:
+    """Desplazamiento del registro con ese id dentro del buffer del usuario, o -1"""
+    offset = records.find(raw)
+    # Una coincidencia desalineada (bytes de dos registros vecinos) no cuenta
+    while offset != -1 and offset % RECORD_SIZE:
+        offset = records.find(raw, offset + 1)
+    return offset
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Sesiones y denylist en memoria del proceso, en formato compacto
+
+    Las sesiones se reparten en particiones según el hash del user_id y la
+    denylist según el hash del session_id; cada partición tiene su propio lock.
+
+    Cada usuario ocupa un único bytearray con registros de 20 bytes (UUID
+    binario + expiración en segundos enteros) ordenados del menos al más
+    recientemente usado. Al superar max_sessions_per_user se desalojan las
+    sesiones menos usadas. La expiración se programa con un min-heap por
+    partición de (expiración más próxima, user_id), una entrada por usuario:
+    al vencer se recorre sólo el buffer de ese usuario y se reprograma.
+    """
+
+    def __init__(self, stripes: int = 64, max_sessions_per_user: int = 10):
+        self.stripes = stripes
+        self.max_sessions_per_user = max_sessions_per_user
+        self.lock_hold = {"last_total_ms": 0.0, "last_max_ms": 0.0, "max_ms": 0.0}
+        # Contador de modificaciones, para saber si hace falta un snapshot nuevo
+        self.changes = 0
+        # Particiones de session_id (16 bytes) invalidados y su expiración en segundos
+        self._denylist: List[Dict[bytes, int]] = [{} for _ in range(stripes)]
+        self._denylist_locks = [threading.Lock() for _ in range(stripes)]
+        # Particiones de sesiones activas: user_id -> registros empaquetados
+        self._sessions: List[Dict[str, bytearray]] = [{} for _ in range(stripes)]
+        self._session_locks = [threading.Lock() for _ in range(stripes)]
+        # Heaps de expiración por partición: (expiración, user_id) y (expiración, session_id)
+        self._session_heaps: List[List[Tuple[int, str]]] = [[] for _ in range(stripes)]
+        self._denylist_heaps: List[List[Tuple[int, bytes]]] = [[] for _ in range(stripes)]
+        # Épocas por usuario (modo epoch), en la partición de sesiones del usuario
+        self._epochs: List[Dict[str, int]] = [{} for _ in range(stripes)]
+
+    def _session_stripe(self, user_id: str) -> int:
+        return hash(user_id) % self.stripes
+
+    def _denylist_stripe(self, raw: bytes) -> int:
+        return hash(raw) % self.stripes
+
+    @staticmethod
+    def _earliest(records: bytearray) -> int:
+        return min(expires_at for _, expires_at in _RECORD.iter_unpack(records))
+
+    def _schedule(self, stripe: int, user_id: str, expires_at: int):
+        heap = self._session_heaps[stripe]
+        heapq.heappush(heap, (expires_at, user_id))
+        if len(heap) > 2 * len(self._sessions[stripe]) + 1024:
+            self._compact_sessions(stripe)
+
+    def add_session(self, user_id: str, session_id: str, expires_at: float) -> List[str]:
+        raw = encode_session_id(session_id)
+        if raw is None:
+            raise ValueError(f"session_id debe ser un UUID: {session_id}")
+        expires_at = int(math.ceil(expires_at))
+        record = _RECORD.pack(raw, expires_at)
+        evicted = []
+
+        stripe = self._session_stripe(user_id)
+        with self._session_locks[stripe]:
+            self.changes += 1
+            partition = self._sessions[stripe]
+            records = partition.get(user_id)
+            if records is None:
+                partition[user_id] = bytearray(record)
+                self._schedule(stripe, user_id, expires_at)
+                return evicted
+
+            earliest = self._earliest(records)
+            offset = _find_record(records, raw)
+            if offset != -1:
+                # Renovación: pasa a ser la más recientemente usada
+                del records[offset:offset + RECORD_SIZE]
+            else:
+                # Desalojar las menos usadas si el usuario alcanzó el tope
+                excess = len(records) // RECORD_SIZE - self.max_sessions_per_user + 1
+                if excess > 0:
+                    evicted = [decode_session_id(old) for old, _ in
+                               _RECORD.iter_unpack(records[:excess * RECORD_SIZE])]
+                    del records[:excess * RECORD_SIZE]
+            records += record
+
+            if expires_at < earliest:
+                self._schedule(stripe, user_id, expires_at)
+        return evicted
+
+    def get_session_expiry(self, user_id: str, session_id: str) -> Optional[float]:
+        raw = encode_session_id(session_id)
+        if raw is None:
+            return None
+
+        stripe = self._session_stripe(user_id)
+        with self._session_locks[stripe]:
+            records = self._sessions[stripe].get(user_id)
+            if records is None:
+                return None
+            offset = _find_record(records, raw)
+            if offset == -1:
+                return None
+            _, expires_at = _RECORD.unpack_from(records, offset)
+            # Marcar como la más recientemente usada
+            if offset != len(records) - RECORD_SIZE:
+                record = records[offset:offset + RECORD_SIZE]
+                del records[offset:offset + RECORD_SIZE]
+                records += record
+            return expires_at
+
+    def remove_session(self, user_id: str, session_id: str) -> bool:
+        raw = encode_session_id(session_id)
+        if raw is None:
+            return False
+
+        stripe = self._session_stripe(user_id)
+        with self._session_locks[stripe]:
+            records = self._sessions[stripe].get(user_id)
+            if records is None:
+                return False
+            offset = _find_record(records, raw)
+            if offset == -1:
+                return False
+            del records[offset:offset + RECORD_SIZE]
+            self.changes += 1
+            # Si no quedan sesiones activas, eliminar entrada del usuario
+            if not records:
+                del self._sessions[stripe][user_id]
+            return True
+
+    def revoke_users(self, user_ids: Iterable[str], deny_until: float) -> Dict[str, List[str]]:
+        user_ids = list(dict.fromkeys(user_ids))
+        deny_until = int(math.ceil(deny_until))
+        popped: Dict[str, bytearray] = {}
+        held = []
+
+        # Orden global de locks: primero particiones de sesiones y luego de
+        # denylist, cada grupo en orden ascendente. Ninguna otra operación
+        # anida locks, así que dos revocaciones masivas no pueden bloquearse.
+        try:
+            for stripe in sorted({self._session_stripe(user_id) for user_id in user_ids}):
+                self._session_locks[stripe].acquire()
+                held.append(self._session_locks[stripe])
+
+            for user_id in user_ids:
+                records = self._sessions[self._session_stripe(user_id)].pop(user_id, None)
+                if records:
+                    popped[user_id] = records
+
+            revoked = [raw for records in popped.values() for raw, _ in _RECORD.iter_unpack(records)]
+            for stripe in sorted({self._denylist_stripe(raw) for raw in revoked}):
+                self._denylist_locks[stripe].acquire()
+                held.append(self._denylist_locks[stripe])
+
+            for raw in revoked:
+                stripe = self._denylist_stripe(raw)
+                self._denylist[stripe][raw] = deny_until
+                heapq.heappush(self._denylist_heaps[stripe], (deny_until, raw))
+            self.changes += 1
+        finally:
+            for lock in reversed(held):
+                lock.release()
+
+        return {
+            user_id: [decode_session_id(raw) for raw, _ in _RECORD.iter_unpack(records)]
+            for user_id, records in popped.items()
+        }
+
+    def list_sessions(self, user_id: str) -> Dict[str, float]:
+        stripe = self._session_stripe(user_id)
+        with self._session_locks[stripe]:
+            records = bytes(self._sessions[stripe].get(user_id, b''))
+        return {decode_session_id(raw): expires_at for raw, expires_at in _RECORD.iter_unpack(records)}
+
+    def get_epoch(self, user_id: str) -> int:
+        # Lectura de un dict sin lock: la época sólo crece y un valor viejo
+        # equivale a leer justo antes de la revocación
+        return self._epochs[self._session_stripe(user_id)].get(user_id, 0)
+
+    def bump_epochs(self, user_ids: Iterable[str]) -> Dict[str, int]:
+        epochs = {}
+        for user_id in dict.fromkeys(user_ids):
+            stripe = self._session_stripe(user_id)
+            with self._session_locks[stripe]:
+                epoch = self._epochs[stripe].get(user_id, 0) + 1
+                self._epochs[stripe][user_id] = epoch
+            epochs[user_id] = epoch
+        self.changes += 1
+        return epochs
+
+    def iter_epochs(self) -> Iterator[List[Tuple[str, int]]]:
+        """Recorre las épocas por usuario, una lista por partición"""
+        for stripe in range(self.stripes):
+            with self._session_locks[stripe]:
+                entries = list(self._epochs[stripe].items())
+            if entries:
+                yield entries
+
+    def restore_epoch(self, user_id: str, epoch: int):
+        stripe = self._session_stripe(user_id)
+        with self._session_locks[stripe]:
+            self._epochs[stripe][user_id] = max(epoch, self._epochs[stripe].get(user_id, 0))
+
+    def count_sessions(self) -> int:
+        """Número total de sesiones activas (aproximado, sin locks)"""
+        return sum(len(records) // RECORD_SIZE for partition in self._sessions for records in partition.values())
+
+    def iter_user_records(self) -> Iterator[Tuple[str, bytes]]:
+        """Recorre (user_id, registros empaquetados) copiando una partición cada vez"""
+        for stripe in range(self.stripes):
+            with self._session_locks[stripe]:
+                entries = [(user_id, bytes(records)) for user_id, records in self._sessions[stripe].items()]
+            yield from entries
+
+    def iter_denylist_records(self) -> Iterator[bytes]:
+        """Recorre la denylist como bloques de registros empaquetados, uno por partición"""
+        for stripe in range(self.stripes):
+            with self._denylist_locks[stripe]:
+                entries = list(self._denylist[stripe].items())
+            if entries:
+                yield b''.join(_RECORD.pack(raw, expires_at) for raw, expires_at in entries)
+
+    def restore_user(self, user_id: str, records: bytes, now: float) -> int:
+        """Carga los registros vigentes de un usuario (los más recientes si superan el tope)"""
+        kept = bytearray()
+        for raw, expires_at in _RECORD.iter_unpack(records):
+            if expires_at >= now:
+                kept += _RECORD.pack(raw, expires_at)
+        excess = len(kept) // RECORD_SIZE - self.max_sessions_per_user
+        if excess > 0:
+            del kept[:excess * RECORD_SIZE]
+        if not kept:
+            return 0
+
+        stripe = self._session_stripe(user_id)
+        with self._session_locks[stripe]:
+            self._sessions[stripe][user_id] = kept
+            self._schedule(stripe, user_id, self._earliest(kept))
+        return len(kept) // RECORD_SIZE
+
+    def restore_denied(self, records: bytes, now: float) -> int:
+        """Carga entradas vigentes de la denylist desde registros empaquetados"""
+        restored = 0
+        for raw, expires_at in _RECORD.iter_unpack(records):
+            if expires_at < now:
+                continue
+            stripe = self._denylist_stripe(raw)
+            with self._denylist_locks[stripe]:
+                self._denylist[stripe][raw] = expires_at
+                heapq.heappush(self._denylist_heaps[stripe], (expires_at, raw))
+            restored += 1
+        return restored
+
+    def clear(self):
+        """Vacía sesiones y denylist"""
+        for stripe in range(self.stripes):
+            with self._denylist_locks[stripe]:
+                self._denylist[stripe].clear()
+                self._denylist_heaps[stripe] = []
+            with self._session_locks[stripe]:
+                self._sessions[stripe].clear()
+                self._session_heaps[stripe] = []
+                self._epochs[stripe].clear()
+
+    def deny(self, session_id: str, expires_at: float):
+        raw = encode_session_id(session_id)
+        if raw is None:
+            return
+        expires_at = int(math.ceil(expires_at))
+
+        stripe = self._denylist_stripe(raw)
+        with self._denylist_locks[stripe]:
+            self.changes += 1
+            denylist = self._denylist[stripe]
+            denylist[raw] = expires_at
+            heap = self._denylist_heaps[stripe]
+            heapq.heappush(heap, (expires_at, raw))
+            if len(heap) > 2 * len(denylist) + 1024:
+                heap[:] = [(exp_time, sid) for sid, exp_time in denylist.items()]
+                heapq.heapify(heap)
+
+    def is_denied(self, session_id: str, now: float) -> bool:
+        raw = encode_session_id(session_id)
+        if raw is None:
+            return False
+
+        stripe = self._denylist_stripe(raw)
+        with self._denylist_locks[stripe]:
+            denylist = self._denylist[stripe]
+            expires_at = denylist.get(raw)
+            if expires_at is None:
+                return False
+            # Si expiró en la denylist, eliminar y considerar válido
+            if now > expires_at:
+                del denylist[raw]
+                return False
+            return True
+
+    def _compact_sessions(self, stripe: int):
+        """Reconstruye el heap de sesiones de una partición con una entrada por usuario"""
+        heap = [(self._earliest(records), user_id) for user_id, records in self._sessions[stripe].items()]
+        heapq.heapify(heap)
+        self._session_heaps[stripe] = heap
+
+    def purge_expired(self, now: float) -> Tuple[int, int]:
+        expired_tokens = 0
+        expired_sessions = 0
+        total_hold = 0.0
+        longest_hold = 0.0
+
+        # Cada lock se retiene sólo mientras se extraen las entradas vencidas de su partición
+        for stripe in range(self.stripes):
+            with self._denylist_locks[stripe]:
+                started = time.perf_counter()
+                denylist = self._denylist[stripe]
+                heap = self._denylist_heaps[stripe]
+                while heap and heap[0][0] < now:
+                    exp_time, raw = heapq.heappop(heap)
+                    # Ignorar entradas obsoletas (la denylist se renovó con otra expiración)
+                    if denylist.get(raw) == exp_time:
+                        del denylist[raw]
+                        expired_tokens += 1
+                held = time.perf_counter() - started
+            total_hold += held
+            longest_hold = max(longest_hold, held)
+
+            with self._session_locks[stripe]:
+                started = time.perf_counter()
+                partition = self._sessions[stripe]
+                heap = self._session_heaps[stripe]
+                while heap and heap[0][0] < now:
+                    _, user_id = heapq.heappop(heap)
+                    records = partition.get(user_id)
+                    if records is None:
+                        continue
+                    # Conservar sólo los registros vigentes del usuario, en el mismo orden
+                    kept = bytearray()
+                    for raw, exp_time in _RECORD.iter_unpack(records):
+                        if now > exp_time:
+                            expired_sessions += 1
+                        else:
+                            kept += _RECORD.pack(raw, exp_time)
+                    if kept:
+                        partition[user_id] = kept
+                        heapq.heappush(heap, (self._earliest(kept), user_id))
+                    else:
+                        # Limpiar usuario si no tiene sesiones
+                        del partition[user_id]
+                held = time.perf_counter() - started
+            total_hold += held
+            longest_hold = max(longest_hold, held)
+
+        self._record_lock_hold(total_hold, longest_hold)
+        return expired_tokens, expired_sessions
+
+    def next_expiry(self) -> Optional[float]:
+        # Lectura sin locks: sólo se usa para decidir cuándo volver a limpiar
+        tops = [heap[0][0] for heap in self._session_heaps + self._denylist_heaps if heap]
+        return min(tops) if tops else None
+
+
+class VersionCounter:
+    """
+    Contador de 64 bits compartido entre procesos mediante un archivo mapeado
+
+    La lectura es un acceso a memoria; el incremento toma un flock exclusivo
+    sobre el archivo para serializarse con los demás procesos.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < 8:
+            os.ftruncate(self._fd, 8)
+        self._map = mmap.mmap(self._fd, 8)
+        self._lock = threading.Lock()
+
+    def read(self) -> int:
+        return struct.unpack_from('<Q', self._map, 0)[0]
+
+    def bump(self) -> int:
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                value = self.read() + 1
+                struct.pack_into('<Q', self._map, 0, value)
+                return value
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sesiones y denylist en SQLite (modo WAL) compartidas entre workers locales"""
+
+    def __init__(self, path: str, version_path: str, cache_size: int = 50000,
+                 max_sessions_per_user: int = 10):
+        self.path = path
+        self.max_sessions_per_user = max_sessions_per_user
+        self.cache_size = cache_size
+        self.version = VersionCounter(version_path)
+        self._local = threading.local()
+
+        # Caché por proceso: clave -> (expiración, versión en que se leyó)
+        self._valid_sessions: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._allowed: Dict[str, int] = {}
+        self._denied: Dict[str, float] = {}
+        self._epochs: Dict[str, Tuple[int, int]] = {}
+        self._cache_version = self.version.read()
+
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self.lock_hold = {"last_total_ms": 0.0, "last_max_ms": 0.0, "max_ms": 0.0}
+        self._create_tables()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (user_id, session_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS denylist (
+                session_id TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_epochs (
+                user_id TEXT PRIMARY KEY,
+                epoch INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        # La limpieza borra por rango de expiración sin recorrer las tablas
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS denylist_expires_at ON denylist (expires_at)")
+
+    def _current_version(self) -> int:
+        """Versión compartida; descarta la caché local si otro proceso revocó sesiones"""
+        version = self.version.read()
+        if version != self._cache_version:
+            self._valid_sessions.clear()
+            self._allowed.clear()
+            self._epochs.clear()
+            self._cache_version = version
+            self.stats["invalidations"] += 1
+        return version
+
+    def _invalidate(self):
+        """Publicar una revocación a todos los procesos (después de confirmar en la base)"""
+        self.version.bump()
+        self._current_version()
+
+    def _trim_cache(self):
+        if len(self._valid_sessions) + len(self._allowed) + len(self._denied) + len(self._epochs) > self.cache_size:
+            self._valid_sessions.clear()
+            self._allowed.clear()
+            self._denied.clear()
+            self._epochs.clear()
+
+    def add_session(self, user_id: str, session_id: str, expires_at: float) -> List[str]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, session_id, expires_at) VALUES (?, ?, ?)",
+                (user_id, session_id, expires_at)
+            )
+            # Sin registro de último uso (sería una escritura por validación):
+            # se desalojan las sesiones que vencen antes, es decir, las más antiguas
+            evicted = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE user_id = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?",
+                (user_id, self.max_sessions_per_user)
+            )]
+            conn.executemany(
+                "DELETE FROM sessions WHERE user_id = ? AND session_id = ?",
+                [(user_id, session_id) for session_id in evicted]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if evicted:
+            self._invalidate()
+        return evicted
+
+    def get_session_expiry(self, user_id: str, session_id: str) -> Optional[float]:
+        version = self._current_version()
+        key = (user_id, session_id)
+        cached = self._valid_sessions.get(key)
+        # La entrada sólo vale si se leyó con la versión vigente
+        if cached is not None and cached[1] == version:
+            self.stats["hits"] += 1
+            return cached[0]
+
+        self.stats["misses"] += 1
+        row = self._conn().execute(
+            "SELECT expires_at FROM sessions WHERE user_id = ? AND session_id = ?",
+            (user_id, session_id)
+        ).fetchone()
+        if row is None:
+            return None
+
+        self._trim_cache()
+        self._valid_sessions[key] = (row[0], version)
+        return row[0]
+
+    def remove_session(self, user_id: str, session_id: str) -> bool:
+        cursor = self._conn().execute(
+            "DELETE FROM sessions WHERE user_id = ? AND session_id = ?",
+            (user_id, session_id)
+        )
+        if cursor.rowcount:
+            self._invalidate()
+        return cursor.rowcount > 0
+
+    def revoke_users(self, user_ids: Iterable[str], deny_until: float) -> Dict[str, List[str]]:
+        user_ids = list(dict.fromkeys(user_ids))
+        revoked: Dict[str, List[str]] = {}
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Por bloques para no superar el límite de parámetros de SQLite
+            for start in range(0, len(user_ids), 500):
+                chunk = user_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f"SELECT user_id, session_id FROM sessions WHERE user_id IN ({placeholders})", chunk
+                ).fetchall()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO denylist (session_id, expires_at) VALUES (?, ?)",
+                    [(session_id, deny_until) for _, session_id in rows]
+                )
+                conn.execute(f"DELETE FROM sessions WHERE user_id IN ({placeholders})", chunk)
+                for user_id, session_id in rows:
+                    revoked.setdefault(user_id, []).append(session_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if revoked:
+            self._invalidate()
+        return revoked
+
+    def list_sessions(self, user_id: str) -> Dict[str, float]:
+        rows = self._conn().execute(
+            "SELECT session_id, expires_at FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        return dict(rows)
+
+    def deny(self, session_id: str, expires_at: float):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO denylist (session_id, expires_at) VALUES (?, ?)",
+            (session_id, expires_at)
+        )
+        self._invalidate()
+
+    def is_denied(self, session_id: str, now: float) -> bool:
+        version = self._current_version()
+
+        # Una sesión denegada no vuelve a ser válida hasta que expira su entrada
+        denied_until = self._denied.get(session_id)
+        if denied_until is not None:
+            if now <= denied_until:
+                self.stats["hits"] += 1
+                return True
+            self._denied.pop(session_id, None)
+
+        if self._allowed.get(session_id) == version:
+            self.stats["hits"] += 1
+            return False
+
+        self.stats["misses"] += 1
+        row = self._conn().execute(
+            "SELECT expires_at FROM denylist WHERE session_id = ?", (session_id,)
+        ).fetchone()
+
+        self._trim_cache()
+        if row is not None and now <= row[0]:
+            self._denied[session_id] = row[0]
+            return True
+        self._allowed[session_id] = version
+        return False
+
+    def get_epoch(self, user_id: str) -> int:
+        version = self._current_version()
+        cached = self._epochs.get(user_id)
+        if cached is not None and cached[1] == version:
+            self.stats["hits"] += 1
+            return cached[0]
+
+        self.stats["misses"] += 1
+        row = self._conn().execute("SELECT epoch FROM user_epochs WHERE user_id = ?", (user_id,)).fetchone()
+        epoch = row[0] if row else 0
+        self._trim_cache()
+        self._epochs[user_id] = (epoch, version)
+        return epoch
+
+    def bump_epochs(self, user_ids: Iterable[str]) -> Dict[str, int]:
+        user_ids = list(dict.fromkeys(user_ids))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO user_epochs (user_id, epoch) VALUES (?, 1)"
+                " ON CONFLICT (user_id) DO UPDATE SET epoch = epoch + 1",
+                [(user_id,) for user_id in user_ids]
+            )
+            epochs = {
+                user_id: conn.execute("SELECT epoch FROM user_epochs WHERE user_id = ?", (user_id,)).fetchone()[0]
+                for user_id in user_ids
+            }
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._invalidate()
+        return epochs
+
+    def purge_expired(self, now: float) -> Tuple[int, int]:
+        # Las entradas expiradas ya se ignoran en la caché, no hace falta invalidarla
+        # Cada DELETE es una transacción propia: el lock de escritura se retiene
+        # sólo mientras se borran las filas vencidas de una tabla
+        conn = self._conn()
+        started = time.perf_counter()
+        expired_tokens = conn.execute("DELETE FROM denylist WHERE expires_at < ?", (now,)).rowcount
+        denylist_hold = time.perf_counter() - started
+
+        started = time.perf_counter()
+        expired_sessions = conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+        sessions_hold = time.perf_counter() - started
+
+        self._record_lock_hold(denylist_hold + sessions_hold, max(denylist_hold, sessions_hold))
+        return expired_tokens, expired_sessions
+
+    def next_expiry(self) -> Optional[float]:
+        row = self._conn().execute(
+            "SELECT MIN(expires_at) FROM (SELECT MIN(expires_at) AS expires_at FROM sessions"
+            " UNION ALL SELECT MIN(expires_at) FROM denylist)"
+        ).fetchone()
+        return row[0] if row else None
+
+
+def create_session_store(config: Dict, stripes: int) -> SessionStore:
+    """Construye el almacén configurado en TOKEN_STORE"""
+    backend = config.get("BACKEND", "memory")
+    if backend == "memory":
+        return MemorySessionStore(stripes, max_sessions_per_user=config.get("MAX_SESSIONS_PER_USER", 10))
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            config["SQLITE_PATH"],
+            config["VERSION_PATH"],
+            cache_size=config.get("CACHE_SIZE", 50000),
+            max_sessions_per_user=config.get("MAX_SESSIONS_PER_USER", 10)
+        )
+    raise ValueError(f"Backend de sesiones desconocido: {backend}")
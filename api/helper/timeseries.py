@@ -0,0 +1,295 @@
+"""
+Almacén de series temporales para métricas de pacientes
+
+Guarda el historial de cada métrica (por paciente y clave de métrica) en bloques
+ordenados por tiempo respaldados por array('d'). Las lecturas que llegan en orden
+se añaden al final del último bloque en O(1); las lecturas atrasadas se insertan
+en su posición con bisect. Las consultas por rango localizan el primer bloque
+por búsqueda binaria y sólo recorren los bloques que se solapan con el rango.
+
+También incluye la reducción de puntos en servidor (buckets min/max/avg y LTTB)
+para que las gráficas reciban un número acotado de puntos sin importar el
+tamaño del historial.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import threading
+
+# Número de lecturas por bloque
+CHUNK_SIZE = 1024
+
+# Límites de puntos devueltos a las gráficas
+DEFAULT_POINTS = 200
+MAX_POINTS = 2000
+
+
+class SeriesChunk:
+    """Bloque de lecturas contiguas en el tiempo"""
+    __slots__ = ('timestamps', 'values')
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.values = array('d')
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class MetricSeries:
+    """Serie temporal de una métrica de un paciente"""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._chunks: List[SeriesChunk] = []
+        # Primer timestamp de cada bloque, para localizar bloques con bisect
+        self._chunk_starts: List[float] = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp: float, value: float):
+        """
+        Añade una lectura a la serie
+
+        Args:
+            timestamp: Tiempo de la lectura en segundos epoch
+            value: Valor numérico de la lectura
+        """
+        with self._lock:
+            self._append_locked(float(timestamp), float(value))
+
+    def extend(self, readings: List[Tuple[float, float]]):
+        """Añade varias lecturas (timestamp, valor) en una sola sección crítica"""
+        with self._lock:
+            for timestamp, value in sorted(readings):
+                self._append_locked(float(timestamp), float(value))
+
+    def _append_locked(self, timestamp: float, value: float):
+        chunks = self._chunks
+
+        # Camino rápido: lectura en orden, se añade al final
+        if not chunks or timestamp >= chunks[-1].timestamps[-1]:
+            if not chunks or len(chunks[-1]) >= self.chunk_size:
+                chunks.append(SeriesChunk())
+                self._chunk_starts.append(timestamp)
+            chunk = chunks[-1]
+            chunk.timestamps.append(timestamp)
+            chunk.values.append(value)
+            self._count += 1
+            return
+
+        # Lectura atrasada: insertar en el bloque que le corresponde
+        index = max(bisect_right(self._chunk_starts, timestamp) - 1, 0)
+        chunk = chunks[index]
+        position = bisect_right(chunk.timestamps, timestamp)
+        chunk.timestamps.insert(position, timestamp)
+        chunk.values.insert(position, value)
+        self._chunk_starts[index] = chunk.timestamps[0]
+        self._count += 1
+
+        # Dividir bloques que crecieron demasiado por inserciones atrasadas
+        if len(chunk) > 2 * self.chunk_size:
+            middle = len(chunk) // 2
+            new_chunk = SeriesChunk()
+            new_chunk.timestamps = chunk.timestamps[middle:]
+            new_chunk.values = chunk.values[middle:]
+            del chunk.timestamps[middle:]
+            del chunk.values[middle:]
+            chunks.insert(index + 1, new_chunk)
+            self._chunk_starts.insert(index + 1, new_chunk.timestamps[0])
+
+    def range(self, start: Optional[float] = None, end: Optional[float] = None) -> Tuple[array, array]:
+        """
+        Obtiene las lecturas dentro de un rango de tiempo (inclusivo)
+
+        Args:
+            start: Inicio del rango en segundos epoch (None = desde el principio)
+            end: Fin del rango en segundos epoch (None = hasta el final)
+
+        Returns:
+            Tupla (timestamps, valores) como arrays ordenados por tiempo
+        """
+        timestamps = array('d')
+        values = array('d')
+
+        with self._lock:
+            if not self._chunks:
+                return timestamps, values
+
+            first = 0
+            if start is not None:
+                first = max(bisect_right(self._chunk_starts, start) - 1, 0)
+
+            for chunk in self._chunks[first:]:
+                if end is not None and chunk.timestamps[0] > end:
+                    break
+                low = 0 if start is None else bisect_left(chunk.timestamps, start)
+                high = len(chunk) if end is None else bisect_right(chunk.timestamps, end)
+                if low < high:
+                    timestamps.extend(chunk.timestamps[low:high])
+                    values.extend(chunk.values[low:high])
+
+        return timestamps, values
+
+    def last(self) -> Optional[Tuple[float, float]]:
+        """Devuelve la lectura más reciente (timestamp, valor) o None"""
+        with self._lock:
+            if not self._chunks:
+                return None
+            chunk = self._chunks[-1]
+            return chunk.timestamps[-1], chunk.values[-1]
+
+
+class TimeSeriesStore:
+    """Almacén de series temporales por (paciente, métrica)"""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._series: Dict[Tuple[int, str], MetricSeries] = {}
+        self._lock = threading.Lock()
+
+    def get_series(self, patient_id: int, key: str, create: bool = False) -> Optional[MetricSeries]:
+        """Obtiene la serie de una métrica, creándola si se solicita"""
+        series = self._series.get((patient_id, key))
+        if series is None and create:
+            with self._lock:
+                series = self._series.get((patient_id, key))
+                if series is None:
+                    series = MetricSeries(self.chunk_size)
+                    self._series[(patient_id, key)] = series
+        return series
+
+    def append(self, patient_id: int, key: str, timestamp: float, value: float):
+        """Añade una lectura a la serie de un paciente"""
+        self.get_series(patient_id, key, create=True).append(timestamp, value)
+
+    def query(self, patient_id: int, key: str, start: Optional[float] = None,
+              end: Optional[float] = None) -> Tuple[array, array]:
+        """Obtiene las lecturas de una métrica dentro de un rango de tiempo"""
+        series = self.get_series(patient_id, key)
+        if series is None:
+            return array('d'), array('d')
+        return series.range(start, end)
+
+
+def _format_timestamp(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+def downsample_buckets(timestamps, values, points: int) -> List[Dict]:
+    """
+    Reduce una serie a un máximo de `points` buckets de igual duración
+
+    Cada bucket contiene el mínimo, máximo y promedio de las lecturas que caen
+    en él, de modo que los picos no se pierden al reducir la resolución.
+    """
+    total = len(timestamps)
+    if total == 0:
+        return []
+
+    if total <= points:
+        return [
+            {
+                "timestamp": _format_timestamp(timestamps[i]),
+                "min": values[i],
+                "max": values[i],
+                "avg": values[i],
+                "count": 1
+            }
+            for i in range(total)
+        ]
+
+    first = timestamps[0]
+    width = (timestamps[-1] - first) / points or 1.0
+    mins = [0.0] * points
+    maxs = [0.0] * points
+    sums = [0.0] * points
+    counts = [0] * points
+
+    for timestamp, value in zip(timestamps, values):
+        index = min(int((timestamp - first) / width), points - 1)
+        if counts[index] == 0:
+            mins[index] = maxs[index] = value
+        elif value < mins[index]:
+            mins[index] = value
+        elif value > maxs[index]:
+            maxs[index] = value
+        sums[index] += value
+        counts[index] += 1
+
+    return [
+        {
+            "timestamp": _format_timestamp(first + index * width),
+            "min": mins[index],
+            "max": maxs[index],
+            "avg": round(sums[index] / counts[index], 2),
+            "count": counts[index]
+        }
+        for index in range(points)
+        if counts[index]
+    ]
+
+
+def downsample_lttb(timestamps, values, points: int) -> List[Dict]:
+    """
+    Reduce una serie con Largest-Triangle-Three-Buckets
+
+    Conserva la forma visual de la serie eligiendo, en cada bucket, el punto que
+    forma el triángulo de mayor área con el punto anterior elegido y el promedio
+    del bucket siguiente.
+    """
+    total = len(timestamps)
+    if total == 0:
+        return []
+
+    if total <= points or points < 3:
+        indices = range(total) if total <= points else (0, total - 1)
+    else:
+        indices = [0]
+        bucket_size = (total - 2) / (points - 2)
+        previous = 0
+
+        for bucket in range(points - 2):
+            start = int(bucket * bucket_size) + 1
+            end = int((bucket + 1) * bucket_size) + 1
+
+            # Promedio del bucket siguiente
+            next_start = end
+            next_end = min(int((bucket + 2) * bucket_size) + 1, total)
+            if next_start >= next_end:
+                next_start, next_end = total - 1, total
+            count = next_end - next_start
+            avg_t = sum(timestamps[next_start:next_end]) / count
+            avg_v = sum(values[next_start:next_end]) / count
+
+            prev_t = timestamps[previous]
+            prev_v = values[previous]
+            best_area = -1.0
+            best_index = start
+            for i in range(start, end):
+                area = abs(
+                    (prev_t - avg_t) * (values[i] - prev_v)
+                    - (prev_t - timestamps[i]) * (avg_v - prev_v)
+                )
+                if area > best_area:
+                    best_area = area
+                    best_index = i
+
+            indices.append(best_index)
+            previous = best_index
+
+        indices.append(total - 1)
+
+    return [
+        {"timestamp": _format_timestamp(timestamps[i]), "value": values[i]}
+        for i in indices
+    ]
+
+
+# Instancia compartida del almacén
+metric_store = TimeSeriesStore()
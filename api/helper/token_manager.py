@@ -1,20 +1,41 @@
 from datetime import datetime, timedelta
 from typing import Dict, Set, Tuple, List, Optional, Any, Union
+import atexit
 import threading
 import time
 import uuid
 import logging
-from config import EXPIRE_TOKEN_TIME
+from config import EXPIRE_TOKEN_TIME, TOKEN_MANAGER_STRIPES, TOKEN_STORE
+from helper.audit_log import audit_log
+from helper.session_store import MemorySessionStore, SessionStore, create_session_store
+from helper.session_snapshot import load_snapshot, write_snapshot
 
 # Configurar logging específico para el gestor de tokens
 logger = logging.getLogger("token_manager")
 logger.setLevel(logging.INFO)
 
 class TokenManager:
+    """
+    Gestor de sesiones activas y denylist de sesiones invalidadas
+
+    El estado vive en un SessionStore intercambiable: en memoria y particionado
+    por defecto, o en SQLite compartido entre workers (TOKEN_STORE["BACKEND"]),
+    para que una sesión registrada en un worker sea válida en todos.
+
+    En modo "epoch" (TOKEN_STORE["SESSION_MODE"]) no se guarda ninguna sesión:
+    cada token lleva la época de sesión de su usuario (claim session_epoch) y
+    es válido mientras coincida con la actual. Revocar todas las sesiones de un
+    usuario incrementa su época; la denylist se mantiene sólo para cerrar una
+    sesión concreta (logout).
+    """
     _instance = None
+    # Sólo protege la creación del singleton
     _lock = threading.Lock()
 
-    def __new__(cls):
+    def __new__(cls, stripes: Optional[int] = None, store: Optional[SessionStore] = None):
+        if stripes is not None or store is not None:
+            # Instancia independiente con su propio almacén
+            return super().__new__(cls)
         with cls._lock:
             if cls._instance is None:
                 instance = super().__new__(cls)
@@ -23,38 +44,96 @@ class TokenManager:
                 cls._instance = instance
             return cls._instance
             
-    def __init__(self):
+    def __init__(self, stripes: Optional[int] = None, store: Optional[SessionStore] = None):
         # Solo inicializar una vez
         if not hasattr(self, 'initialized'):
-            # Diccionario para almacenar session_id invalidados y su tiempo de expiración
-            self.denylist = {}
-            # Almacenar sesiones activas por usuario
-            self.active_sessions = {}
-            # Registro de actividad para auditoría de seguridad
-            self.activity_log = []
+            self.store = store or create_session_store(TOKEN_STORE, stripes or TOKEN_MANAGER_STRIPES)
+            self.epoch_mode = TOKEN_STORE.get("SESSION_MODE") == "epoch"
             self.initialized = True
+            # Sólo el singleton en memoria persiste su estado (SQLite ya es persistente)
+            self.snapshot_path = None
+            if stripes is None and store is None and isinstance(self.store, MemorySessionStore):
+                self.snapshot_path = TOKEN_STORE.get("SNAPSHOT_PATH")
+            if self.snapshot_path:
+                self._restore_snapshot()
+                snapshot_thread = threading.Thread(target=self._snapshot_loop, daemon=True)
+                snapshot_thread.start()
+                atexit.register(self.save_snapshot)
             # Iniciar hilo de limpieza
             cleanup_thread = threading.Thread(target=self._cleanup_expired_tokens, daemon=True)
             cleanup_thread.start()
 
+    def _restore_snapshot(self):
+        """Carga el último snapshot al arrancar"""
+        started = time.perf_counter()
+        sessions, denied = load_snapshot(self.store, self.snapshot_path)
+        self._snapshot_changes = self.store.changes
+        if sessions or denied:
+            logger.info(
+                f"Snapshot restored: {sessions} sessions, {denied} denylist entries "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+
+    def save_snapshot(self) -> bool:
+        """
+        Escribe un snapshot si el estado cambió desde el anterior
+
+        Returns:
+            True si se escribió un snapshot nuevo
+        """
+        if not self.snapshot_path or self.store.changes == self._snapshot_changes:
+            return False
+        changes = self.store.changes
+        try:
+            sessions, denied = write_snapshot(self.store, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Error writing session snapshot: {str(e)}")
+            return False
+        self._snapshot_changes = changes
+        logger.debug(f"Snapshot written: {sessions} sessions, {denied} denylist entries")
+        return True
+
+    def _snapshot_loop(self):
+        while True:
+            time.sleep(TOKEN_STORE.get("SNAPSHOT_INTERVAL_SECONDS", 30))
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                logger.error(f"Error during session snapshot: {str(e)}")
+
     def _log_activity(self, action: str, user_id: Optional[str], session_id: Optional[str], details: Optional[Dict] = None):
         """
         Registra actividad para fines de auditoría
+
+        El evento se encola en el registro de auditoría sin bloquear; el formateo
+        y la escritura a disco ocurren en su hilo en segundo plano.
         """
-        entry = {
-            'timestamp': datetime.now().isoformat(),
-            'action': action,
-            'user_id': user_id,
-            'session_id': session_id,
-            'details': details or {}
-        }
+        audit_log.record(action, user_id, session_id, details)
+        logger.debug(f"TokenManager: {action} - User: {user_id} - Session: {session_id}")
+
+    def get_activity(self, user_id: Optional[str] = None, session_id: Optional[str] = None,
+                     limit: int = 100) -> List[Dict]:
+        """
+        Obtiene la actividad reciente de un usuario o de una sesión
+
+        Args:
+            user_id: ID del usuario (opcional)
+            session_id: ID de sesión (opcional)
+            limit: Número máximo de eventos
+
+        Returns:
+            Eventos del más reciente al más antiguo
+        """
+        return audit_log.query(user_id=user_id, session_id=session_id, limit=limit)
+
+    def _default_deny_expiry(self) -> datetime:
+        """Mayor vida posible de un token (access o refresh) a partir de ahora"""
+        days = EXPIRE_TOKEN_TIME["REFRESH_TOKEN_DAYS"]
+        minutes = EXPIRE_TOKEN_TIME["ACCESS_TOKEN_MINUTES"]
         
-        self.activity_log.append(entry)
-        # Mantener log limitado a 1000 eventos
-        if len(self.activity_log) > 1000:
-            self.activity_log.pop(0)
-            
-        logger.info(f"TokenManager: {action} - User: {user_id} - Session: {session_id}")
+        if days * 24 * 60 > minutes:
+            return datetime.now() + timedelta(days=days)
+        return datetime.now() + timedelta(minutes=minutes)
 
     def add_to_denylist(self, session_id: str, exp_time: Optional[datetime] = None, user_id: Optional[str] = None):
         """
@@ -73,37 +152,24 @@ class TokenManager:
             
         # Si no se proporciona tiempo de expiración, usar el máximo posible
         if exp_time is None:
-            # Usar el mayor tiempo entre access_token y refresh_token
-            days = EXPIRE_TOKEN_TIME["REFRESH_TOKEN_DAYS"]
-            minutes = EXPIRE_TOKEN_TIME["ACCESS_TOKEN_MINUTES"]
-            
-            if days * 24 * 60 > minutes:
-                exp_time = datetime.now() + timedelta(days=days)
-            else:
-                exp_time = datetime.now() + timedelta(minutes=minutes)
+            exp_time = self._default_deny_expiry()
         
-        with self._lock:
-            # Añadir a denylist
-            self.denylist[session_id] = exp_time
-            
-            # Eliminar de sesiones activas si existe
-            if user_id:
-                if user_id in self.active_sessions and session_id in self.active_sessions[user_id]:
-                    del self.active_sessions[user_id][session_id]
-                    
-                    # Si no quedan sesiones activas, eliminar entrada del usuario
-                    if not self.active_sessions[user_id]:
-                        del self.active_sessions[user_id]
+        # Añadir a denylist
+        self.store.deny(session_id, exp_time.timestamp())
             
-            # Registrar actividad
-            activity_details = {
-                "expires_at": exp_time.isoformat() if exp_time else None,
-                "reason": "explicit_invalidation"
-            }
-            self._log_activity("session_invalidated", user_id, session_id, activity_details)
+        # Eliminar de sesiones activas si existe
+        if user_id:
+            self.store.remove_session(user_id, session_id)
             
-            logger.info(f"Session {session_id} added to denylist, expires at {exp_time}")
-            return True
+        # Registrar actividad
+        activity_details = {
+            "expires_at": exp_time.isoformat() if exp_time else None,
+            "reason": "explicit_invalidation"
+        }
+        self._log_activity("session_invalidated", user_id, session_id, activity_details)
+        
+        logger.info(f"Session {session_id} added to denylist, expires at {exp_time}")
+        return True
 
     def is_denied(self, session_id: str) -> bool:
         """
@@ -118,18 +184,8 @@ class TokenManager:
         if not session_id:
             return False
         
-        with self._lock:
-            # Si no está en la denylist, es válido
-            if session_id not in self.denylist:
-                return False
-            
-            # Si expiró en la denylist, eliminar y considerar válido
-            if datetime.now() > self.denylist[session_id]:
-                self.denylist.pop(session_id)
-                return False
-            
-            # En denylist y no expirado = invalidado
-            return True
+        # En denylist y no expirado = invalidado
+        return self.store.is_denied(session_id, time.time())
 
     def generate_session_id(self) -> str:
         """
@@ -158,76 +214,106 @@ class TokenManager:
         # Calcular expiración (usar tiempo de refresh token)
         expires_at = datetime.now() + timedelta(days=EXPIRE_TOKEN_TIME["REFRESH_TOKEN_DAYS"])
             
-        with self._lock:
-            # Verificar que no esté en denylist
-            if session_id in self.denylist:
-                # Generar nuevo si hay colisión
-                session_id = self.generate_session_id()
-            
-            # Inicializar para el usuario si no existe
-            if user_id not in self.active_sessions:
-                self.active_sessions[user_id] = {}
-                
-            # Registrar sesión activa
-            self.active_sessions[user_id][session_id] = expires_at
+        # Verificar que no esté en denylist
+        if self.is_denied(session_id):
+            # Generar nuevo si hay colisión
+            session_id = self.generate_session_id()
             
-            # Log
-            self._log_activity("session_created", user_id, session_id, {
-                "expires_at": expires_at.isoformat()
+        # En modo epoch la sesión no se guarda: la validez la da la época del token
+        evicted = [] if self.epoch_mode else self.store.add_session(user_id, session_id, expires_at.timestamp())
+        for evicted_id in evicted:
+            self._log_activity("session_evicted", user_id, evicted_id, {
+                "reason": "max_sessions_per_user"
             })
+            
+        # Log
+        self._log_activity("session_created", user_id, session_id, {
+            "expires_at": expires_at.isoformat()
+        })
                 
         return session_id
 
-    def validate_session(self, user_id: Optional[str], session_id: Optional[str]) -> bool:
+    def session_claims(self, user_id: str, session_id: str) -> Dict[str, Any]:
+        """
+        Claims de sesión que deben incluir los tokens de acceso y de refresco
+        
+        Args:
+            user_id: ID del usuario
+            session_id: ID de sesión
+            
+        Returns:
+            Diccionario con session_id (y session_epoch en modo epoch)
+        """
+        claims = {'session_id': session_id}
+        if self.epoch_mode:
+            claims['session_epoch'] = self.store.get_epoch(str(user_id))
+        return claims
+
+    def validate_session(self, user_id: Optional[str], session_id: Optional[str],
+                         session_epoch: Optional[int] = None) -> bool:
         """
         Valida que un session_id pertenezca a un usuario y no esté invalidado
         
         Args:
             user_id: ID del usuario
             session_id: ID de sesión
+            session_epoch: Claim session_epoch del token (modo epoch)
             
         Returns:
             True si la sesión es válida, False si no
         """
+        return self.check_session(user_id, session_id, session_epoch)[1]
+
+    def check_session(self, user_id: Optional[str], session_id: Optional[str],
+                      session_epoch: Optional[int] = None) -> Tuple[bool, bool]:
+        """
+        Consulta la denylist y la sesión activa una sola vez
+        
+        Args:
+            user_id: ID del usuario
+            session_id: ID de sesión
+            session_epoch: Claim session_epoch del token (modo epoch)
+            
+        Returns:
+            Tupla (denegada, válida)
+        """
         # Validaciones básicas de entrada
         if not isinstance(user_id, str) or not isinstance(session_id, str):
             logger.warning(f"Invalid session validation parameters: user_id={type(user_id)}, session_id={type(session_id)}")
-            return False
+            return False, False
             
         if not user_id or not session_id:
             logger.warning(f"Empty session validation parameters: user_id={user_id}, session_id={session_id}")
-            return False
+            return False, False
             
         # Verificar denylist primero (más rápido)
         if self.is_denied(session_id):
             logger.info(f"Session validation failed: {session_id} is in denylist")
-            return False
+            return True, False
             
-        # Verificar sesión activa
-        with self._lock:
-            if user_id not in self.active_sessions:
-                logger.info(f"Session validation failed: No active sessions for user {user_id}")
-                return False
-                
-            if session_id not in self.active_sessions[user_id]:
-                logger.info(f"Session validation failed: Session {session_id} not registered for user {user_id}")
-                return False
-                
-            # Verificar expiración
-            if datetime.now() > self.active_sessions[user_id][session_id]:
-                # Eliminar sesión expirada
-                del self.active_sessions[user_id][session_id]
-                
-                # Limpiar si no quedan sesiones
-                if not self.active_sessions[user_id]:
-                    del self.active_sessions[user_id]
-                    
-                logger.info(f"Session validation failed: Session {session_id} expired")
-                return False
-                
-            # Sesión válida y activa, registrar actividad
+        # Modo epoch: una comparación de enteros contra la época actual del usuario.
+        # Una época antigua equivale a una sesión revocada (también para /refresh)
+        if self.epoch_mode:
+            if not isinstance(session_epoch, int) or session_epoch != self.store.get_epoch(user_id):
+                logger.info(f"Session validation failed: stale session epoch for user {user_id}")
+                return True, False
             self._log_activity("session_validated", user_id, session_id)
-            return True
+            return False, True
+            
+        # Verificar sesión activa del usuario
+        expires_at = self.store.get_session_expiry(user_id, session_id)
+        if expires_at is None:
+            logger.info(f"Session validation failed: Session {session_id} not registered for user {user_id}")
+            return False, False
+            
+        # Verificar expiración (la limpieza periódica la retira del almacén)
+        if time.time() > expires_at:
+            logger.info(f"Session validation failed: Session {session_id} expired")
+            return False, False
+                
+        # Sesión válida y activa, registrar actividad
+        self._log_activity("session_validated", user_id, session_id)
+        return False, True
 
     def revoke_session(self, user_id: str, session_id: str) -> bool:
         """
@@ -273,12 +359,13 @@ class TokenManager:
         
         return True
             
-    def revoke_all_sessions(self, user_id: str) -> int:
+    def revoke_all_sessions(self, user_id: str, reason: str = "revoke_all") -> int:
         """
         Revoca todas las sesiones de un usuario
         
         Args:
             user_id: ID del usuario
+            reason: Motivo registrado en la auditoría
             
         Returns:
             Número de sesiones revocadas
@@ -286,25 +373,67 @@ class TokenManager:
         if not user_id:
             return 0
             
-        revoked_count = 0
+        return self.revoke_users_sessions([user_id], reason).get(user_id, 0)
+
+    def revoke_users_sessions(self, user_ids: List[str], reason: str = "bulk_revocation") -> Dict[str, int]:
+        """
+        Revoca todas las sesiones de uno o varios usuarios
+        
+        Las sesiones se retiran y se añaden a la denylist en una sola sección
+        crítica del almacén, con trabajo proporcional al número de sesiones
+        revocadas. Pensado para el restablecimiento de contraseña y para
+        herramientas de administración.
+        
+        Args:
+            user_ids: IDs de usuario
+            reason: Motivo registrado en la auditoría
+            
+        Returns:
+            Número de sesiones revocadas por usuario (sólo usuarios con sesiones)
+        """
+        user_ids = [str(user_id) for user_id in user_ids if user_id]
+        if not user_ids:
+            return {}
+            
+        # Modo epoch: incrementar la época invalida todos los tokens emitidos
+        if self.epoch_mode:
+            return self._bump_epochs(user_ids, reason)
+            
+        exp_time = self._default_deny_expiry()
+        revoked = self.store.revoke_users(user_ids, exp_time.timestamp())
         
-        with self._lock:
-            if user_id in self.active_sessions:
-                # Añadir todas a denylist
-                for session_id in list(self.active_sessions[user_id].keys()):
-                    self.add_to_denylist(session_id, user_id=user_id)
-                    revoked_count += 1
-                
-                # Eliminar todas
-                del self.active_sessions[user_id]
+        # Registrar actividad fuera de la sección crítica
+        for user_id, session_ids in revoked.items():
+            for session_id in session_ids:
+                self._log_activity("session_invalidated", user_id, session_id, {
+                    "expires_at": exp_time.isoformat(),
+                    "reason": reason
+                })
+            logger.info(f"All {len(session_ids)} sessions revoked for user {user_id} ({reason})")
                 
-                logger.info(f"All {revoked_count} sessions revoked for user {user_id}")
-                
-        return revoked_count
+        return {user_id: len(session_ids) for user_id, session_ids in revoked.items()}
+
+    def _bump_epochs(self, user_ids: List[str], reason: str) -> Dict[str, int]:
+        """
+        Revoca todas las sesiones de los usuarios incrementando su época
+        
+        Returns:
+            Diccionario usuario -> 0 (en modo epoch no se conoce cuántas sesiones había)
+        """
+        epochs = self.store.bump_epochs(user_ids)
+        for user_id, epoch in epochs.items():
+            self._log_activity("session_epoch_bumped", user_id, None, {
+                "epoch": epoch,
+                "reason": reason
+            })
+            logger.info(f"Session epoch of user {user_id} bumped to {epoch} ({reason})")
+        # Persistir de inmediato: perder una época revalidaría los tokens revocados
+        self.save_snapshot()
+        return {user_id: 0 for user_id in epochs}
 
     def get_active_sessions(self, user_id: str) -> List[Dict]:
         """
-        Obtiene sesiones activas de un usuario
+        Obtiene sesiones activas de un usuario (vacío en modo epoch)
         
         Args:
             user_id: ID del usuario
@@ -314,67 +443,51 @@ class TokenManager:
         """
         result = []
         
-        with self._lock:
-            if user_id in self.active_sessions:
-                now = datetime.now()
-                
-                for session_id, expires_at in self.active_sessions[user_id].items():
-                    if now <= expires_at:
-                        result.append({
-                            "session_id": session_id,
-                            "expires_at": expires_at.isoformat(),
-                            "remaining_minutes": (expires_at - now).total_seconds() // 60
-                        })
+        now = time.time()
+        
+        for session_id, expires_at in self.store.list_sessions(user_id).items():
+            if now <= expires_at:
+                result.append({
+                    "session_id": session_id,
+                    "expires_at": datetime.fromtimestamp(expires_at).isoformat(),
+                    "remaining_minutes": (expires_at - now) // 60
+                })
                         
         return result
 
     def _cleanup_expired_tokens(self):
         """
-        Limpia tokens y sesiones expiradas periódicamente
+        Limpia tokens y sesiones expiradas a medida que vencen
+
+        El almacén sólo toca las entradas vencidas (heap por expiración), así que
+        en lugar de recorrer todo cada minuto se despierta en la próxima
+        expiración pendiente, con un mínimo de 1 s y un máximo de 60 s.
         """
         while True:
             try:
-                now = datetime.now()
-                expired_tokens = []
-                expired_sessions = {}
+                expired_tokens, expired_sessions = self.store.purge_expired(time.time())
                 
-                with self._lock:
-                    # Limpiar denylist
-                    for session_id, exp_time in self.denylist.items():
-                        if now > exp_time:
-                            expired_tokens.append(session_id)
-                    
-                    for session_id in expired_tokens:
-                        self.denylist.pop(session_id)
-                    
-                    # Limpiar sesiones expiradas
-                    for user_id in list(self.active_sessions.keys()):
-                        if user_id not in expired_sessions:
-                            expired_sessions[user_id] = []
-                            
-                        for session_id, exp_time in self.active_sessions[user_id].items():
-                            if now > exp_time:
-                                expired_sessions[user_id].append(session_id)
-                    
-                    # Eliminar sesiones expiradas
-                    for user_id, sessions in expired_sessions.items():
-                        for session_id in sessions:
-                            if user_id in self.active_sessions and session_id in self.active_sessions[user_id]:
-                                del self.active_sessions[user_id][session_id]
-                        
-                        # Limpiar usuario si no tiene sesiones
-                        if user_id in self.active_sessions and not self.active_sessions[user_id]:
-                            del self.active_sessions[user_id]
-                    
-                    # Log si hubo limpiezas
-                    if expired_tokens or any(expired_sessions.values()):
-                        logger.info(f"Cleanup: {len(expired_tokens)} denylist tokens, {sum(len(s) for s in expired_sessions.values())} expired sessions")
+                # Log si hubo limpiezas, con el tiempo que se retuvieron los locks
+                if expired_tokens or expired_sessions:
+                    hold = self.store.lock_hold
+                    logger.info(
+                        f"Cleanup: {expired_tokens} denylist tokens, {expired_sessions} expired sessions"
+                        f" (locks held {hold['last_total_ms']:.2f} ms total, {hold['last_max_ms']:.2f} ms max)"
+                    )
                 
+                next_expiry = self.store.next_expiry()
             except Exception as e:
                 logger.error(f"Error during token cleanup: {str(e)}")
+                next_expiry = None
             
-            # Limpiar cada minuto
-            time.sleep(60)
+            delay = 60 if next_expiry is None else next_expiry - time.time()
+            time.sleep(min(max(delay, 1), 60))
+
+    def get_cleanup_stats(self) -> Dict[str, float]:
+        """
+        Tiempo que la limpieza retuvo locks (última pasada y máximo histórico, en ms)
+        """
+        return dict(self.store.lock_hold)
 
 # Singleton instance
 token_manager = TokenManager()
\ No newline at end of file
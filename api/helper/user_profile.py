@@ -0,0 +1,97 @@
+"""
+Caché de perfiles de usuario
+
+Con el perfil compacto de access token (JWT_TOKEN_PROFILE["MODE"] = "compact")
+el token sólo lleva sub, session_id y exp; nombre, apellido, email y
+fecha_nacimiento se sirven desde esta caché, que se rellena en el login, se
+carga de la base de datos en un fallo y se actualiza en settings.update_settings.
+
+La caché es local a cada proceso: el TTL acota cuánto tarda otro worker en ver
+un cambio de perfil.
+"""
+
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, Optional
+import threading
+import time
+
+from config import JWT_TOKEN_PROFILE
+from helper.database import get_db_cursor, fetch_one_dict_from_result
+
+# Campos del perfil que el formato completo copia en el access token
+PROFILE_FIELDS = ('email', 'nombre', 'apellido', 'fecha_nacimiento')
+
+PROFILE_QUERY = "SELECT id, nombre, apellido, email, fecha_nacimiento FROM users WHERE id = %s"
+
+
+def format_profile(row: Dict) -> Dict:
+    """Perfil listo para JSON (fecha_nacimiento como YYYY-MM-DD)"""
+    profile = {'id': row.get('id')}
+    for field in PROFILE_FIELDS:
+        profile[field] = row.get(field)
+    if isinstance(profile['fecha_nacimiento'], (datetime, date)):
+        profile['fecha_nacimiento'] = profile['fecha_nacimiento'].strftime('%Y-%m-%d')
+    return profile
+
+
+class UserProfileCache:
+    """LRU de user_id -> (perfil, expiración)"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, user_id) -> Optional[Dict]:
+        """
+        Perfil del usuario desde la caché, o desde la base de datos en un fallo
+
+        Returns:
+            Copia del perfil, o None si el usuario no existe
+        """
+        key = str(user_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[1]:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return dict(entry[0])
+            self.stats["misses"] += 1
+
+        with get_db_cursor(dictionary=True) as cursor:
+            cursor.execute(PROFILE_QUERY, (user_id,))
+            row = fetch_one_dict_from_result(cursor)
+        if not row:
+            self.invalidate(key)
+            return None
+
+        profile = format_profile(row)
+        self.put(key, profile)
+        return dict(profile)
+
+    def put(self, user_id, profile: Dict):
+        """Guarda un perfil recién leído o actualizado"""
+        key = str(user_id)
+        with self._lock:
+            self._entries[key] = (format_profile(profile), time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_profiles = UserProfileCache(
+    max_entries=JWT_TOKEN_PROFILE["PROFILE_CACHE_SIZE"],
+    ttl=JWT_TOKEN_PROFILE["PROFILE_CACHE_TTL_SECONDS"]
+)
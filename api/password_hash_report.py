@@ -0,0 +1,81 @@
+# Informe de la distribución de costes de hash de contraseña en la tabla users
+#
+# Uso: python password_hash_report.py [--no-measure] (desde el directorio api)
+#
+# Agrupa los usuarios por método y parámetros de hash (sin leer los hashes), mide
+# en esta máquina cuánto cuesta verificar cada uno y marca los que se rehacen en
+# el próximo login porque son más baratos que los parámetros actuales.
+import argparse
+import logging
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from db import get_connection
+from helper.password_hasher import hash_cost, password_hasher
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger('password_hash_report')
+
+RECOGNIZED = ('pbkdf2:', 'scrypt:')
+
+
+def measure_ms(method):
+    """Coste de verificar una contraseña con el método dado en esta máquina"""
+    pwhash = generate_password_hash('informe', method=method)
+    start = time.perf_counter()
+    check_password_hash(pwhash, 'informe')
+    return (time.perf_counter() - start) * 1000
+
+
+def hash_report(measure=True):
+    conn = get_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        # Sólo el prefijo con el método y los parámetros, nunca el hash
+        cursor.execute("""
+            SELECT SUBSTRING_INDEX(password, '$', 1) AS method, COUNT(*) AS total
+            FROM users
+            GROUP BY method
+            ORDER BY total DESC
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+
+    total = sum(row['total'] for row in rows)
+    current = password_hasher.method
+    logger.info(f"Parámetros actuales: {current}" + (f" ({measure_ms(current):.0f} ms)" if measure else ""))
+    logger.info(f"Usuarios: {total}")
+
+    outdated = 0
+    for row in rows:
+        method = row['method'] or ''
+        share = 100.0 * row['total'] / total if total else 0.0
+        if not method.startswith(RECOGNIZED):
+            logger.info(f"  {'sin hash reconocido':<28} {row['total']:>8} {share:6.1f}%  (se invalida en el próximo login)")
+            outdated += row['total']
+            continue
+
+        needs_rehash = password_hasher.needs_rehash(method)
+        if needs_rehash:
+            outdated += row['total']
+        cost = f"{measure_ms(method):7.0f} ms" if measure and hash_cost(method)[1] else ""
+        logger.info(f"  {method:<28} {row['total']:>8} {share:6.1f}%  {cost}"
+                    f"{'  se rehace en el próximo login' if needs_rehash else ''}")
+
+    if total:
+        logger.info(f"Desfasados: {outdated} ({100.0 * outdated / total:.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distribución de costes de hash de contraseña en users")
+    parser.add_argument('--no-measure', action='store_true', help="No medir el coste de cada método")
+    args = parser.parse_args()
+    hash_report(measure=not args.no_measure)
@@ -0,0 +1,39 @@
+# Script de administración para cerrar todas las sesiones de uno o varios usuarios
+#
+# Uso: python revoke_sessions.py <user_id> [<user_id> ...] [--reason motivo]
+#
+# Actúa sobre el almacén de sesiones configurado. Con TOKEN_STORE_BACKEND=sqlite
+# la revocación es visible de inmediato para todos los workers en ejecución; con
+# el almacén en memoria sólo afecta al snapshot local y no a un servidor activo.
+import argparse
+import logging
+
+from config import TOKEN_STORE
+from helper.token_manager import token_manager
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger('revoke_sessions')
+
+def revoke_sessions(user_ids, reason):
+    if TOKEN_STORE["BACKEND"] != "sqlite":
+        logger.warning("Almacén en memoria: los servidores en ejecución no verán esta revocación")
+
+    revoked = token_manager.revoke_users_sessions(user_ids, reason=reason)
+    for user_id in user_ids:
+        logger.info(f"Usuario {user_id}: {revoked.get(str(user_id), 0)} sesiones revocadas")
+
+    # Persistir el resultado si el almacén es en memoria
+    token_manager.save_snapshot()
+    logger.info(f"Total: {sum(revoked.values())} sesiones revocadas")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revoca todas las sesiones de los usuarios indicados")
+    parser.add_argument('user_ids', nargs='+')
+    parser.add_argument('--reason', default='admin_revocation')
+    args = parser.parse_args()
+    revoke_sessions(args.user_ids, args.reason)
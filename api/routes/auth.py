@@ -1,27 +1,25 @@
 from flask import request, jsonify, Blueprint, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, set_access_cookies, set_refresh_cookies, unset_jwt_cookies
-from helper.Middleware.jwt_manager import jwt_required_custom
-from werkzeug.security import check_password_hash, generate_password_hash
+from helper.Middleware.jwt_manager import jwt_required_custom, get_auth_context
 from datetime import datetime, timedelta
 import random, string, secrets, uuid
-from config import EXPIRE_TOKEN_TIME
+from config import EXPIRE_TOKEN_TIME, JWT_TOKEN_PROFILE
 from helper.database import get_db_cursor, fetch_one_dict_from_result
 from database.procedures import *
 from helper.response_utils import success_response, error_response
 from helper.transaction import db_transaction
 from flask_jwt_extended import get_jwt, verify_jwt_in_request
 from helper.token_manager import token_manager
+from helper.user_profile import user_profiles, PROFILE_FIELDS
+from helper.login_throttle import login_throttle
+from helper.password_hasher import password_hasher, PasswordHashPoolSaturated, hashing_unavailable_response
+import math
 import os
 
 # Función para verificar si hay un token JWT en la solicitud
 def has_jwt():
-    """Verifica si hay un JWT en la solicitud actual"""
-    try:
-        verify_jwt_in_request(optional=True)
-        jwt_data = get_jwt()
-        return jwt_data is not None
-    except Exception:
-        return False
+    """Verifica si hay un JWT en la solicitud actual (sin volver a decodificarlo)"""
+    return get_auth_context().claims is not None
 
 # Obtener las credenciales de Google de las variables de entorno o secrets
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_OAUTH_CLIENT_ID', "759420300435-1978tfdvh2ugducrmcd0crspn25u1a31.apps.googleusercontent.com")
@@ -47,7 +45,7 @@ auth = Blueprint('auth', __name__)
 from helper.Middleware.rate_limiter import rate_limit
 
 @auth.route('/login', methods=['POST'])
-@rate_limit(max_requests=5, per_seconds=60, by_route=True)  # Límite estricto para prevenir ataques de fuerza bruta
+@rate_limit(max_requests=5, per_seconds=60, by_route=True, burst=1)  # Límite estricto para prevenir ataques de fuerza bruta
 def login():
     try:
         # Solo registrar que se recibió una solicitud sin exponer datos
@@ -61,6 +59,11 @@ def login():
         if not email or not password:
             return error_response("Email y contraseña son requeridos", 400)
 
+        # Cuenta con demasiados fallos recientes: rechazar antes de la BD y del hash
+        wait = login_throttle.retry_after(email)
+        if wait > 0:
+            return throttled_login_response(wait)
+
         # Consultar usuario en la base de datos PostgreSQL
         with get_db_cursor(dictionary=True) as cursor:
             # Usar consulta directa en lugar de procedimiento almacenado
@@ -70,6 +73,7 @@ def login():
 
             if not user_data:
                 # Eliminamos log de datos sensibles
+                login_throttle.record_failure(email)
                 return error_response("Credenciales inválidas", 401)
 
             # Verificar la contraseña
@@ -79,7 +83,7 @@ def login():
             try:
                 # Verificar si la contraseña está en un formato de hash reconocido
                 if stored_password and stored_password.startswith(('pbkdf2:', 'scrypt:', 'sha256:')):
-                    is_valid = check_password_hash(stored_password, password)
+                    is_valid = password_hasher.check(stored_password, password)
                 else:
                     # Si no tiene un formato de hash reconocido, considerarla como inválida
                     # y forzar al usuario a usar "olvidé mi contraseña"
@@ -88,19 +92,39 @@ def login():
 
                     # Actualizar a un hash aleatorio para invalidar la contraseña antigua
                     # Esto fuerza al usuario a usar el proceso de recuperación de contraseña
-                    secure_password = generate_password_hash(secrets.token_urlsafe(16))
+                    secure_password = password_hasher.generate(secrets.token_urlsafe(16))
                     update_query = "UPDATE users SET password = %s, updated_at = NOW() WHERE id = %s"
                     cursor.execute(update_query, (secure_password, user_data['id']))
                     cursor.connection.commit()
                     # Eliminamos el log con información sensible
+            except PasswordHashPoolSaturated:
+                # Saturación del servidor: no cuenta como intento fallido
+                return hashing_unavailable_response()
             except Exception as e:
                 # Registramos error sin mostrar detalles sensibles
                 is_valid = False
 
             if not is_valid:
                 # No mostramos detalles sensibles en los logs
+                login_throttle.record_failure(email)
                 return error_response("Credenciales inválidas", 401)
 
+        # Hash con parámetros desfasados: recalcularlo ahora que se conoce la contraseña,
+        # fuera del bloque anterior para no retener la conexión del pool durante el hash
+        new_hash = password_hasher.rehash(stored_password, password)
+        if new_hash:
+            try:
+                with get_db_cursor() as cursor:
+                    # Sólo si nadie ha cambiado la contraseña entretanto
+                    update_query = "UPDATE users SET password = %s, updated_at = NOW() WHERE id = %s AND password = %s"
+                    cursor.execute(update_query, (new_hash, user_data['id'], stored_password))
+                    cursor.connection.commit()
+            except Exception as e:
+                # El login sigue siendo válido; se reintentará en el próximo
+                print(f"No se pudo actualizar el hash de la contraseña: {str(e)}")
+
+        login_throttle.record_success(email)
+
         # Eliminamos log con información del usuario
 
         # Convertir fecha_nacimiento a string si es un objeto date
@@ -133,9 +157,7 @@ def login():
         # Crear token de refresco con la misma session_id
         refresh_token = create_refresh_token(
             identity=user_id_str,
-            additional_claims={
-                'session_id': session_id  # Incluir session_id en el token de refresco
-            },
+            additional_claims=token_manager.session_claims(user_id_str, session_id),  # Incluir session_id en el token de refresco
             expires_delta=timedelta(days=EXPIRE_TOKEN_TIME["REFRESH_TOKEN_DAYS"])
         )
 
@@ -176,57 +198,49 @@ def refresh():
     try:
         current_user = get_jwt_identity()
 
-        # Obtener datos del usuario desde la base de datos para incluir en el token
-        with get_db_cursor(dictionary=True) as cursor:
-            query = "SELECT id, nombre, apellido, email, fecha_nacimiento FROM users WHERE id = %s"
-            cursor.execute(query, (current_user,))
-            user_data = fetch_one_dict_from_result(cursor)
-
-            if not user_data:
-                return error_response("Usuario no encontrado", 404)
-
-            # Convertir fecha_nacimiento a string si es un objeto date
-            if isinstance(user_data.get('fecha_nacimiento'), datetime):
-                user_data['fecha_nacimiento'] = user_data['fecha_nacimiento'].strftime('%Y-%m-%d')
+        # Perfil del usuario (caché de perfiles o base de datos) para incluir en el token
+        user_data = user_profiles.get(current_user)
+        if not user_data:
+            return error_response("Usuario no encontrado", 404)
 
-            # Obtener session_id del token de refresco
-            jwt_data = get_jwt()
-            current_session_id = jwt_data.get('session_id')
+        # Obtener session_id del token de refresco
+        jwt_data = get_jwt()
+        current_session_id = jwt_data.get('session_id')
 
-            if not current_session_id:
-                # Si no hay session_id, generamos uno nuevo
-                current_session_id = token_manager.generate_session_id()
-                print(f"Refresh sin session_id, generando nuevo: {current_session_id}")
+        if not current_session_id:
+            # Si no hay session_id, generamos uno nuevo
+            current_session_id = token_manager.generate_session_id()
+            print(f"Refresh sin session_id, generando nuevo: {current_session_id}")
 
-            # Usar el mismo session_id para mantener la sesión
-            new_access_token, _ = build_token(
-                user_id=user_data['id'],
-                additional_claims={
-                    'email': user_data.get('email'),
-                    'nombre': user_data.get('nombre'),
-                    'apellido': user_data.get('apellido'),
-                    'fecha_nacimiento': user_data.get('fecha_nacimiento')                    
-                },
-                session_id=current_session_id
-            )
+        # Usar el mismo session_id para mantener la sesión
+        new_access_token, _ = build_token(
+            user_id=user_data['id'],
+            additional_claims={
+                'email': user_data.get('email'),
+                'nombre': user_data.get('nombre'),
+                'apellido': user_data.get('apellido'),
+                'fecha_nacimiento': user_data.get('fecha_nacimiento')                    
+            },
+            session_id=current_session_id
+        )
 
-            # Token se envía solo como cookie, no en JSON
-            response_data = {
-                'refreshed': True,
-                'session_id': current_session_id
-            }
+        # Token se envía solo como cookie, no en JSON
+        response_data = {
+            'refreshed': True,
+            'session_id': current_session_id
+        }
 
-            new_exp_time = datetime.now() + timedelta(minutes=EXPIRE_TOKEN_TIME["ACCESS_TOKEN_MINUTES"])
-            print(f"Nuevo access token expira a las: {new_exp_time.strftime('%H:%M:%S')}")
-            print(f"Session ID mantenido: {current_session_id}")
+        new_exp_time = datetime.now() + timedelta(minutes=EXPIRE_TOKEN_TIME["ACCESS_TOKEN_MINUTES"])
+        print(f"Nuevo access token expira a las: {new_exp_time.strftime('%H:%M:%S')}")
+        print(f"Session ID mantenido: {current_session_id}")
 
-            # FIX: Generar respuesta con cookies seguras
-            resp = success_response(data=response_data)
+        # FIX: Generar respuesta con cookies seguras
+        resp = success_response(data=response_data)
 
-            # Establecer la cookie de acceso renovada
-            set_access_cookies(resp, new_access_token)
+        # Establecer la cookie de acceso renovada
+        set_access_cookies(resp, new_access_token)
 
-            return resp
+        return resp
 
     except Exception as e:
         print(f"Error al refrescar el token: {str(e)}")
@@ -281,7 +295,7 @@ def google_auth():
 
                 # Generar una contraseña aleatoria segura para usuarios de Google
                 temp_password = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
-                hashed_password = generate_password_hash(temp_password)
+                hashed_password = password_hasher.generate(temp_password)
 
                 # Insertar el nuevo usuario (adaptado para MySQL)
                 # Query adaptada para MySQL (sin RETURNING)
@@ -337,9 +351,7 @@ def google_auth():
         # Crear token de refresco con la misma session_id
         refresh_token = create_refresh_token(
             identity=user_data['id'],
-            additional_claims={
-                'session_id': session_id  # Incluir session_id en el token de refresco
-            },
+            additional_claims=token_manager.session_claims(str(user_data['id']), session_id),  # Incluir session_id en el token de refresco
             expires_delta=timedelta(days=EXPIRE_TOKEN_TIME["REFRESH_TOKEN_DAYS"])
         )
 
@@ -371,6 +383,8 @@ def google_auth():
 
         return resp
 
+    except PasswordHashPoolSaturated:
+        return hashing_unavailable_response()
     except Exception as e:
         print(f"Error en la autenticación con Google: {str(e)}")
         return error_response(f"Error en la autenticación con Google: {str(e)}")
@@ -461,33 +475,24 @@ def validate_token():
     try:
         # Intentar obtener JWT del request
         try:
-            jwt_data = get_jwt() if has_jwt() else None
-            if jwt_data:
-                user_id = jwt_data.get('sub')
-                session_id = jwt_data.get('session_id')
+            auth_context = get_auth_context()
+            if auth_context.claims:
+                user_id = auth_context.user_id
+                session_id = auth_context.session_id
                 print(f"JWT encontrado: user_id={user_id}, session_id={session_id}")
                 
                 if user_id and session_id:
-                    # Verificar si la sesión es válida
-                    if token_manager.validate_session(str(user_id), session_id):
-                        # Buscar datos del usuario en la base de datos
+                    # Sesión ya validada al decodificar el token en esta solicitud
+                    if auth_context.session_valid:
+                        # Datos del usuario desde la caché de perfiles (o la base de datos en un fallo)
                         try:
-                            with get_db_cursor(dictionary=True) as cursor:
-                                query = "SELECT id, nombre, apellido, email, fecha_nacimiento FROM users WHERE id = %s"
-                                cursor.execute(query, (user_id,))
-                                user = fetch_one_dict_from_result(cursor)
-                                
-                                if user:
-                                    # Formatear fecha de nacimiento si existe
-                                    if 'fecha_nacimiento' in user and user['fecha_nacimiento']:
-                                        if isinstance(user['fecha_nacimiento'], datetime):
-                                            user['fecha_nacimiento'] = user['fecha_nacimiento'].strftime('%Y-%m-%d')
-                                    
-                                    return success_response(data={
-                                        'valid': True,
-                                        'user': user,
-                                        'session_id': session_id
-                                    })
+                            user = user_profiles.get(user_id)
+                            if user:
+                                return success_response(data={
+                                    'valid': True,
+                                    'user': user,
+                                    'session_id': session_id
+                                })
                         except Exception as db_error:
                             print(f"Error al buscar usuario en BD: {str(db_error)}")
                             # Si hay error de BD pero estamos autenticados, seguimos con usuario genérico
@@ -529,9 +534,7 @@ def validate_token():
             # Crear token de refresco con la misma session_id
             refresh_token = create_refresh_token(
                 identity='1001',
-                additional_claims={
-                    'session_id': session_id
-                },
+                additional_claims=token_manager.session_claims('1001', session_id),
                 expires_delta=timedelta(days=EXPIRE_TOKEN_TIME["REFRESH_TOKEN_DAYS"])
             )
             
@@ -566,21 +569,33 @@ def validate_token():
         print(f"Error general en validate_token: {str(e)}")
         return error_response("Error en validación de token", 401)
 
+def throttled_login_response(wait):
+    """Respuesta 429 para una cuenta con demasiados intentos fallidos"""
+    retry_after = max(1, math.ceil(wait))
+    resp = error_response(
+        f"Demasiados intentos fallidos para esta cuenta. Inténtelo de nuevo en {retry_after} segundos.",
+        429
+    )
+    resp.headers['Retry-After'] = str(retry_after)
+    return resp
+
 def build_token(user_id, additional_claims=None, expires_delta=None, session_id=None):
     """
     Construye un token JWT con claims adicionales y registra la sesión asociada
 
     Args:
         user_id: ID del usuario (se convierte a string)
-        additional_claims: Diccionario de claims adicionales
+        additional_claims: Diccionario de claims adicionales (con el perfil
+            compacto no van en el token: si traen el perfil completo se
+            guardan en la caché de perfiles)
         expires_delta: Tiempo de expiración personalizado (si es None, se usa el predeterminado)
         session_id: ID de sesión único (si es None, se genera uno nuevo)
 
     Returns:
         Tupla con token JWT firmado y session_id
     """
-    # Convertir ID a string para consistencia
-    user_id = str(user_id)
+    # Convertir ID a string para consistencia (el perfil conserva el ID original)
+    profile_id, user_id = user_id, str(user_id)
 
     # Generar session_id si no se proporciona
     if not session_id:
@@ -594,14 +609,16 @@ def build_token(user_id, additional_claims=None, expires_delta=None, session_id=
     if expires_delta is None:
         expires_delta = timedelta(minutes=EXPIRE_TOKEN_TIME["ACCESS_TOKEN_MINUTES"])
 
-    # Claims base
-    claims = {
-        'session_id': session_id  # Agregar session_id para identificar la sesión
-    }
+    # Claims base: session_id para identificar la sesión (y su época en modo epoch)
+    claims = token_manager.session_claims(user_id, session_id)
 
     # Agregar claims adicionales
     if additional_claims:
-        claims.update(additional_claims)
+        if JWT_TOKEN_PROFILE["MODE"] == "compact":
+            if all(field in additional_claims for field in PROFILE_FIELDS):
+                user_profiles.put(user_id, dict(additional_claims, id=profile_id))
+        else:
+            claims.update(additional_claims)
 
     # Crear token con identidad y claims
     token = create_access_token(
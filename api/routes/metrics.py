@@ -0,0 +1,69 @@
+"""
+Módulo para la ingesta de métricas de pacientes
+"""
+import math
+
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required
+from config import METRIC_INGEST
+from helper.alerts import alert_engine
+from helper.anomaly import anomaly_detector
+from helper.metric_ingest import metric_buffer, validate_readings, DURABILITY_MODES, MetricBufferFull
+from routes.patients import load_mock_data
+
+# Crear Blueprint para métricas
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics/batch', methods=['POST'])
+@jwt_required()
+def ingest_metrics_batch():
+    """
+    Recibe un lote de lecturas de métricas de uno o varios pacientes
+
+    Cuerpo esperado:
+        {
+            "readings": [{"patientId": 1, "key": "glucose", "value": 132, "timestamp": "..."}],
+            "durability": "buffered" | "wal" | "sync"  (opcional)
+        }
+    """
+    data = request.get_json(silent=True)
+
+    if not data or not isinstance(data.get('readings'), list):
+        return jsonify({"success": False, "msg": "Se requiere una lista de lecturas"}), 400
+
+    readings = data['readings']
+    if len(readings) > METRIC_INGEST["MAX_READINGS_PER_REQUEST"]:
+        return jsonify({
+            "success": False,
+            "msg": f"Máximo {METRIC_INGEST['MAX_READINGS_PER_REQUEST']} lecturas por solicitud"
+        }), 413
+
+    durability = data.get('durability')
+    if durability is not None and durability not in DURABILITY_MODES:
+        return jsonify({"success": False, "msg": "Modo de durabilidad inválido"}), 400
+
+    # Validar todo el lote contra el conjunto de pacientes de una sola vez
+    patient_ids = {p['id'] for p in load_mock_data()}
+    valid, errors = validate_readings(readings, patient_ids)
+
+    try:
+        accepted = metric_buffer.add(valid, durability=durability)
+    except MetricBufferFull as e:
+        response = jsonify({"success": False, "msg": str(e), "rejected": errors})
+        response.headers['Retry-After'] = str(max(1, math.ceil(METRIC_INGEST["FLUSH_INTERVAL_SECONDS"])))
+        return response, 503
+    except IOError as e:
+        return jsonify({"success": False, "msg": str(e), "rejected": errors}), 503
+    except ValueError as e:
+        return jsonify({"success": False, "msg": f"Lecturas inválidas: {str(e)}", "rejected": errors}), 400
+
+    # Actualizar las líneas base y evaluar reglas de alerta con el lote aceptado
+    anomalies = anomaly_detector.observe_many(valid)
+    alerts = alert_engine.evaluate(valid, anomalies)
+
+    return jsonify({
+        "success": True,
+        "accepted": accepted,
+        "rejected": errors,
+        "alerts": len(alerts)
+    }), 202
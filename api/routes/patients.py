@@ -7,6 +7,10 @@ import json
 import os
 from datetime import datetime, timedelta
 import random
+from helper.alerts import alert_engine
+from helper.condition_catalog import CONDITIONS_BY_ID, METRICS_BY_KEY
+from helper.latest_values import latest_values
+from helper.timeseries import metric_store, downsample_buckets, downsample_lttb, DEFAULT_POINTS, MAX_POINTS
 
 # Crear Blueprint para pacientes
 patients_bp = Blueprint('patients', __name__)
@@ -296,133 +300,103 @@ def get_patient_conditions(patient_id):
     if not patient:
         return jsonify({"success": False, "msg": "Paciente no encontrado"}), 404
     
-    # Lista de condiciones médicas detalles
-    conditions = [
-        {
-            "id": 1,
-            "name": "Hipertensión",
-            "type": "chronic",
-            "diagnosed_date": (datetime.now() - timedelta(days=random.randint(30, 365))).strftime("%Y-%m-%d"),
-            "metrics": [
-                {
-                    "id": 1,
-                    "key": "systolic",
-                    "name": "Sistólica",
-                    "value": str(random.randint(130, 160)),
-                    "date_recorded": (datetime.now() - timedelta(days=random.randint(1, 7))).strftime("%Y-%m-%d"),
-                    "label": "mmHg",
-                    "valueColor": "#EF4444" if random.random() > 0.5 else "#F97316"
-                },
-                {
-                    "id": 2,
-                    "key": "diastolic",
-                    "name": "Diastólica",
-                    "value": str(random.randint(80, 100)),
-                    "date_recorded": (datetime.now() - timedelta(days=random.randint(1, 7))).strftime("%Y-%m-%d"),
-                    "label": "mmHg",
-                    "valueColor": "#F97316" if random.random() > 0.5 else None
-                }
-            ],
-            "icon": "heart-pulse",
-            "color": "#EF4444",
-            "lastUpdated": (datetime.now() - timedelta(days=random.randint(1, 10))).isoformat()
-        },
-        {
-            "id": 2,
-            "name": "Diabetes Tipo 2",
-            "type": "chronic",
-            "diagnosed_date": (datetime.now() - timedelta(days=random.randint(30, 365))).strftime("%Y-%m-%d"),
-            "metrics": [
-                {
-                    "id": 4,
-                    "key": "glucose",
-                    "name": "Glucosa",
-                    "value": str(random.randint(120, 180)),
-                    "date_recorded": (datetime.now() - timedelta(days=random.randint(1, 7))).strftime("%Y-%m-%d"),
-                    "label": "mg/dL",
-                    "valueColor": "#F97316" if random.random() > 0.5 else None
-                },
-                {
-                    "id": 5,
-                    "key": "hba1c",
-                    "name": "HbA1c",
-                    "value": str(round(random.uniform(6.5, 8.0), 1)),
-                    "date_recorded": (datetime.now() - timedelta(days=random.randint(1, 30))).strftime("%Y-%m-%d"),
-                    "label": "%",
-                    "valueColor": "#F97316" if random.random() > 0.5 else None
-                }
-            ],
-            "icon": "droplet",
-            "color": "#3B82F6",
-            "lastUpdated": (datetime.now() - timedelta(days=random.randint(1, 10))).isoformat()
-        },
-        {
-            "id": 3,
-            "name": "Asma",
-            "type": "chronic",
-            "diagnosed_date": (datetime.now() - timedelta(days=random.randint(30, 365))).strftime("%Y-%m-%d"),
-            "metrics": [
-                {
-                    "id": 7,
-                    "key": "peak_flow",
-                    "name": "Flujo máximo",
-                    "value": str(random.randint(350, 450)),
-                    "date_recorded": (datetime.now() - timedelta(days=random.randint(1, 7))).strftime("%Y-%m-%d"),
-                    "label": "L/min",
-                    "valueColor": None
-                }
-            ],
-            "icon": "lungs",
-            "color": "#22C55E",
-            "lastUpdated": (datetime.now() - timedelta(days=random.randint(1, 10))).isoformat()
-        },
-        {
-            "id": 4,
-            "name": "Artritis",
-            "type": "chronic",
-            "diagnosed_date": (datetime.now() - timedelta(days=random.randint(30, 365))).strftime("%Y-%m-%d"),
-            "metrics": [
-                {
-                    "id": 9,
-                    "key": "pain_level",
-                    "name": "Nivel de dolor",
-                    "value": str(random.randint(3, 8)),
-                    "date_recorded": (datetime.now() - timedelta(days=random.randint(1, 7))).strftime("%Y-%m-%d"),
-                    "label": "/10",
-                    "valueColor": "#F97316" if random.random() > 0.5 else None
-                }
-            ],
-            "icon": "activity",
-            "color": "#EC4899",
-            "lastUpdated": (datetime.now() - timedelta(days=random.randint(1, 10))).isoformat()
-        },
-        {
-            "id": 5,
-            "name": "Hipotiroidismo",
-            "type": "chronic",
-            "diagnosed_date": (datetime.now() - timedelta(days=random.randint(30, 365))).strftime("%Y-%m-%d"),
-            "metrics": [
-                {
-                    "id": 11,
-                    "key": "tsh",
-                    "name": "TSH",
-                    "value": str(round(random.uniform(3.5, 6.0), 2)),
-                    "date_recorded": (datetime.now() - timedelta(days=random.randint(1, 30))).strftime("%Y-%m-%d"),
-                    "label": "mIU/L",
-                    "valueColor": "#F97316" if random.random() > 0.5 else None
-                }
-            ],
-            "icon": "activity",
-            "color": "#A855F7",
-            "lastUpdated": (datetime.now() - timedelta(days=random.randint(1, 10))).isoformat()
-        }
-    ]
-    
-    # Filtrar condiciones que tiene el paciente
-    patient_condition_ids = [c['id'] for c in patient.get('conditions', [])]
-    filtered_conditions = [c for c in conditions if c['id'] in patient_condition_ids]
-    
-    return jsonify(filtered_conditions)
+    # Construir las tarjetas a partir del catálogo estático y la tabla de últimos valores
+    result = []
+    for patient_condition in patient.get('conditions', []):
+        condition = CONDITIONS_BY_ID.get(patient_condition['id'])
+        if not condition:
+            continue
+
+        latest = latest_values.get(patient_id, condition['id'])
+        metrics = []
+        last_timestamp = None
+        for metric in condition['metrics']:
+            entry = latest.get(metric['key'])
+            # Sin lecturas no hay valor ni fecha que mostrar: el cliente espera ambos
+            if entry is None:
+                continue
+            if last_timestamp is None or entry.timestamp > last_timestamp:
+                last_timestamp = entry.timestamp
+            metrics.append({
+                "id": metric['id'],
+                "key": metric['key'],
+                "name": metric['name'],
+                "value": entry.value_text,
+                "date_recorded": entry.date_recorded,
+                "label": metric['label'],
+                "valueColor": entry.value_color
+            })
+
+        result.append({
+            "id": condition['id'],
+            "name": condition['name'],
+            "type": condition['type'],
+            "diagnosed_date": patient_condition.get('diagnosed_date'),
+            "metrics": metrics,
+            "icon": condition['icon'],
+            "color": condition['color'],
+            "lastUpdated": datetime.fromtimestamp(last_timestamp).isoformat() if last_timestamp else patient_condition.get('lastUpdated')
+        })
+
+    return jsonify(result)
+
+def parse_time_param(value):
+    """Convierte un parámetro de tiempo (epoch en segundos o ISO-8601) a segundos epoch"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@patients_bp.route('/patients/<int:patient_id>/metrics/<key>', methods=['GET'])
+@jwt_required(optional=True)
+def get_patient_metric_history(patient_id, key):
+    """
+    Obtiene el historial de una métrica de un paciente
+
+    Parámetros de consulta:
+        from, to: Rango de tiempo (epoch en segundos o ISO-8601)
+        points: Número máximo de puntos a devolver
+        mode: 'buckets' (min/max/avg) o 'lttb'
+    """
+    metric = METRICS_BY_KEY.get(key)
+    if not metric:
+        return jsonify({"success": False, "msg": "Métrica no encontrada"}), 404
+
+    patients = load_mock_data()
+    if not any(p['id'] == patient_id for p in patients):
+        return jsonify({"success": False, "msg": "Paciente no encontrado"}), 404
+
+    try:
+        start = parse_time_param(request.args.get('from'))
+        end = parse_time_param(request.args.get('to'))
+    except ValueError:
+        return jsonify({"success": False, "msg": "Rango de tiempo inválido"}), 400
+
+    points = request.args.get('points', DEFAULT_POINTS, type=int)
+    points = max(2, min(points, MAX_POINTS))
+
+    mode = request.args.get('mode', 'buckets')
+    if mode not in ('buckets', 'lttb'):
+        return jsonify({"success": False, "msg": "Modo de reducción inválido"}), 400
+
+    timestamps, values = metric_store.query(patient_id, key, start, end)
+
+    if mode == 'lttb':
+        data = downsample_lttb(timestamps, values, points)
+    else:
+        data = downsample_buckets(timestamps, values, points)
+
+    return jsonify({
+        "patientId": patient_id,
+        "key": key,
+        "name": metric['name'],
+        "label": metric['label'],
+        "mode": mode,
+        "total": len(timestamps),
+        "points": data
+    })
 
 @patients_bp.route('/patients/<int:patient_id>/alerts', methods=['GET'])
 @jwt_required(optional=True)
@@ -434,7 +408,13 @@ def get_patient_alerts(patient_id):
     if not patient:
         return jsonify({"success": False, "msg": "Paciente no encontrado"}), 404
     
-    # Alertas aleatorias basadas en las condiciones del paciente
+    # Alertas generadas por las reglas a partir de lecturas reales; si el
+    # paciente tiene lecturas y todas están en rango no hay ninguna
+    alerts = alert_engine.get_patient_alerts(patient_id)
+    if alerts or latest_values.has_readings(patient_id):
+        return jsonify(alerts)
+    
+    # Sin lecturas: alertas aleatorias basadas en las condiciones del paciente
     alerts = []
     patient_conditions = patient.get('conditions', [])
     
@@ -1,18 +1,19 @@
 from itsdangerous import URLSafeTimedSerializer as Serializer
-from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
-import os
 from flask import Blueprint, current_app, request, render_template
-from flask_mail import Message
 from helper.database import fetch_one_dict_from_result, get_db_connection
 from helper.response_utils import success_response, error_response
+from helper.token_manager import token_manager
+from helper.email_outbox import email_outbox
+from helper.frontend_url import frontend_urls
+from helper.password_hasher import password_hasher, PasswordHashPoolSaturated, hashing_unavailable_response
 
 recover_password = Blueprint('recover', __name__)
 
 from helper.Middleware.rate_limiter import rate_limit
 
 @recover_password.route('/solicitar_recuperacion', methods=['POST'])
-@rate_limit(max_requests=3, per_seconds=60, by_route=True)  # Límite estricto para prevenir spam de solicitudes
+@rate_limit(max_requests=3, per_seconds=60, by_route=True, burst=1)  # Límite estricto para prevenir spam de solicitudes
 def solicitar_recuperacion():
     try:
         data = request.get_json()
@@ -51,48 +52,8 @@ def solicitar_recuperacion():
                 # Confirmar transacción
                 conn.commit()
                 
-                # 4. Crear URL para el frontend
-                # Determinar la URL base más confiable
-                frontend_base_url = request.headers.get('Origin')
-                
-                # Si no hay encabezado Origin, intentar con el Host o usar un dominio configurado
-                if not frontend_base_url or "localhost" in frontend_base_url or "127.0.0.1" in frontend_base_url:
-                    host = request.headers.get('Host')
-                    
-                    # Si el host es localhost o similar, usar el dominio de Replit
-                    if not host or "localhost" in host or "127.0.0.1" in host:
-                        # Intentar obtener el dominio desde variables de entorno Replit
-                        replit_domain = os.environ.get('REPL_SLUG', None)
-                        replit_owner = os.environ.get('REPL_OWNER', None)
-                        
-                        if replit_domain and replit_owner:
-                            frontend_base_url = f"https://{replit_domain}.{replit_owner}.repl.co"
-                        else:
-                            # Si no hay información de Replit, usar una URL configurada o una predeterminada
-                            frontend_base_url = os.environ.get('FRONTEND_URL', 'https://cronapp-healthtech.replit.app')
-                    else:
-                        # Si el host no es localhost, usarlo (probablemente URL real)
-                        protocol = "https"  # En producción, siempre usar HTTPS
-                        frontend_base_url = f"{protocol}://{host}"
-                
-                # Si todo falla, usar un valor predeterminado seguro
-                if not frontend_base_url or frontend_base_url == 'null' or "localhost" in frontend_base_url:
-                    # Obtener la URL del dominio actual de Replit
-                    try:
-                        import subprocess
-                        replit_url = subprocess.check_output("echo $REPL_SLUG.$REPL_OWNER.repl.co", shell=True).decode().strip()
-                        if replit_url and "." in replit_url:
-                            frontend_base_url = f"https://{replit_url}"
-                        else:
-                            # Último recurso: usar una URL codificada
-                            frontend_base_url = 'https://cronapp-healthtech.replit.app'
-                    except:
-                        frontend_base_url = 'https://cronapp-healthtech.replit.app'
-                    
-                # Asegurarse de que no haya barra final en la URL base
-                if frontend_base_url.endswith('/'):
-                    frontend_base_url = frontend_base_url[:-1]
-                    
+                # 4. Crear URL para el frontend (Origin sólo si está permitido)
+                frontend_base_url = frontend_urls.for_request()
                 reset_url = f"{frontend_base_url}/reset-password/{token}"
                 
                 # Registrar la URL para debug
@@ -102,9 +63,8 @@ def solicitar_recuperacion():
                 current_app.logger.info(f"URL de recuperación generada: {reset_url}")
                 
                 try:
-                    # Intentar enviar el correo electrónico
-                    from flask_mail import Message
-                    msg = Message(
+                    # Encolar el correo: el envío ocurre en segundo plano
+                    message_id = email_outbox.enqueue(
                         subject="Restablecimiento de contraseña - CRONAPP",
                         recipients=[email],
                         body=f"""
@@ -148,17 +108,10 @@ Equipo CRONAPP
                         </div>
                         """
                     )
-                    
-                    # Obtener la extensión de correo
-                    mail = current_app.extensions.get('mail')
-                    if mail:
-                        mail.send(msg)
-                        current_app.logger.info(f"Correo de recuperación enviado a: {email}")
-                    else:
-                        current_app.logger.warning("Flask-Mail no está configurado correctamente.")
+                    current_app.logger.info(f"Correo de recuperación encolado para {email} (mensaje {message_id})")
                         
                 except Exception as email_error:
-                    current_app.logger.warning(f"No se pudo enviar el correo: {str(email_error)}")
+                    current_app.logger.warning(f"No se pudo encolar el correo: {str(email_error)}")
                 
                 # 6. Devolver URL y token para que el frontend pueda mostrar directamente el enlace
                 return success_response(
@@ -248,7 +201,7 @@ def resetear_password(token):
                     return error_response("Token inválido", 400)
                 
                 # 4. Actualizar la contraseña
-                hashed_password = generate_password_hash(new_password)
+                hashed_password = password_hasher.generate(new_password)
                 update_query = "UPDATE users SET password = %s, updated_at = NOW() WHERE id = %s"
                 cursor.execute(update_query, (hashed_password, token_data['user_id']))
                 current_app.logger.info(f"Contraseña actualizada para usuario: {token_data['user_id']}")
@@ -261,6 +214,10 @@ def resetear_password(token):
                 # Confirmar transacción
                 conn.commit()
                 
+                # 6. Cerrar todas las sesiones abiertas con la contraseña anterior
+                revoked = token_manager.revoke_all_sessions(str(token_data['user_id']), reason="password_reset")
+                current_app.logger.info(f"Sesiones revocadas tras restablecer contraseña: {revoked}")
+                
                 return success_response("Contraseña actualizada exitosamente")
                 
             except Exception as db_error:
@@ -269,6 +226,8 @@ def resetear_password(token):
                 current_app.logger.error(f"Error en DB: {str(db_error)}")
                 raise db_error
                 
+    except PasswordHashPoolSaturated:
+        return hashing_unavailable_response()
     except Exception as e:
         current_app.logger.error(f"Error en resetear_password: {str(e)}", exc_info=True)
         return error_response(f"Error al restablecer contraseña: {str(e)}", 500)
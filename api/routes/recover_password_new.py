@@ -8,6 +8,8 @@ from flask import Blueprint, app, current_app, render_template, request, url_for
 from helper.database import fetch_one_dict_from_result, get_db_cursor
 
 from helper.response_utils import success_response, error_response
+from helper.token_manager import token_manager
+from helper.frontend_url import frontend_urls
 
 
 
@@ -62,7 +64,7 @@ def solicitar_recuperacion():
                     cursor.connection.commit()
                 
                 # 4. Crear URL para el frontend
-                frontend_base_url = request.headers.get('Origin', 'http://localhost:5000')
+                frontend_base_url = frontend_urls.for_request()
                 reset_url = f"{frontend_base_url}/reset-password/{token}"
                 
                 # 5. Preparar para enviar por correo (aunque en entorno de desarrollo lo mostraremos directamente)
@@ -179,6 +181,10 @@ def resetear_password(token):
                 else:
                     current_app.logger.warning("No se pudo confirmar transacción - método no encontrado")
                 
+                # 6. Cerrar todas las sesiones abiertas con la contraseña anterior
+                revoked = token_manager.revoke_all_sessions(str(token_data['id_usuario']), reason="password_reset")
+                current_app.logger.info(f"Sesiones revocadas tras restablecer contraseña: {revoked}")
+                
                 return success_response("Contraseña actualizada exitosamente")
                 
             except Exception as db_error:
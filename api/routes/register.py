@@ -1,17 +1,17 @@
 # routes/register.py
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash
 from helper.validations import validate_email_format
 from helper.database import get_db_cursor, fetch_one_dict_from_result
 from helper.response_utils import success_response, error_response
 from helper.transaction import db_transaction
+from helper.password_hasher import password_hasher, PasswordHashPoolSaturated, hashing_unavailable_response
 
 register = Blueprint('register', __name__)
 
 from helper.Middleware.rate_limiter import rate_limit
 
 @register.route('/', methods=['POST'])
-@rate_limit(max_requests=5, per_seconds=300, by_route=True)  # Límite para prevenir ataques de registro masivo
+@rate_limit(max_requests=5, per_seconds=300, by_route=True, burst=1)  # Límite para prevenir ataques de registro masivo
 def register_usuario():
     try:
         data = request.get_json()
@@ -42,7 +42,7 @@ def register_usuario():
             return error_response("La contraseña debe incluir mayúsculas, minúsculas, números y símbolos", 400)
 
         # Hash de la contraseña
-        hashed_password = generate_password_hash(data['password'])
+        hashed_password = password_hasher.generate(data['password'])
 
         with get_db_cursor(dictionary=True) as cursor, db_transaction(cursor):
             # Verificar si el email ya existe
@@ -86,6 +86,8 @@ def register_usuario():
                 msg="Usuario registrado exitosamente"
             )
 
+    except PasswordHashPoolSaturated:
+        return hashing_unavailable_response()
     except Exception as e:
         print(f"Error en register_usuario: {str(e)}")
         return error_response(f"Error al registrar: {str(e)}", 500)
\ No newline at end of file
@@ -2,6 +2,7 @@
 from flask import Blueprint, request, current_app
 from helper.database import get_db_cursor
 from helper.response_utils import success_response, error_response
+from helper.user_profile import user_profiles
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 
@@ -143,6 +144,9 @@ def update_settings():
                     'fecha_nacimiento': fecha_nacimiento
                 }
                 
+                # El perfil cacheado (y con él /api/auth/validate) refleja el cambio de inmediato
+                user_profiles.put(user_id, result)
+
                 current_app.logger.info(f"Usuario actualizado con éxito: {result}")
                 return success_response(result)
                 
@@ -0,0 +1,7 @@
+# Pruebas de la API
+#
+# Uso: python -m pytest -q tests (desde el directorio api)
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
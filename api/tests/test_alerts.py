@@ -0,0 +1,113 @@
+# Persistencia del estado del motor de alertas entre procesos
+#
+# Cada proceso hijo crea su propio AlertEngine sobre el mismo STATE_PATH, como
+# los dos procesos que levanta el reloader de Flask.
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+API_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+CHILD_PRELUDE = '''
+import json, os, sys, time
+sys.path.insert(0, {api_dir!r})
+from helper.alerts import AlertEngine
+
+def make_engine(**options):
+    return AlertEngine(state_path={state_path!r}, persist_interval=3600, **options)
+
+def report(**values):
+    print(json.dumps(values), flush=True)
+'''
+
+
+def start_child(tmp_path, state_path, body, **options):
+    source = CHILD_PRELUDE.format(api_dir=API_DIR, state_path=state_path) + textwrap.dedent(body)
+    # El motor compartido del módulo usa su propio archivo, fuera del de la prueba
+    env = {**os.environ, 'ALERTS_STATE_PATH': os.path.join(tmp_path, 'shared', 'alert_state.json')}
+    return subprocess.Popen([sys.executable, '-c', source], env=env, text=True,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, **options)
+
+
+def run_child(tmp_path, state_path, body):
+    child = start_child(tmp_path, state_path, body)
+    output, _ = child.communicate(timeout=60)
+    assert child.returncode == 0
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def saved_state(state_path):
+    with open(state_path, 'r', encoding='utf-8') as file:
+        snapshot = json.load(file)
+    return snapshot["next_id"], sorted(rule_id for _, rule_id, _ in snapshot["alerts"])
+
+
+def test_alerts_are_persisted_at_exit(tmp_path):
+    state_path = os.path.join(str(tmp_path), 'alert_state.json')
+    # Sin llamar a persist(): el volcado de atexit guarda la alerta
+    run_child(str(tmp_path), state_path, '''
+        engine = make_engine()
+        alert = engine.raise_alert(1, 'glucosa_alta', 'warning', "Glucosa alta", time.time())
+        report(id=alert["id"])
+    ''')
+    assert saved_state(state_path) == (2, ['glucosa_alta'])
+
+
+def test_idle_process_does_not_overwrite_live_state(tmp_path):
+    state_path = os.path.join(str(tmp_path), 'alert_state.json')
+    run_child(str(tmp_path), state_path, '''
+        engine = make_engine()
+        engine.raise_alert(1, 'glucosa_alta', 'warning', "Glucosa alta", time.time())
+        report(ok=True)
+    ''')
+
+    # Proceso que sólo carga el estado; su limpieza cierra la alerta cargada
+    idle = start_child(str(tmp_path), state_path, '''
+        engine = make_engine(auto_close_seconds=0)
+        report(loaded=len(engine.get_patient_alerts(1)))
+        sys.stdin.readline()
+        engine.persist()
+        report(persisted=True)
+    ''')
+    assert json.loads(idle.stdout.readline()) == {"loaded": 1}
+
+    # Mientras tanto el proceso que atiende solicitudes abre otra alerta
+    writer = run_child(str(tmp_path), state_path, '''
+        engine = make_engine()
+        alert = engine.raise_alert(2, 'presion_arterial_elevada', 'critical', "Presión alta", time.time())
+        engine.persist()
+        report(id=alert["id"])
+    ''')
+    assert writer == {"id": 2}
+
+    output, _ = idle.communicate('\n', timeout=60)
+    assert idle.returncode == 0
+    assert json.loads(output.strip().splitlines()[-1]) == {"persisted": True}
+    # Ni la alerta nueva se pierde ni next_id retrocede
+    assert saved_state(state_path) == (3, ['glucosa_alta', 'presion_arterial_elevada'])
+
+
+def test_only_one_process_writes_the_state(tmp_path):
+    state_path = os.path.join(str(tmp_path), 'alert_state.json')
+    first = start_child(str(tmp_path), state_path, '''
+        engine = make_engine()
+        engine.raise_alert(1, 'glucosa_alta', 'warning', "Glucosa alta", time.time())
+        engine.persist()
+        report(written=True)
+        sys.stdin.readline()
+        os._exit(0)
+    ''')
+    assert json.loads(first.stdout.readline()) == {"written": True}
+
+    second = run_child(str(tmp_path), state_path, '''
+        engine = make_engine()
+        engine.raise_alert(3, 'tsh_alta', 'warning', "TSH alta", time.time())
+        engine.persist()
+        report(writer=engine._writer_fd is not None)
+        os._exit(0)
+    ''')
+    assert second == {"writer": False}
+    first.communicate('\n', timeout=60)
+    assert saved_state(state_path) == (2, ['glucosa_alta'])
@@ -0,0 +1,101 @@
+# Segmentos del registro de auditoría con varios workers en el mismo directorio
+#
+# Cada proceso hijo crea su propio AuditLog sobre el mismo directorio, como los
+# workers que comparten AUDIT_LOG["DIRECTORY"].
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+API_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+CHILD_PRELUDE = '''
+import json, os, sys
+sys.path.insert(0, {api_dir!r})
+from helper.audit_log import AuditLog
+
+def make_log(**options):
+    options.setdefault('segment_max_bytes', 200)
+    return AuditLog({directory!r}, flush_interval=3600, **options)
+
+def record(log, worker, count):
+    for number in range(count):
+        log.record('session_created', worker, f"{{worker}}-{{number}}")
+        log.flush()
+
+def report(**values):
+    print(json.dumps(values), flush=True)
+'''
+
+
+def start_child(tmp_path, directory, body):
+    source = CHILD_PRELUDE.format(api_dir=API_DIR, directory=directory) + textwrap.dedent(body)
+    # El registro compartido del módulo usa su propio directorio, fuera del de la prueba
+    env = {**os.environ, 'AUDIT_LOG_DIR': os.path.join(tmp_path, 'shared')}
+    return subprocess.Popen([sys.executable, '-c', source], env=env, text=True,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+
+def segment_events(directory):
+    events = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as segment:
+            events[name] = [json.loads(line) for line in segment]
+    return events
+
+
+def test_workers_keep_their_own_segments(tmp_path):
+    directory = os.path.join(str(tmp_path), 'audit')
+    body = '''
+        log = make_log(max_segments=1000)
+        record(log, str(os.getpid()), 10)
+        report(segment=os.path.basename(log._segment_path))
+        sys.stdin.readline()
+    '''
+    workers = [start_child(str(tmp_path), directory, body) for _ in range(2)]
+    for worker in workers:
+        json.loads(worker.stdout.readline())
+    for worker in workers:
+        worker.communicate('\n', timeout=60)
+        assert worker.returncode == 0
+
+    # Ningún segmento mezcla eventos de dos workers y no se pierde ninguno
+    events = segment_events(directory)
+    for name, segment in events.items():
+        pid = name.split('-')[3]
+        assert {event["user_id"] for event in segment} == {pid}
+    assert sum(len(segment) for segment in events.values()) == 20
+
+
+def test_pruning_keeps_segments_open_in_other_workers(tmp_path):
+    directory = os.path.join(str(tmp_path), 'audit')
+    idle = start_child(str(tmp_path), directory, '''
+        log = make_log(max_segments=2, segment_max_bytes=4096)
+        record(log, 'idle', 1)
+        report(segment=os.path.basename(log._segment_path))
+        sys.stdin.readline()
+        record(log, 'idle', 1)
+        report(segment=os.path.basename(log._segment_path))
+    ''')
+    open_segment = json.loads(idle.stdout.readline())["segment"]
+
+    # Otro worker rota muchas veces y poda los segmentos más antiguos
+    busy = start_child(str(tmp_path), directory, '''
+        log = make_log(max_segments=2)
+        record(log, 'busy', 20)
+        report(segments=log.stats["segments"])
+    ''')
+    output, _ = busy.communicate(timeout=60)
+    assert busy.returncode == 0
+    assert json.loads(output)["segments"] > 2
+
+    names = sorted(os.listdir(directory))
+    assert open_segment in names
+    # Sólo sobreviven los más recientes además del que sigue abierto
+    assert len(names) == 3
+
+    output, _ = idle.communicate('\n', timeout=60)
+    assert idle.returncode == 0
+    assert json.loads(output)["segment"] == open_segment
+    assert [event["user_id"] for event in segment_events(directory)[open_segment]] == ['idle', 'idle']
@@ -0,0 +1,208 @@
+# Bandeja de salida de correo contra un servidor SMTP local
+#
+# Los envíos se hacen llamando a send_pending() desde la prueba (sin el hilo de
+# envío) y con un reloj controlado, para comprobar sin esperas reales la entrega,
+# la espera exponencial entre reintentos y que un lease vencido permite a otro
+# worker recoger el mensaje.
+import os
+import socketserver
+import threading
+import time
+import types
+from email.header import decode_header, make_header
+
+import pytest
+
+import helper.email_outbox as email_outbox_module
+from helper.email_outbox import EmailOutbox, SMTPConnection
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Servidor SMTP mínimo que guarda los asuntos recibidos"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.subjects = []
+        # Respuestas a los próximos DATA; cuando se agotan, 250
+        self.replies = []
+        self.lock = threading.Lock()
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        self.reply('220 localhost ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 Fin con <CRLF>.<CRLF>')
+                subject = ''
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b'.\r\n', b''):
+                        break
+                    if data.lower().startswith(b'subject:'):
+                        subject = str(make_header(decode_header(data[8:].decode().strip())))
+                with server.lock:
+                    response = server.replies.pop(0) if server.replies else '250 Aceptado'
+                    if response.startswith('250'):
+                        server.subjects.append(subject)
+                self.reply(response)
+            elif command == 'QUIT':
+                self.reply('221 Adiós')
+                return
+            else:
+                self.reply('502 No implementado')
+
+
+@pytest.fixture
+def smtp_sink():
+    server = SMTPSink()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj de pared controlado por la prueba para el módulo de la bandeja"""
+    now = [time.time()]
+    monkeypatch.setattr(email_outbox_module, 'time', types.SimpleNamespace(
+        time=lambda: now[0], monotonic=time.monotonic, sleep=time.sleep
+    ))
+    return now
+
+
+def make_outbox(tmp_path, smtp_sink, **options):
+    outbox = EmailOutbox(os.path.join(tmp_path, 'outbox.db'), **options)
+    outbox.transport = SMTPConnection('127.0.0.1', smtp_sink.server_address[1], timeout=5)
+    return outbox
+
+
+def row(outbox, message_id):
+    return outbox._conn().execute(
+        "SELECT status, attempts, next_attempt_at, body FROM outbox WHERE id = ?", (message_id,)
+    ).fetchone()
+
+
+def test_enqueue_then_delivery(tmp_path, smtp_sink, clock):
+    outbox = make_outbox(str(tmp_path), smtp_sink)
+    ids = [outbox.enqueue(f"Recuperación {number}", ['paciente@example.com'], "Enlace de recuperación")
+           for number in range(3)]
+
+    assert smtp_sink.subjects == []
+    assert outbox.send_pending() == 3
+    assert smtp_sink.subjects == [f"Recuperación {number}" for number in range(3)]
+    # Entregados, sin contenido guardado y por una sola conexión
+    assert [row(outbox, message_id)[0] for message_id in ids] == ['sent'] * 3
+    assert all(row(outbox, message_id)[3] is None for message_id in ids)
+    assert outbox.metrics()["pending"] == 0
+    assert outbox.transport.connections == 1
+    assert outbox.send_pending() == 0
+    outbox.transport.close()
+
+
+def test_temporary_error_retries_with_backoff(tmp_path, smtp_sink, clock):
+    outbox = make_outbox(str(tmp_path), smtp_sink, retry_base=10.0, retry_max=600.0)
+    smtp_sink.replies = ['451 Inténtelo más tarde', '451 Inténtelo más tarde']
+    start = clock[0]
+    message_id = outbox.enqueue("Recuperación", ['paciente@example.com'], "Enlace de recuperación")
+
+    assert outbox.send_pending() == 1
+    status, attempts, next_attempt_at, _ = row(outbox, message_id)
+    assert (status, attempts) == ('pending', 1)
+    assert next_attempt_at == pytest.approx(start + 10.0)
+
+    # No se reintenta antes de tiempo
+    clock[0] = start + 9.9
+    assert outbox.send_pending() == 0
+
+    # Segundo fallo: la espera se duplica
+    clock[0] = start + 10.0
+    assert outbox.send_pending() == 1
+    status, attempts, next_attempt_at, _ = row(outbox, message_id)
+    assert (status, attempts) == ('pending', 2)
+    assert next_attempt_at == pytest.approx(start + 10.0 + 20.0)
+
+    clock[0] = start + 30.0
+    assert outbox.send_pending() == 1
+    assert row(outbox, message_id)[:2] == ('sent', 3)
+    assert smtp_sink.subjects == ["Recuperación"]
+    assert outbox.stats["retries"] == 2
+    outbox.transport.close()
+
+
+def test_permanent_error_marks_failed(tmp_path, smtp_sink, clock):
+    outbox = make_outbox(str(tmp_path), smtp_sink)
+    smtp_sink.replies = ['554 Rechazado']
+    message_id = outbox.enqueue("Recuperación", ['paciente@example.com'], "Enlace de recuperación")
+
+    assert outbox.send_pending() == 1
+    assert row(outbox, message_id)[:2] == ('failed', 1)
+    clock[0] += 3600
+    assert outbox.send_pending() == 0
+    assert smtp_sink.subjects == []
+    outbox.transport.close()
+
+
+def test_expired_lease_lets_another_worker_deliver(tmp_path, smtp_sink, clock):
+    # Dos workers sobre la misma tabla; el primero reclama el mensaje y muere sin enviarlo
+    first = make_outbox(str(tmp_path), smtp_sink, lease_seconds=60.0)
+    second = make_outbox(str(tmp_path), smtp_sink, lease_seconds=60.0)
+    start = clock[0]
+    message_id = first.enqueue("Recuperación", ['paciente@example.com'], "Enlace de recuperación")
+    assert len(first._claim(start)) == 1
+
+    # Mientras dura el lease nadie más lo envía
+    clock[0] = start + 59.0
+    assert second.send_pending() == 0
+    assert smtp_sink.subjects == []
+
+    clock[0] = start + 60.0
+    assert second.send_pending() == 1
+    assert row(second, message_id)[0] == 'sent'
+    assert smtp_sink.subjects == ["Recuperación"]
+    assert first.send_pending() == 0
+    second.transport.close()
+
+
+def test_slow_batch_does_not_resend_reclaimed_message(tmp_path, smtp_sink, clock):
+    # Cada envío del primer worker tarda 40 s: el lease del lote (60 s) vence a mitad
+    first = make_outbox(str(tmp_path), smtp_sink, lease_seconds=60.0)
+    second = make_outbox(str(tmp_path), smtp_sink, lease_seconds=60.0)
+    start = clock[0]
+    ids = [first.enqueue(f"Recuperación {number}", ['paciente@example.com'], "Enlace de recuperación")
+           for number in range(3)]
+    send = first.transport.send
+    sends = []
+
+    def slow_send(message):
+        send(message)
+        clock[0] += 40.0
+        sends.append(message['Subject'])
+        if len(sends) == 2:
+            # El segundo worker recoge el último mensaje, cuyo lease ya venció
+            assert second.send_pending() == 1
+
+    first.transport.send = slow_send
+    assert first.send_pending() == 3
+    assert clock[0] == start + 80.0
+
+    assert sends == ["Recuperación 0", "Recuperación 1"]
+    assert sorted(smtp_sink.subjects) == [f"Recuperación {number}" for number in range(3)]
+    assert [row(first, message_id)[:2] for message_id in ids] == [('sent', 1)] * 3
+    first.transport.close()
+    second.transport.close()
@@ -0,0 +1,188 @@
+# Buffer de escritura de métricas y registro de escritura ('wal')
+#
+# Las caídas se simulan con procesos hijos que terminan con os._exit (sin el
+# vaciado de atexit); otro proceso hijo arranca después sobre el mismo registro
+# e informa de las lecturas que recupera.
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+from helper.latest_values import LatestValueTable
+from helper.metric_ingest import MetricBufferFull, MetricWriteBuffer
+from helper.timeseries import TimeSeriesStore
+
+API_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+CHILD_PRELUDE = '''
+import json, os, sys, time
+sys.path.insert(0, {api_dir!r})
+from helper.latest_values import LatestValueTable
+from helper.metric_ingest import MetricBufferFull, MetricWriteBuffer
+from helper.timeseries import TimeSeriesStore
+
+class Sink:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.rows = []
+
+    def write(self, readings):
+        if self.fail:
+            raise IOError("base de datos no disponible")
+        self.rows.extend(readings)
+
+def make_buffer(**options):
+    options.setdefault('sink', Sink())
+    return MetricWriteBuffer(batch_size=1000, flush_interval=3600, durability='wal', wal_path={wal_path!r},
+                             store=TimeSeriesStore(), latest=LatestValueTable(), **options)
+
+def reading(number):
+    return (1, 'glucosa', time.time() - 3600 + number, 100.0 + number)
+
+def report(**values):
+    print(json.dumps(values), flush=True)
+'''
+
+
+class Sink:
+    def __init__(self):
+        self.fail = False
+        self.rows = []
+
+    def write(self, readings):
+        if self.fail:
+            raise IOError("base de datos no disponible")
+        self.rows.extend(readings)
+
+
+def child_source(wal_path, body):
+    return CHILD_PRELUDE.format(api_dir=API_DIR, wal_path=wal_path) + textwrap.dedent(body)
+
+
+def child_env(tmp_path):
+    # El buffer compartido del módulo usa su propio registro, fuera del de la prueba
+    return {**os.environ, 'METRIC_INGEST_WAL_PATH': os.path.join(tmp_path, 'shared', 'metric_ingest.wal')}
+
+
+def run_child(tmp_path, wal_path, body):
+    result = subprocess.run([sys.executable, '-c', child_source(wal_path, body)], env=child_env(tmp_path),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def recover(tmp_path, wal_path):
+    """Arranca un proceso nuevo sobre el registro, vacía lo recuperado y sale"""
+    return run_child(tmp_path, wal_path, '''
+        buffer = make_buffer()
+        recovered = sorted(buffer._buffer)
+        buffer.flush()
+        report(recovered=recovered)
+    ''')["recovered"]
+
+
+def wal_files(wal_path):
+    directory, base = os.path.split(wal_path)
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith(base + '.') and not name.endswith('.lock'))
+
+
+def test_idle_process_does_not_touch_another_process_wal(tmp_path):
+    wal_path = os.path.join(str(tmp_path), 'metric_ingest.wal')
+    writer = subprocess.Popen([sys.executable, '-c', child_source(wal_path, '''
+        buffer = make_buffer(sink=Sink(fail=True))
+        buffer.add([reading(0), reading(1)])
+        report(acknowledged=2)
+        sys.stdin.readline()
+        os._exit(0)
+    ''')], env=child_env(str(tmp_path)), stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert json.loads(writer.stdout.readline()) == {"acknowledged": 2}
+
+        # Otro proceso sobre el mismo registro (p. ej. el padre del reloader)
+        # arranca y vacía su buffer vacío mientras el primero sigue vivo
+        idle = run_child(str(tmp_path), wal_path, '''
+            buffer = make_buffer()
+            flushed = buffer.flush()
+            report(recovered=len(buffer._buffer), flushed=flushed)
+        ''')
+        assert idle == {"recovered": 0, "flushed": True}
+        assert wal_files(wal_path) == [f"metric_ingest.wal.{writer.pid}"]
+    finally:
+        # Caída del primero sin vaciar
+        writer.stdin.write('\n')
+        writer.stdin.close()
+        writer.wait(timeout=60)
+
+    assert len(recover(str(tmp_path), wal_path)) == 2
+    assert wal_files(wal_path) == []
+
+
+def test_full_buffer_rejects_instead_of_dropping(tmp_path):
+    sink = Sink()
+    buffer = MetricWriteBuffer(sink=sink, batch_size=1000, flush_interval=3600, max_buffer=2, durability='wal',
+                               wal_path=os.path.join(str(tmp_path), 'metric_ingest.wal'),
+                               store=TimeSeriesStore(), latest=LatestValueTable())
+    now = time.time()
+    readings = [(1, 'glucosa', now - 60 + number, 100.0 + number) for number in range(5)]
+
+    assert buffer.add(readings[:2]) == 2
+    with pytest.raises(MetricBufferFull):
+        buffer.add(readings[2:3])
+
+    # Un vaciado fallido devuelve las lecturas al buffer sin descartar ninguna
+    sink.fail = True
+    assert buffer.flush() is False
+    assert buffer.pending() == 2
+    with pytest.raises(MetricBufferFull):
+        buffer.add(readings[2:])
+    assert buffer.stats["rejected"] == 4
+
+    sink.fail = False
+    assert buffer.flush() is True
+    assert sink.rows == readings[:2]
+    assert buffer.add(readings[2:4]) == 2
+
+
+def test_overflow_after_failed_flush_keeps_acknowledged_readings(tmp_path):
+    wal_path = os.path.join(str(tmp_path), 'metric_ingest.wal')
+    crashed = run_child(str(tmp_path), wal_path, '''
+        buffer = make_buffer(sink=Sink(fail=True), max_buffer=2)
+        acknowledged = []
+        for number in range(5):
+            try:
+                buffer.add([reading(number)])
+                acknowledged.append(number)
+            except MetricBufferFull:
+                pass
+            buffer.flush()
+        report(acknowledged=acknowledged, rejected=buffer.stats["rejected"])
+        sys.stdout.flush()
+        os._exit(0)
+    ''')
+    assert crashed == {"acknowledged": [0, 1], "rejected": 3}
+    assert len(recover(str(tmp_path), wal_path)) == 2
+
+
+def test_crash_replays_only_unflushed_readings(tmp_path):
+    wal_path = os.path.join(str(tmp_path), 'metric_ingest.wal')
+    run_child(str(tmp_path), wal_path, '''
+        sink = Sink()
+        buffer = make_buffer(sink=sink)
+        buffer.add([reading(0), reading(1)])
+        assert buffer.flush() and len(sink.rows) == 2
+        buffer.add([reading(2), reading(3), reading(4)])
+        report(pending=buffer.pending())
+        sys.stdout.flush()
+        os._exit(0)
+    ''')
+
+    recovered = recover(str(tmp_path), wal_path)
+    assert [value for _, _, _, value in recovered] == [102.0, 103.0, 104.0]
+    # Tras vaciar lo recuperado no queda nada que volver a escribir
+    assert wal_files(wal_path) == []
+    assert recover(str(tmp_path), wal_path) == []
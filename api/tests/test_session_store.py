@@ -0,0 +1,109 @@
+# Concurrencia de los almacenes de sesiones
+#
+# Varios hilos registran, validan y revocan sesiones de un grupo pequeño de
+# usuarios a la vez (contra el mismo almacén y, en SQLite, contra dos instancias
+# sobre la misma base, como dos workers). Al terminar, cada sesión registrada
+# debe seguir activa, haber sido desalojada o haber sido revocada, y ninguna
+# sesión revocada puede volver a validar.
+import os
+import random
+import threading
+import time
+import uuid
+
+import pytest
+
+from helper.session_store import MemorySessionStore, SQLiteSessionStore
+
+USERS = [str(user_id) for user_id in range(1, 7)]
+THREADS = 8
+OPERATIONS = 300
+MAX_SESSIONS = 4
+
+
+def memory_stores(tmp_path):
+    store = MemorySessionStore(stripes=4, max_sessions_per_user=MAX_SESSIONS)
+    return [store]
+
+
+def sqlite_stores(tmp_path):
+    path = os.path.join(tmp_path, 'sessions.db')
+    version_path = os.path.join(tmp_path, 'sessions.version')
+    return [SQLiteSessionStore(path, version_path, max_sessions_per_user=MAX_SESSIONS) for _ in range(2)]
+
+
+def is_valid(store, user_id, session_id, now):
+    return store.get_session_expiry(user_id, session_id) is not None and not store.is_denied(session_id, now)
+
+
+def worker(number, stores, results, failures, start):
+    rng = random.Random(number)
+    added, evicted, revoked = [], set(), set()
+    start.wait()
+    try:
+        for _ in range(OPERATIONS):
+            store = rng.choice(stores)
+            user_id = rng.choice(USERS)
+            now = time.time()
+            operation = rng.random()
+
+            if operation < 0.5:
+                session_id = str(uuid.uuid4())
+                evicted.update(store.add_session(user_id, session_id, now + 3600))
+                added.append((user_id, session_id))
+                # Cada alta recorta al tope de forma atómica: ninguna lectura ve más
+                sessions = store.list_sessions(user_id)
+                if len(sessions) > MAX_SESSIONS:
+                    failures.append(f"{user_id} tiene {len(sessions)} sesiones")
+            elif operation < 0.9 and added:
+                # Validar (y cachear) sesiones propias mientras otros hilos revocan
+                user_id, session_id = rng.choice(added)
+                is_valid(store, user_id, session_id, now)
+            else:
+                result = store.revoke_users([user_id], now + 3600)
+                for session_id in result.get(user_id, []):
+                    revoked.add(session_id)
+                    # La revocación se ve en cuanto revoke_users vuelve, en cualquier instancia
+                    for other in stores:
+                        if is_valid(other, user_id, session_id, time.time()):
+                            failures.append(f"sesión revocada {session_id} sigue siendo válida")
+    except Exception as e:  # pragma: no cover - el fallo se informa en el hilo principal
+        failures.append(repr(e))
+    results.append((added, evicted, revoked))
+
+
+@pytest.mark.parametrize("make_stores", [memory_stores, sqlite_stores], ids=["memory", "sqlite"])
+def test_concurrent_register_validate_revoke(tmp_path, make_stores):
+    stores = make_stores(str(tmp_path))
+    results, failures = [], []
+    start = threading.Barrier(THREADS)
+    threads = [threading.Thread(target=worker, args=(number, stores, results, failures, start))
+               for number in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert failures == []
+
+    added = [session for thread_added, _, _ in results for session in thread_added]
+    evicted = set().union(*(thread_evicted for _, thread_evicted, _ in results))
+    revoked = set().union(*(thread_revoked for _, _, thread_revoked in results))
+    store = stores[0]
+    now = time.time()
+
+    for user_id in USERS:
+        assert len(store.list_sessions(user_id)) <= MAX_SESSIONS
+
+    # Ninguna revocación se pierde y ninguna sesión desaparece sin explicación
+    assert not revoked & evicted
+    for user_id, session_id in added:
+        active = session_id in store.list_sessions(user_id)
+        if session_id in revoked:
+            assert not active
+            assert store.is_denied(session_id, now)
+            for other in stores:
+                assert not is_valid(other, user_id, session_id, now)
+        else:
+            assert active or session_id in evicted, f"sesión {session_id} perdida"